@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Benchmark del reranking con grafo: entidades en común vs PageRank personalizado
+
+Para cada query se toman los candidatos de la búsqueda híbrida sin grafo y se
+reordenan con cada método de GraphService.rerank_documents_with_graph:
+- latencia: tiempo del reranking (PageRank en frío = primer uso del conjunto
+  de semillas; en caliente = vector ya memoizado)
+- calidad: búsqueda de un chunk conocido. Cada query se arma con entidades del
+  grafo que menciona un chunk y algunas palabras de su texto; se mide en qué
+  posición queda ese chunk (MRR y hit@k)
+
+Las queries se generan desde los documentos de la BD (no modifica la BD).
+
+Uso:
+    python benchmark_graph_rerank.py
+    python benchmark_graph_rerank.py --queries 100 --candidates 30 -o rerank.json
+    python benchmark_graph_rerank.py --graph grafos/a.json --graph grafos/b.json
+"""
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import statistics
+from pathlib import Path
+from datetime import datetime
+
+# Agregar backend a path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from database.database import SessionLocal, ensure_schema
+from database.models import Document
+from services.rag_service import RAGService
+from services.graph_service import graph_service, RERANK_METHODS
+from services.graph_registry import graph_registry
+from services.entity_annotations import entity_annotations
+from services.text_utils import token_set
+
+
+DEFAULT_GRAPH = Path(__file__).parent.parent / "articles-117137_galeria_02_graph.json"
+
+
+def build_queries(count: int, seed: int = 42, words_per_query: int = 3) -> list:
+    """
+    Queries de búsqueda de un chunk conocido: hasta 2 labels de entidades que
+    el chunk menciona + algunas palabras de su texto
+    """
+    ensure_schema()
+    db = SessionLocal()
+    try:
+        rows = db.query(Document.id, Document.content).order_by(Document.id).all()
+    finally:
+        db.close()
+
+    rng = random.Random(seed)
+    rng.shuffle(rows)
+    queries = []
+    for doc_id, content in rows:
+        entity_ids = graph_service.entity_ids_in_text(content or "")
+        if not entity_ids:
+            continue
+        labels = [graph_service.nodes[node_id]['label'] for node_id in rng.sample(entity_ids, min(2, len(entity_ids)))]
+        words = sorted(word for word in token_set(content) if len(word) > 4)
+        words = rng.sample(words, min(words_per_query, len(words)))
+        queries.append({'target': doc_id, 'query': " ".join(labels + words)})
+        if len(queries) >= count:
+            break
+    return queries
+
+
+def rank_of(results: list, target: int):
+    """Posición (1..n) del chunk buscado, o None si no está entre los candidatos"""
+    for rank, result in enumerate(results, 1):
+        if result.get('id') == target:
+            return rank
+    return None
+
+
+def quality(ranks: list, k: int) -> dict:
+    return {
+        "mrr": round(statistics.fmean(1.0 / r if r else 0.0 for r in ranks), 4),
+        f"hit@{k}": round(statistics.fmean(1.0 if r and r <= k else 0.0 for r in ranks), 4)
+    }
+
+
+def latency(times: list) -> dict:
+    times = sorted(times)
+    return {
+        "ms_median": round(statistics.median(times) * 1000, 4),
+        "ms_p95": round(times[int(0.95 * (len(times) - 1))] * 1000, 4),
+        "ms_total": round(sum(times) * 1000, 2)
+    }
+
+
+def run_benchmark(queries: list, candidates: int, top_k: int, repeat: int) -> dict:
+    """Rerankea los candidatos de cada query con cada método"""
+    baseline_ranks = []
+    ranks = {method: [] for method in RERANK_METHODS}
+    times = {method: [] for method in RERANK_METHODS}
+    cold_times = []
+    boosted = {method: 0 for method in RERANK_METHODS}
+    graph_service.pagerank.clear()
+
+    for item in queries:
+        results = RAGService.search_hybrid(item['query'], top_k=candidates, use_graph=False)
+        entity_annotations.attach(results)
+        baseline_ranks.append(rank_of(results, item['target']))
+
+        for method in RERANK_METHODS:
+            for attempt in range(repeat):
+                start = time.perf_counter()
+                reranked = graph_service.rerank_documents_with_graph(item['query'], results,
+                                                                     boost_factor=0.2, method=method)
+                elapsed = time.perf_counter() - start
+                if method == "pagerank" and attempt == 0:
+                    cold_times.append(elapsed)
+                else:
+                    times[method].append(elapsed)
+            ranks[method].append(rank_of(reranked, item['target']))
+            boosted[method] += sum(1 for r in reranked if r.get('graph_boost'))
+
+    total_candidates = max(1, len(queries) * candidates)
+    report = {"baseline": {"quality": quality(baseline_ranks, top_k)}}
+    for method in RERANK_METHODS:
+        report[method] = {
+            "quality": quality(ranks[method], top_k),
+            "latency": latency(times[method]) if times[method] else None,
+            "boosted_fraction": round(boosted[method] / total_candidates, 4)
+        }
+    if cold_times:
+        report["pagerank"]["latency_cold"] = latency(cold_times)
+    report["pagerank"]["cache"] = dict(graph_service.pagerank.stats)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark del reranking con grafo (entidades en común vs PageRank personalizado)"
+    )
+    parser.add_argument(
+        "--graph",
+        action="append",
+        help=f"Grafo JSON o snapshot .npz; repetir para combinar varios (default: {DEFAULT_GRAPH.name})"
+    )
+    parser.add_argument(
+        "--queries",
+        "-n",
+        type=int,
+        default=50,
+        help="Cantidad de queries generadas (default: 50)"
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        default=20,
+        help="Candidatos de la búsqueda híbrida que se rerankean (default: 20)"
+    )
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        default=5,
+        help="k de hit@k (default: 5)"
+    )
+    parser.add_argument(
+        "--repeat",
+        "-r",
+        type=int,
+        default=3,
+        help="Repeticiones del reranking por query y método (default: 3)"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=42,
+        help="Semilla del generador de queries (default: 42)"
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        help="Guardar el reporte JSON en este archivo (además de imprimirlo)"
+    )
+
+    args = parser.parse_args()
+
+    for path in args.graph or [str(DEFAULT_GRAPH)]:
+        if not Path(path).exists():
+            print(f"❌ Error: grafo no encontrado: {path}", file=sys.stderr)
+            sys.exit(1)
+        if not graph_registry.load(path)['success']:
+            sys.exit(1)
+
+    queries = build_queries(args.queries, seed=args.seed)
+    if not queries:
+        print("❌ Error: ningún documento de la BD menciona entidades del grafo", file=sys.stderr)
+        sys.exit(1)
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "graphs": [info['name'] for info in graph_registry.list_graphs()],
+        "nodes": len(graph_service.nodes),
+        "edges": len(graph_service.edges),
+        "queries": len(queries),
+        "candidates": args.candidates,
+        "top_k": args.top_k,
+        "repeat": max(1, args.repeat),
+        "methods": run_benchmark(queries, args.candidates, args.top_k, max(1, args.repeat))
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
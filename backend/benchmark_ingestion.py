@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Benchmark de throughput del ingreso de PDFs
+
+Mide cada etapa de RAGService por separado y el pipeline completo:
+- extraction: PDF → texto (solo con --pdf)
+- chunking: texto → chunks (make_chunks)
+- embedding: chunks → registros (tokens + embeddings)
+- db_write: INSERT + commit en una BD SQLite temporal
+- end_to_end: todas las etapas anteriores seguidas
+
+Reporta chunks/s y MB/s por etapa en JSON, para seguir regresiones en el tiempo.
+
+Uso:
+    python benchmark_ingestion.py --size-mb 2
+    python benchmark_ingestion.py --pdf ../articles-117137_galeria_02.pdf --repeat 3
+    python benchmark_ingestion.py --size-mb 5 --chunk-mode size -o bench.json
+"""
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+from datetime import datetime
+
+# Agregar backend a path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database.database import Base
+from services.rag_service import RAGService
+
+
+# Vocabulario para texto legal sintético
+SUBJECTS = [
+    "El trabajador", "El empleador", "La empresa", "El sindicato",
+    "La Dirección del Trabajo", "El contrato de trabajo", "La trabajadora",
+    "El inspector del trabajo", "La organización sindical", "El aprendiz"
+]
+VERBS = [
+    "tendrá derecho a", "deberá otorgar", "no podrá exceder", "estará obligado a",
+    "podrá solicitar", "deberá registrar", "será responsable de", "podrá pactar"
+]
+OBJECTS = [
+    "un día de descanso a la semana", "la remuneración convenida",
+    "la jornada ordinaria de cuarenta y cinco horas semanales",
+    "el pago de las horas extraordinarias", "un feriado anual de quince días hábiles",
+    "la indemnización por años de servicio", "el fuero maternal",
+    "las cotizaciones previsionales", "el registro de asistencia",
+    "la gratificación legal", "el permiso postnatal parental"
+]
+CLAUSES = [
+    "de conformidad con lo dispuesto en el artículo {ref}",
+    "sin perjuicio de lo establecido en el inciso anterior",
+    "salvo pacto en contrario", "en los términos que señale el reglamento",
+    "dentro del plazo de treinta días", "según lo dispuesto en el artículo {ref} bis"
+]
+ROMAN = ["I", "II", "III", "IV", "V", "VI", "VII", "VIII", "IX", "X"]
+
+
+def generate_legal_text(size_bytes: int, seed: int = 42) -> str:
+    """
+    Genera texto con estructura del Código del Trabajo (Libros, Títulos,
+    Capítulos, artículos, marcas de página) de aproximadamente size_bytes
+    """
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    article = 1
+    page = 1
+
+    while size < size_bytes:
+        if article % 120 == 1:
+            parts.append(f"LIBRO {ROMAN[(article // 120) % len(ROMAN)]}\nDEL CONTRATO INDIVIDUAL")
+        if article % 40 == 1:
+            parts.append(f"TÍTULO {ROMAN[(article // 40) % len(ROMAN)]}\nNormas generales")
+        if article % 10 == 1:
+            parts.append(f"Capítulo {ROMAN[(article // 10) % len(ROMAN)]}")
+
+        sentences = []
+        for _ in range(rng.randint(2, 8)):
+            clause = rng.choice(CLAUSES).format(ref=rng.randint(1, max(article, 2)))
+            sentences.append(f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(OBJECTS)}, {clause}.")
+        suffix = " bis" if rng.random() < 0.05 else ""
+        block = f"Art. {article}°{suffix}. " + "\n".join(sentences)
+        parts.append(block)
+
+        if article % 6 == 0:
+            parts.append(f"--- Página {page} ---")
+            page += 1
+
+        size += len(block.encode("utf-8"))
+        article += 1
+
+    return "\n\n".join(parts)
+
+
+def mb(num_bytes: int) -> float:
+    return num_bytes / (1024 * 1024)
+
+
+def stage_result(times: list, chunks: int, num_bytes: int) -> dict:
+    """Resume las repeticiones de una etapa (mejor tiempo y mediana)"""
+    best = min(times)
+    return {
+        "seconds_best": round(best, 6),
+        "seconds_median": round(statistics.median(times), 6),
+        "chunks": chunks,
+        "mb": round(mb(num_bytes), 4),
+        "chunks_per_sec": round(chunks / best, 2) if best > 0 else None,
+        "mb_per_sec": round(mb(num_bytes) / best, 4) if best > 0 else None
+    }
+
+
+def timed(func, repeat: int):
+    """Ejecuta func `repeat` veces; retorna (último resultado, tiempos)"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return result, times
+
+
+def write_records(records: list, db_path: Path) -> int:
+    """Inserta los registros en una BD SQLite nueva (no toca la BD de la app)"""
+    if db_path.exists():
+        db_path.unlink()
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        saved = RAGService.save_document_records(session, records)
+        session.commit()
+        return saved
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def run_benchmark(text: str = None, pdf_path: str = None, chunk_mode: str = None, repeat: int = 3) -> dict:
+    """Corre todas las etapas y retorna el reporte"""
+    chunk_mode = chunk_mode or RAGService.CHUNK_MODE
+    stages = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.db"
+
+        # Etapa 1: extracción (solo PDF)
+        if pdf_path:
+            text, times = timed(lambda: RAGService.extract_text_from_pdf(pdf_path), repeat)
+            pdf_bytes = Path(pdf_path).stat().st_size
+            stages["extraction"] = stage_result(times, 0, pdf_bytes)
+
+        text_bytes = len(text.encode("utf-8"))
+
+        # Etapa 2: chunking
+        chunks, times = timed(lambda: RAGService.make_chunks(text, chunk_mode), repeat)
+        stages["chunking"] = stage_result(times, len(chunks), text_bytes)
+
+        chunk_bytes = sum(len(c["content"].encode("utf-8")) for c in chunks)
+
+        # Etapa 3: tokens + embeddings
+        records, times = timed(lambda: RAGService.build_document_records(chunks, "benchmark"), repeat)
+        stages["embedding"] = stage_result(times, len(chunks), chunk_bytes)
+
+        # Etapa 4: escritura en BD
+        _, times = timed(lambda: write_records(records, db_path), repeat)
+        stages["db_write"] = stage_result(times, len(records), chunk_bytes)
+
+        # Pipeline completo
+        def end_to_end():
+            source_text = RAGService.extract_text_from_pdf(pdf_path) if pdf_path else text
+            e2e_chunks = RAGService.make_chunks(source_text, chunk_mode)
+            e2e_records = RAGService.build_document_records(e2e_chunks, "benchmark")
+            return write_records(e2e_records, db_path)
+
+        saved, times = timed(end_to_end, repeat)
+        input_bytes = Path(pdf_path).stat().st_size if pdf_path else text_bytes
+        stages["end_to_end"] = stage_result(times, saved, input_bytes)
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "input": {
+            "type": "pdf" if pdf_path else "synthetic",
+            "pdf": str(pdf_path) if pdf_path else None,
+            "text_chars": len(text),
+            "text_mb": round(mb(text_bytes), 4)
+        },
+        "chunk_mode": chunk_mode,
+        "chunk_size": RAGService.CHUNK_SIZE,
+        "chunk_overlap": RAGService.CHUNK_OVERLAP,
+        "repeat": repeat,
+        "stages": stages
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark de throughput del ingreso (extracción, chunking, embeddings, BD)"
+    )
+    parser.add_argument(
+        "--size-mb",
+        type=float,
+        default=1.0,
+        help="Tamaño del texto sintético en MB (default: 1.0)"
+    )
+    parser.add_argument(
+        "--pdf",
+        help="Usar un PDF real en vez de texto sintético (ej: ../articles-117137_galeria_02.pdf)"
+    )
+    parser.add_argument(
+        "--chunk-mode",
+        choices=["articles", "size"],
+        default=None,
+        help=f"Modo de chunking (default: {RAGService.CHUNK_MODE})"
+    )
+    parser.add_argument(
+        "--repeat",
+        "-r",
+        type=int,
+        default=3,
+        help="Repeticiones por etapa; se reporta el mejor tiempo y la mediana (default: 3)"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=42,
+        help="Semilla del generador de texto sintético (default: 42)"
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        help="Guardar el reporte JSON en este archivo (además de imprimirlo)"
+    )
+
+    args = parser.parse_args()
+
+    if args.pdf and not Path(args.pdf).exists():
+        print(f"❌ Error: PDF no encontrado: {args.pdf}", file=sys.stderr)
+        sys.exit(1)
+
+    text = None
+    if not args.pdf:
+        text = generate_legal_text(int(args.size_mb * 1024 * 1024), seed=args.seed)
+
+    report = run_benchmark(text=text, pdf_path=args.pdf, chunk_mode=args.chunk_mode,
+                           repeat=max(1, args.repeat))
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,10 +9,12 @@ Uso:
     python build_knowledge_graph.py documento.pdf --output grafo_custom.json
     python build_knowledge_graph.py documento.pdf --max-chunks 10 --stats
 """
+import os
 import sys
 import json
 import re
 import time
+import asyncio
 from pathlib import Path
 from typing import Dict, List, Tuple
 from datetime import timedelta
@@ -20,8 +22,11 @@ from datetime import timedelta
 # Agregar backend a path
 sys.path.insert(0, str(Path(__file__).parent))
 
+from config.settings import settings
 from services.rag_service import RAGService
 from services import groq_service
+from services.llm_errors import LLMError
+from services.graph_snapshot import convert_json_to_snapshot, snapshot_path_for
 import argparse
 
 
@@ -37,8 +42,19 @@ class KnowledgeGraphBuilder:
         self.chunks = []
         self.nodes = {}  # {id: {label, type, description}}
         self.edges = []  # [{source, target, relation, weight}]
+        self.failed_chunks = {}  # {chunk_index: error} chunks que fallaron tras los reintentos
         self.start_time = None
-        self.chunk_times = []  # Para calcular promedio real
+    
+    @classmethod
+    def time_per_chunk(cls) -> float:
+        """
+        Tiempo efectivo por chunk con requests concurrentes:
+        la latencia se reparte entre LLM_MAX_CONCURRENCY requests en vuelo,
+        pero nunca más rápido de lo que permite el límite RPM
+        """
+        concurrent = cls.ESTIMATED_TIME_PER_CHUNK / max(settings.LLM_MAX_CONCURRENCY, 1)
+        rate_limited = 60.0 / max(settings.LLM_REQUESTS_PER_MINUTE, 1)
+        return max(concurrent, rate_limited)
     
     def extract_pdf(self) -> bool:
         """Extrae texto del PDF"""
@@ -64,7 +80,7 @@ class KnowledgeGraphBuilder:
         # Estimar tiempo por fase
         extraction_time = 5  # segundos
         chunking_time = 2    # segundos
-        processing_time = len(self.chunks) * self.ESTIMATED_TIME_PER_CHUNK
+        processing_time = len(self.chunks) * self.time_per_chunk()
         cleanup_time = 3     # segundos
         save_time = 1        # segundos
         
@@ -86,7 +102,7 @@ class KnowledgeGraphBuilder:
             "total_seconds": total_seconds,
             "total_readable": readable,
             "chunks": len(self.chunks),
-            "time_per_chunk": self.ESTIMATED_TIME_PER_CHUNK,
+            "time_per_chunk": round(self.time_per_chunk(), 2),
             "breakdown": {
                 "extraction": extraction_time,
                 "chunking": chunking_time,
@@ -145,55 +161,27 @@ class KnowledgeGraphBuilder:
         
         # Mostrar estimación de tiempo
         chunks_count = len(chunks_to_process)
-        est_time = chunks_count * self.ESTIMATED_TIME_PER_CHUNK
+        est_time = chunks_count * self.time_per_chunk()
         est_td = timedelta(seconds=int(est_time))
-        print(f"\n📊 Procesando {chunks_count} chunks")
+        print(f"\n📊 Procesando {chunks_count} chunks "
+              f"({settings.LLM_MAX_CONCURRENCY} en paralelo, máx {settings.LLM_REQUESTS_PER_MINUTE} req/min)")
         print(f"⏱️  Tiempo estimado: ≈ {est_td}")
         print(f"{'-'*50}\n")
         
         self.start_time = time.time()
         
         try:
+            # Requests concurrentes; las respuestas se aplican en orden de chunk
+            prompts = [self.build_extraction_prompt(chunk) for chunk in chunks_to_process]
+            responses = asyncio.run(self._fetch_responses(prompts))
+            
             processed = 0
             
-            for i, chunk in enumerate(chunks_to_process):
-                chunk_start = time.time()
+            for i, response in enumerate(responses):
+                if response is None:
+                    continue  # Falló tras los reintentos (ver failed_chunks)
                 
-                # Calcular tiempo restante
-                if self.chunk_times:
-                    avg_time = sum(self.chunk_times) / len(self.chunk_times)
-                    remaining_chunks = chunks_count - i - 1
-                    remaining_time = remaining_chunks * avg_time
-                    remaining_td = timedelta(seconds=int(remaining_time))
-                    pct = int((i / chunks_count) * 100)
-                    print(f"  [{i+1}/{chunks_count}] {pct}% - Tiempo restante: ≈ {remaining_td}", end="\r")
-                else:
-                    pct = int((i / chunks_count) * 100)
-                    print(f"  [{i+1}/{chunks_count}] {pct}% - Procesando...", end="\r")
-                
-                # Prompt para Groq
-                prompt = f"""Analiza el siguiente texto y extrae SOLO en formato JSON válido:
-1. Entidades principales (conceptos, actores, objetos)
-2. Relaciones entre entidades
-
-Formato de respuesta JSON exacto:
-{{
-    "entities": [
-        {{"id": "entity_id", "label": "nombre visible", "type": "tipo (articulo/concepto/actor/derecho/obligacion)", "description": "breve descripción"}}
-    ],
-    "relations": [
-        {{"source": "entity_id_1", "target": "entity_id_2", "relation": "tipo_relacion", "weight": 0.8}}
-    ]
-}}
-
-Texto a analizar:
-{chunk[:1500]}
-
-RESPONDE SOLO CON EL JSON, sin explicación."""
-
                 try:
-                    response = groq_service.chat_simple(prompt)
-                    
                     # Parse JSON response
                     json_match = re.search(r'\{.*\}', response, re.DOTALL)
                     if json_match:
@@ -236,10 +224,6 @@ RESPONDE SOLO CON EL JSON, sin explicación."""
                 except Exception as e:
                     print(f"\n  ⚠️  Error en chunk {i}: {str(e)}")
                 
-                # Guardar tiempo de este chunk
-                chunk_time = time.time() - chunk_start
-                self.chunk_times.append(chunk_time)
-                
                 processed += 1
             
             # Tiempo total
@@ -248,12 +232,73 @@ RESPONDE SOLO CON EL JSON, sin explicación."""
             
             print(f"\n  ✅ {processed} chunks procesados en {total_td}")
             print(f"✅ Extraídas {len(self.nodes)} entidades, {len(self.edges)} relaciones")
+            
+            if self.failed_chunks:
+                print(f"⚠️  {len(self.failed_chunks)} chunks fallaron tras los reintentos "
+                      f"(quedan en metadata.failed_chunks)")
+                for index, error in list(self.failed_chunks.items())[:5]:
+                    print(f"    • Chunk {index}: {error}")
+                print(f"   💡 Vuelve a ejecutar: los chunks ya procesados salen del caché de respuestas")
+            
+            stats = groq_service.get_resilience_stats()
+            if stats['retries'] or stats['failures']:
+                print(f"   🔁 Reintentos: {stats['retries']} | Fallas: {stats['failures']} | "
+                      f"Circuito: {stats['circuit_state']}")
             return True
         
         except Exception as e:
             print(f"❌ Error: {str(e)}")
             return False
     
+    @staticmethod
+    def build_extraction_prompt(chunk: str) -> str:
+        """Prompt de extracción de entidades y relaciones para un chunk"""
+        return f"""Analiza el siguiente texto y extrae SOLO en formato JSON válido:
+1. Entidades principales (conceptos, actores, objetos)
+2. Relaciones entre entidades
+
+Formato de respuesta JSON exacto:
+{{
+    "entities": [
+        {{"id": "entity_id", "label": "nombre visible", "type": "tipo (articulo/concepto/actor/derecho/obligacion)", "description": "breve descripción"}}
+    ],
+    "relations": [
+        {{"source": "entity_id_1", "target": "entity_id_2", "relation": "tipo_relacion", "weight": 0.8}}
+    ]
+}}
+
+Texto a analizar:
+{chunk[:1500]}
+
+RESPONDE SOLO CON EL JSON, sin explicación."""
+    
+    async def _fetch_responses(self, prompts: List[str]) -> List[str]:
+        """
+        Envía todos los prompts de forma concurrente (groq_service limita
+        concurrencia y RPM/TPM) mostrando el avance a medida que terminan
+        """
+        total = len(prompts)
+        done = 0
+        
+        async def fetch(index: int, prompt: str):
+            nonlocal done
+            try:
+                response = await groq_service.achat_simple(prompt)
+            except LLMError as e:
+                # Se registra y se sigue: el resto del grafo no se pierde
+                self.failed_chunks[index] = f"{type(e).__name__}: {e}"
+                response = None
+            done += 1
+            
+            # Calcular tiempo restante según el throughput observado
+            elapsed = time.time() - self.start_time
+            remaining_td = timedelta(seconds=int(elapsed / done * (total - done)))
+            pct = int((done / total) * 100)
+            print(f"  [{done}/{total}] {pct}% - Tiempo restante: ≈ {remaining_td}", end="\r")
+            return response
+        
+        return await asyncio.gather(*(fetch(i, prompt) for i, prompt in enumerate(prompts)))
+    
     def cleanup_graph(self):
         """
         Limpia el grafo:
@@ -283,6 +328,7 @@ RESPONDE SOLO CON EL JSON, sin explicación."""
                 "source": Path(self.pdf_path).name,
                 "total_text_chars": len(self.text),
                 "chunks_processed": len(self.chunks),
+                "failed_chunks": sorted(self.failed_chunks),
                 "nodes_count": len(self.nodes),
                 "edges_count": len(self.edges)
             },
@@ -298,10 +344,24 @@ RESPONDE SOLO CON EL JSON, sin explicación."""
         
         graph = self.build_graph()
         
-        with open(output_path, 'w', encoding='utf-8') as f:
+        # Se escribe a un temporal y se reemplaza al final: quien tenga el grafo
+        # cargado (CLI, recarga en caliente) nunca lee un JSON a medio escribir
+        tmp_path = f"{output_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
             json.dump(graph, f, ensure_ascii=False, indent=2)
         
+        # Snapshot compilado para cargas rápidas (el JSON sigue siendo el formato de intercambio).
+        # Va antes que el JSON: al detectar el cambio, el snapshot ya está al día
+        try:
+            snapshot_path = convert_json_to_snapshot(tmp_path, snapshot_path_for(output_path),
+                                                     source=Path(output_path).name)
+            snapshot_message = f"💾 Snapshot: {snapshot_path}"
+        except Exception as e:
+            snapshot_message = f"⚠️  No se pudo escribir el snapshot: {e}"
+        
+        os.replace(tmp_path, output_path)
         print(f"\n💾 Grafo guardado: {output_path}")
+        print(snapshot_message)
         return output_path
     
     def print_stats(self):
@@ -377,9 +437,19 @@ def main():
         default=10,
         help="Máximo número de chunks a procesar (default: 10)"
     )
+    parser.add_argument(
+        "--concurrency",
+        "-c",
+        type=int,
+        default=None,
+        help=f"Requests simultáneas al LLM (default: {settings.LLM_MAX_CONCURRENCY})"
+    )
     
     args = parser.parse_args()
     
+    if args.concurrency:
+        settings.LLM_MAX_CONCURRENCY = args.concurrency
+    
     # Verificar que el PDF existe
     if not Path(args.pdf).exists():
         print(f"❌ Error: PDF no encontrado: {args.pdf}")
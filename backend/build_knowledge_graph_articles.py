@@ -12,9 +12,11 @@ Estrategia:
 Output: JSON con estructura artículo-céntrica
 """
 
+import os
 import sys
 import json
 import re
+import asyncio
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
 from datetime import timedelta
@@ -22,8 +24,11 @@ import time
 
 sys.path.insert(0, str(Path(__file__).parent))
 
+from config.settings import settings
 from services.rag_service import RAGService
+from services.article_parser import parse_articles
 from services import groq_service
+from services.graph_snapshot import convert_json_to_snapshot, snapshot_path_for
 
 
 class ArticleGraphBuilder:
@@ -35,12 +40,6 @@ class ArticleGraphBuilder:
         self.articles = {}  # {article_number: {number, title, content, context}}
         self.nodes = {}     # {article_number: node}
         self.edges = []     # Relaciones entre artículos
-        self.context_stack = {
-            "libro": None,
-            "titulo": None,
-            "capitulo": None,
-            "parrafo": None
-        }
     
     def extract_pdf(self) -> bool:
         """Extrae texto del PDF"""
@@ -65,65 +64,19 @@ class ArticleGraphBuilder:
         print("\n🔍 Extrayendo artículos...")
         
         try:
-            # Patrones para detectar estructura
-            libro_pattern = r'(?:^|\n)\s*(?:LIBRO|Libro)\s+([IVX]+|[A-Z]+).*?(?:$|\n)'
-            titulo_pattern = r'(?:^|\n)\s*(?:TÍTULO|Título)\s+([IVX]+|[A-Z]+).*?(?:$|\n)'
-            capitulo_pattern = r'(?:^|\n)\s*(?:CAPÍTULO|Capítulo)\s+([IVX]+|[A-Z]+).*?(?:$|\n)'
-            parrafo_pattern = r'(?:^|\n)\s*(?:Párrafo|PÁRRAFO)\s+([0-9°º]+).*?(?:$|\n)'
-            
-            # Patrón para artículos: "Art. 1°", "Art. 15 bis", "Art. 25 ter", etc.
-            # Captura: Art. [número][opcional sufijo como bis/ter]
-            article_pattern = r'(?:^|\n)\s*(?:Art\.?|ARTÍCULO)\s+(\d+)\s*(?:(bis|ter|quáter|bis\s+A|bis\s+B))?\s*[.—\-]?\s*(.+?)(?=(?:\n\s*(?:Art\.?|ARTÍCULO)\s+\d+|$))'
-            
-            # Extraer contexto
-            libro_matches = re.finditer(libro_pattern, self.text, re.MULTILINE | re.IGNORECASE)
-            titulo_matches = re.finditer(titulo_pattern, self.text, re.MULTILINE | re.IGNORECASE)
-            capitulo_matches = re.finditer(capitulo_pattern, self.text, re.MULTILINE | re.IGNORECASE)
-            
-            # Construir mapa de posiciones para contexto
-            context_positions = {}
-            for match in libro_matches:
-                context_positions[match.start()] = ('libro', match.group(1))
-            for match in titulo_matches:
-                context_positions[match.start()] = ('titulo', match.group(1))
-            for match in capitulo_matches:
-                context_positions[match.start()] = ('capitulo', match.group(1))
-            
-            # Extraer artículos
-            article_matches = re.finditer(article_pattern, self.text, re.MULTILINE | re.DOTALL)
             articles_found = 0
             
-            for match in article_matches:
-                article_num = match.group(1)
-                suffix = match.group(2) or ""
-                content = match.group(3).strip()
-                
-                # Normalizar número
-                if suffix:
-                    article_id = f"{article_num} {suffix}".replace("\n", " ").strip()
-                else:
-                    article_id = article_num
-                
-                # Actualizar contexto basado en posición
-                pos = match.start()
-                for ctx_pos in sorted(context_positions.keys(), reverse=True):
-                    if ctx_pos <= pos:
-                        ctx_type, ctx_value = context_positions[ctx_pos]
-                        self.context_stack[ctx_type] = ctx_value
-                        break
+            for article in parse_articles(self.text):
+                article_id = article["id"]
+                content = article["content"]
                 
                 # Crear nodo del artículo
                 self.articles[article_id] = {
                     "number": article_id,
-                    "numeric": article_num,
+                    "numeric": article["numeric"],
                     "content": content[:500],  # Primeros 500 caracteres
                     "full_text": content,
-                    "context": {
-                        "libro": self.context_stack["libro"],
-                        "titulo": self.context_stack["titulo"],
-                        "capitulo": self.context_stack["capitulo"],
-                        "parrafo": self.context_stack["parrafo"]
-                    }
+                    "context": article["context"]
                 }
                 articles_found += 1
             
@@ -188,44 +141,150 @@ class ArticleGraphBuilder:
         print(f"✅ {len(self.edges)} referencias encontradas")
         return True
     
-    def extract_article_titles(self) -> bool:
+    # Artículos por request al pedir títulos (un JSON {id: título} por lote)
+    TITLE_BATCH_SIZE = 20
+    # Caracteres de cada artículo que ve el LLM para titularlo
+    TITLE_PREVIEW_CHARS = 300
+    
+    def extract_article_titles(self, batch_size: int = None) -> bool:
         """
         Usa el LLM para extraer un título descriptivo para cada artículo
         
+        Los artículos se envían en lotes: cada request titula `batch_size`
+        artículos y responde un JSON {id: título}. Los títulos que falten o no
+        se puedan leer se piden de nuevo en lotes chicos; si aún fallan se usa
+        la primera oración del artículo.
+        
         Esto mejora la legibilidad del grafo
         """
         print("\n🤖 Extrayendo títulos de artículos con LLM...")
         
-        articles_to_process = list(self.articles.items())[:50]  # Procesar primeros 50
+        batch_size = max(1, batch_size or self.TITLE_BATCH_SIZE)
+        pending = list(self.articles)
+        requests = 0
         
-        for i, (article_id, article_data) in enumerate(articles_to_process):
-            if i % 10 == 0:
-                print(f"  [{i+1}/{len(articles_to_process)}] Procesando...")
+        # 1ª pasada con lotes completos; 2ª solo con lo que faltó, en lotes más chicos
+        for round_batch_size in (batch_size, max(1, batch_size // 4)):
+            if not pending:
+                break
+            batches = [pending[i:i + round_batch_size] for i in range(0, len(pending), round_batch_size)]
+            if requests:
+                print(f"  🔁 Reintentando {len(pending)} títulos faltantes en {len(batches)} lotes...")
             
-            try:
-                content_preview = article_data["content"][:300]
-                
-                prompt = f"""Dado este artículo del Código del Trabajo, 
-extrae un título conciso (máx 10 palabras) que describa su contenido principal.
+            # Requests concurrentes (groq_service limita concurrencia y RPM/TPM)
+            responses = asyncio.run(self._fetch_titles([
+                (self.build_titles_prompt({article_id: self.articles[article_id] for article_id in batch}),
+                 len(batch))
+                for batch in batches
+            ]))
+            requests += len(batches)
+            
+            pending = []
+            for batch, response in zip(batches, responses):
+                titles = {} if isinstance(response, Exception) else self.parse_titles_response(response, batch)
+                for article_id in batch:
+                    if titles.get(article_id):
+                        self.articles[article_id]["title"] = titles[article_id]
+                    else:
+                        pending.append(article_id)
+        
+        for article_id in pending:
+            # Usar primer párrafo como título si falla
+            self.articles[article_id]["title"] = self.articles[article_id]["content"].split('.')[0][:50]
+        
+        print(f"✅ {len(self.articles) - len(pending)} títulos extraídos en {requests} requests")
+        if pending:
+            print(f"⚠️  {len(pending)} títulos fallaron tras los reintentos (se usó la primera oración)")
+        return True
+    
+    @classmethod
+    def build_titles_prompt(cls, articles: Dict[str, Dict]) -> str:
+        """Prompt para titular varios artículos en una sola request"""
+        previews = {
+            article_id: article_data["content"][:cls.TITLE_PREVIEW_CHARS]
+            for article_id, article_data in articles.items()
+        }
+        
+        return f"""Dados estos artículos del Código del Trabajo, 
+extrae para cada uno un título conciso (máx 10 palabras) que describa su contenido principal.
 
-Artículo {article_id}:
-{content_preview}
+Artículos (JSON, clave = número de artículo):
+{json.dumps(previews, ensure_ascii=False, indent=1)}
 
-RESPONDE SOLO CON EL TÍTULO, sin explicación."""
-                
-                title = groq_service.chat_simple(prompt).strip()
-                # Limpiar resultado
-                title = title.replace("**", "").replace('"', '').replace("'", '')[:50]
-                
-                self.articles[article_id]["title"] = title
-                
-            except Exception as e:
-                # Usar primer párrafo como título si falla
-                first_line = article_data["content"].split('.')[0][:50]
-                self.articles[article_id]["title"] = first_line
+RESPONDE SOLO CON UN JSON con las mismas claves y el título como valor, sin explicación:
+{{"{next(iter(previews))}": "título", ...}}"""
+    
+    @staticmethod
+    def _title_key(article_id: str) -> str:
+        """Clave comparable de un artículo ("Art. 15 Bis" → "15 bis")"""
+        key = re.sub(r'^\s*art(?:[íi]culo|\.)?\s*', '', str(article_id), flags=re.IGNORECASE)
+        return ' '.join(key.lower().replace('°', '').replace('º', '').split())
+    
+    @staticmethod
+    def clean_title(title) -> str:
+        """Limpia el título devuelto por el LLM"""
+        if not isinstance(title, str):
+            return ""
+        return title.strip().replace("**", "").replace('"', '').replace("'", '')[:50].strip()
+    
+    @classmethod
+    def parse_titles_response(cls, response: str, article_ids: List[str]) -> Dict[str, str]:
+        """
+        {id: título} de la respuesta de un lote
         
-        print(f"✅ Títulos extraídos")
-        return True
+        Tolera texto alrededor del JSON, claves con "Art." y JSON inválido
+        (en ese caso se leen las líneas "id": "título" una por una).
+        Los artículos que no aparecen simplemente quedan fuera.
+        """
+        by_key = {cls._title_key(article_id): article_id for article_id in article_ids}
+        raw = {}
+        
+        json_match = re.search(r'\{.*\}', response or "", re.DOTALL)
+        if json_match:
+            try:
+                data = json.loads(json_match.group())
+                if isinstance(data, dict):
+                    raw = data
+            except ValueError:
+                pass
+        
+        if not raw:
+            raw = dict(re.findall(r'"([^"\n]+)"\s*:\s*"([^"\n]*)"', response or ""))
+        
+        titles = {}
+        for key, title in raw.items():
+            article_id = by_key.get(cls._title_key(key))
+            title = cls.clean_title(title)
+            if article_id and title:
+                titles[article_id] = title
+        
+        # Un solo artículo: se acepta también una respuesta de texto plano
+        if not titles and len(article_ids) == 1 and response and not json_match:
+            title = cls.clean_title(response)
+            if title:
+                titles[article_ids[0]] = title
+        
+        return titles
+    
+    async def _fetch_titles(self, batches: List[Tuple[str, int]]) -> List:
+        """
+        Pide todos los lotes (prompt, cantidad de artículos) en paralelo;
+        los fallos se retornan como excepción
+        """
+        total = len(batches)
+        done = 0
+        
+        async def fetch(prompt: str, size: int) -> str:
+            nonlocal done
+            # ~25 tokens por título + margen para las llaves del JSON
+            response = await groq_service.achat_simple(prompt, temperature=0.3, max_tokens=25 * size + 50)
+            done += 1
+            if done % 5 == 0 or done == total:
+                print(f"  [{done}/{total}] Lotes procesados...")
+            return response
+        
+        return await asyncio.gather(*(fetch(prompt, size) for prompt, size in batches),
+                                    return_exceptions=True)
     
     def build_nodes(self) -> bool:
         """Construye nodos del grafo desde artículos"""
@@ -269,10 +328,24 @@ RESPONDE SOLO CON EL TÍTULO, sin explicación."""
         
         graph = self.build_graph()
         
-        with open(output_path, 'w', encoding='utf-8') as f:
+        # Se escribe a un temporal y se reemplaza al final: quien tenga el grafo
+        # cargado (CLI, recarga en caliente) nunca lee un JSON a medio escribir
+        tmp_path = f"{output_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
             json.dump(graph, f, ensure_ascii=False, indent=2)
         
+        # Snapshot compilado para cargas rápidas (el JSON sigue siendo el formato de intercambio).
+        # Va antes que el JSON: al detectar el cambio, el snapshot ya está al día
+        try:
+            snapshot_path = convert_json_to_snapshot(tmp_path, snapshot_path_for(output_path),
+                                                     source=Path(output_path).name)
+            snapshot_message = f"💾 Snapshot: {snapshot_path}"
+        except Exception as e:
+            snapshot_message = f"⚠️  No se pudo escribir el snapshot: {e}"
+        
+        os.replace(tmp_path, output_path)
         print(f"\n💾 Grafo guardado: {output_path}")
+        print(snapshot_message)
         return output_path
     
     def print_stats(self):
@@ -315,9 +388,17 @@ def main():
     parser.add_argument("-o", "--output", help="Ruta de salida para el JSON", default=None)
     parser.add_argument("-s", "--stats", action="store_true", help="Mostrar estadísticas")
     parser.add_argument("--titles", action="store_true", help="Extraer títulos con LLM")
+    parser.add_argument("-b", "--batch-size", type=int, default=ArticleGraphBuilder.TITLE_BATCH_SIZE,
+                        help=f"Artículos por request al extraer títulos "
+                             f"(default: {ArticleGraphBuilder.TITLE_BATCH_SIZE})")
+    parser.add_argument("-c", "--concurrency", type=int, default=None,
+                        help=f"Requests simultáneas al LLM (default: {settings.LLM_MAX_CONCURRENCY})")
     
     args = parser.parse_args()
     
+    if args.concurrency:
+        settings.LLM_MAX_CONCURRENCY = args.concurrency
+    
     if not Path(args.pdf).exists():
         print(f"❌ Error: PDF no encontrado: {args.pdf}")
         sys.exit(1)
@@ -344,7 +425,7 @@ def main():
     
     # Paso 4: Extraer títulos (opcional)
     if args.titles:
-        builder.extract_article_titles()
+        builder.extract_article_titles(args.batch_size)
     
     # Paso 5: Construir nodos
     if not builder.build_nodes():
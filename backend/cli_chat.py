@@ -5,19 +5,24 @@ Chat 100% local en terminal sobre Código del Trabajo Chileno
 """
 import sys
 import os
-import json
 from pathlib import Path
 
 # Agregar backend a path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from database.database import SessionLocal
+from database.database import SessionLocal, ensure_schema
 from database.models import Document
-from services.groq_service import embed_text, chat_with_doc
+from services.embeddings import embed_text
+from services.groq_service import chat_with_doc_stream, get_cache_stats, get_rate_limit_stats, get_resilience_stats, get_backend_info, get_single_flight_stats
 from services.rag_service import RAGService
 from services.graph_service import graph_service
+from services.graph_registry import graph_registry
+from services.context_builder import context_builder
+from services.answer_cache import answer_cache
+from services.entity_annotations import entity_annotations
+from config.settings import settings
 from services.agent_service import LegalAgentCodigoTrabajo
-import numpy as np
+from services.ingestion_service import ingestion_jobs
 
 # Colores para terminal
 class Colors:
@@ -35,15 +40,18 @@ class CLIChat:
     """Chat interactivo en terminal"""
     
     def __init__(self):
+        ensure_schema()
         self.db = SessionLocal()
         self.documents = []
         self.history = []
         self.agent = None
-        self.loaded_graphs = {}  # {nombre: ruta}
         self.debug_mode = False  # Modo verbose para ver workflow completo
+        self.reindex_documents()
         self.load_documents()
         self.load_knowledge_graph()
+        self.watch_graphs()
         self.load_agent()
+        self.resume_ingestion_jobs()
     
     def load_knowledge_graph(self):
         """Cargar grafo de conocimiento si existe"""
@@ -56,10 +64,11 @@ class CLIChat:
         for graph_path in graph_paths:
             if graph_path.exists():
                 print(f"{Colors.BLUE}📊 Cargando grafo de conocimiento...{Colors.END}")
-                if graph_service.load_graph(str(graph_path)):
-                    stats = graph_service.get_stats()
-                    print(f"{Colors.GREEN}✅ Grafo integrado ({stats['nodes']} nodos, "
-                          f"{stats['edges']} relaciones){Colors.END}\n")
+                result = graph_registry.load(str(graph_path))
+                if result['success']:
+                    print(f"{Colors.GREEN}✅ Grafo integrado '{result['name']}' ({result['nodes']} nodos, "
+                          f"{result['edges']} relaciones){Colors.END}\n")
+                    self.annotate_documents()
                     return
         
         print(f"{Colors.YELLOW}⚠️  Grafo no encontrado (búsqueda será sin grafo){Colors.END}\n")
@@ -84,6 +93,21 @@ class CLIChat:
         else:
             print(f"{Colors.YELLOW}⚠️  Agente en modo degradado (sin grafo de artículos){Colors.END}\n")
     
+    def reindex_documents(self):
+        """Calcular términos y embeddings de documentos cargados con un tokenizador anterior"""
+        try:
+            reindexed = RAGService.reindex_documents()
+            if reindexed:
+                print(f"{Colors.BLUE}🔄 {reindexed} documentos reindexados con el tokenizador actual{Colors.END}")
+        except Exception as e:
+            print(f"{Colors.YELLOW}⚠️  No se pudieron reindexar documentos: {e}{Colors.END}")
+    
+    def annotate_documents(self):
+        """Anotar con las entidades del grafo los chunks que aún no lo están"""
+        annotated = RAGService.annotate_documents()
+        if annotated:
+            print(f"{Colors.BLUE}🏷️  {annotated} chunks anotados con entidades del grafo{Colors.END}\n")
+    
     def load_documents(self):
         """Cargar documentos de la BD"""
         try:
@@ -93,37 +117,15 @@ class CLIChat:
             print(f"{Colors.RED}❌ Error cargando documentos: {e}{Colors.END}")
             self.documents = []
     
-    def search_documents(self, query: str, top_k: int = 3) -> list:
-        """
-        Buscar documentos usando búsqueda HÍBRIDA: 70% embeddings + 30% BM25
-        """
-        results = RAGService.search_hybrid(query, top_k=top_k)
-        
-        # Convertir resultado a documentos
-        docs_by_content = {}
-        for doc in self.documents:
-            docs_by_content[doc.content[:50]] = doc
-        
-        matched_docs = []
-        for result in results:
-            for doc in self.documents:
-                if doc.content == result['text']:
-                    matched_docs.append((doc, result['score']))
-                    break
-        
-        return [doc for doc, _ in matched_docs[:top_k]]
-    
-    def format_context(self, documents: list) -> str:
-        """Formatear documentos como contexto para el LLM"""
-        if not documents:
-            return ""
-        
-        context = "INFORMACIÓN RELEVANTE DEL CÓDIGO DEL TRABAJO:\n\n"
-        for i, doc in enumerate(documents, 1):
-            context += f"[{i}] {doc.article_number if doc.article_number else 'Documento'}\n"
-            context += f"{doc.content[:300]}...\n\n"
-        
-        return context
+    def answer_fingerprint(self, graph=None) -> str:
+        """Huella de lo que determina una respuesta: corpus, grafo, modelo y presupuesto de contexto"""
+        backend = get_backend_info()
+        graph = graph or graph_service.pinned()
+        graph_hash = graph.content_hash if graph.is_loaded else "-"
+        return "|".join([
+            RAGService.corpus_fingerprint(), graph_hash or "-",
+            backend['backend'], backend['model'], str(context_builder.token_budget)
+        ])
     
     def print_header(self):
         """Mostrar encabezado de bienvenida"""
@@ -137,15 +139,20 @@ class CLIChat:
         print(f"{Colors.CYAN}Comandos disponibles:{Colors.END}")
         print(f"  {Colors.GREEN}?{Colors.END} - Mostrar esta ayuda")
         print(f"\n{Colors.BOLD}📄 Gestión de PDFs:{Colors.END}")
-        print(f"  {Colors.GREEN}cargar <ruta>{Colors.END} - Cargar PDF (ej: cargar documentos/ley.pdf)")
+        print(f"  {Colors.GREEN}cargar <ruta>{Colors.END} - Cargar PDF en segundo plano (ej: cargar documentos/ley.pdf)")
+        print(f"  {Colors.GREEN}cargar-dir <dir>{Colors.END} - Cargar en paralelo todos los PDFs de un directorio")
+        print(f"  {Colors.GREEN}trabajos{Colors.END} - Ver avance de las cargas en segundo plano")
         print(f"  {Colors.GREEN}docs{Colors.END} - Listar documentos cargados")
         print(f"  {Colors.GREEN}reset-docs{Colors.END} - Borrar todos los documentos")
         print(f"\n{Colors.BOLD}📊 Gestión de Grafos JSON:{Colors.END}")
-        print(f"  {Colors.GREEN}cargar-grafo <ruta>{Colors.END} - Cargar JSON (ej: cargar-grafo grafos/codigo.json)")
+        print(f"  {Colors.GREEN}cargar-grafo <ruta>{Colors.END} - Cargar JSON o snapshot .npz en segundo plano (ej: cargar-grafo grafos/codigo.json)")
         print(f"  {Colors.GREEN}grafos{Colors.END} - Listar grafos cargados")
+        print(f"  {Colors.GREEN}activar-grafo <nombre>{Colors.END} - Usar un grafo cargado en las búsquedas")
+        print(f"  {Colors.GREEN}desactivar-grafo <nombre>{Colors.END} - Dejar de usar un grafo sin descargarlo")
         print(f"  {Colors.GREEN}reset-grafos{Colors.END} - Descargar todos los grafos")
         print(f"\n{Colors.BOLD}📈 Información:{Colors.END}")
         print(f"  {Colors.GREEN}grafo{Colors.END} - Ver estadísticas del grafo de conocimiento")
+        print(f"  {Colors.GREEN}llm{Colors.END} - Ver estadísticas del caché de respuestas del LLM")
         print(f"  {Colors.GREEN}historial{Colors.END} - Ver historial de preguntas")
         print(f"  {Colors.GREEN}limpiar{Colors.END} - Limpiar pantalla")
         print(f"\n{Colors.BOLD}🚪 Sesión:{Colors.END}")
@@ -173,7 +180,7 @@ class CLIChat:
         print()
     
     def load_pdf(self, pdf_path: str):
-        """Cargar PDF y agregarlo a la BD"""
+        """Encolar PDF para cargarlo a la BD en segundo plano"""
         pdf_file = Path(pdf_path)
         
         if not pdf_file.exists():
@@ -184,23 +191,99 @@ class CLIChat:
             print(f"{Colors.RED}❌ Solo se aceptan archivos PDF{Colors.END}\n")
             return
         
-        print(f"\n{Colors.BLUE}📥 Cargando PDF: {pdf_file.name}...{Colors.END}")
+        try:
+            job_id = ingestion_jobs.submit(str(pdf_file))
+            print(f"\n{Colors.BLUE}📥 PDF en cola: {pdf_file.name} (trabajo #{job_id}){Colors.END}")
+            print(f"{Colors.YELLOW}💡 Puedes seguir preguntando; usa 'trabajos' para ver el avance{Colors.END}\n")
+        
+        except Exception as e:
+            print(f"{Colors.RED}❌ Error al encolar PDF: {str(e)}{Colors.END}\n")
+    
+    def resume_ingestion_jobs(self):
+        """Reanudar trabajos de ingreso interrumpidos en una sesión anterior"""
+        try:
+            resumed = ingestion_jobs.resume_pending()
+            if resumed:
+                ids = ", ".join(f"#{job_id}" for job_id in resumed)
+                print(f"{Colors.BLUE}🔄 Reanudando {len(resumed)} trabajo(s) de ingreso: {ids}{Colors.END}\n")
+        except Exception as e:
+            print(f"{Colors.YELLOW}⚠️  No se pudieron reanudar trabajos: {e}{Colors.END}\n")
+    
+    def check_finished_jobs(self):
+        """Informar trabajos terminados y recargar documentos"""
+        finished = ingestion_jobs.pop_finished()
+        if not finished:
+            return
+        
+        for job in finished:
+            if job['status'] == 'completed':
+                print(f"{Colors.GREEN}✅ Trabajo #{job['id']} ({job['source']}): "
+                      f"{job['documents_saved']} documento(s) agregado(s){Colors.END}")
+            else:
+                print(f"{Colors.RED}❌ Trabajo #{job['id']} ({job['source']}) falló: {job['error']}{Colors.END}")
+        print()
+        self.load_documents()
+    
+    def print_jobs(self):
+        """Mostrar avance de los trabajos de ingreso"""
+        jobs = ingestion_jobs.list_jobs()
+        
+        if not jobs:
+            print(f"{Colors.YELLOW}No hay trabajos de ingreso{Colors.END}\n")
+            return
+        
+        status_labels = {
+            'pending': f"{Colors.YELLOW}⏳ en cola{Colors.END}",
+            'running': f"{Colors.BLUE}🔄 en curso{Colors.END}",
+            'completed': f"{Colors.GREEN}✅ completado{Colors.END}",
+            'failed': f"{Colors.RED}❌ error{Colors.END}",
+        }
+        
+        print(f"\n{Colors.BOLD}📥 Trabajos de ingreso:{Colors.END}")
+        for job in jobs:
+            status = status_labels.get(job['status'], job['status'])
+            print(f"  #{job['id']} {job['source']} - {status}")
+            
+            if job['total_chunks']:
+                print(f"     {job['processed_chunks']}/{job['total_chunks']} chunks "
+                      f"({job['progress']*100:.0f}%), {job['documents_saved']} documento(s)")
+            elif job['phase']:
+                print(f"     {job['phase']}...")
+            
+            if job['error']:
+                print(f"     {Colors.RED}{job['error']}{Colors.END}")
+        print()
+    
+    def load_pdf_directory(self, dir_path: str):
+        """Cargar en paralelo todos los PDFs de un directorio"""
+        directory = Path(dir_path)
+        
+        if not directory.is_dir():
+            print(f"{Colors.RED}❌ Directorio no encontrado: {dir_path}{Colors.END}\n")
+            return
+        
+        print(f"\n{Colors.BLUE}📥 Cargando PDFs de: {directory}...{Colors.END}")
+        
+        def print_progress(done, total, file_result):
+            pct = int(done / total * 100)
+            if file_result.get('success'):
+                print(f"  [{done}/{total}] {pct:3d}% {Colors.GREEN}✅ {file_result['source']}{Colors.END} "
+                      f"({file_result['documents_saved']} chunks)")
+            else:
+                print(f"  [{done}/{total}] {pct:3d}% {Colors.RED}❌ {file_result['source']}: "
+                      f"{file_result.get('error')}{Colors.END}")
         
         try:
-            # Procesar PDF
-            result = RAGService.process_pdf(str(pdf_file))
+            result = RAGService.process_directory(str(directory), progress_callback=print_progress)
             
-            if isinstance(result, dict) and result.get('success'):
-                # Recargar documentos de la BD
+            if result.get('success'):
                 self.load_documents()
-                saved = result.get('documents_saved', 0)
-                print(f"{Colors.GREEN}✅ PDF procesado: {saved} documento(s) agregado(s){Colors.END}\n")
+                print(f"{Colors.GREEN}{result['message']}{Colors.END}\n")
             else:
-                error_msg = result.get('message', 'Error desconocido') if isinstance(result, dict) else str(result)
-                print(f"{Colors.YELLOW}⚠️  {error_msg}{Colors.END}\n")
+                print(f"{Colors.YELLOW}⚠️  {result.get('message', 'Error desconocido')}{Colors.END}\n")
         
         except Exception as e:
-            print(f"{Colors.RED}❌ Error al procesar PDF: {str(e)}{Colors.END}\n")
+            print(f"{Colors.RED}❌ Error al procesar directorio: {str(e)}{Colors.END}\n")
     
     def reset_documents(self):
         """Limpiar todos los documentos de la BD"""
@@ -210,6 +293,7 @@ class CLIChat:
             try:
                 self.db.query(Document).delete()
                 self.db.commit()
+                entity_annotations.clear()
                 self.load_documents()
                 print(f"{Colors.GREEN}✅ Documentos borrados. BD lista para nuevos imports.{Colors.END}\n")
             except Exception as e:
@@ -219,53 +303,59 @@ class CLIChat:
             print(f"{Colors.YELLOW}❌ Cancelado{Colors.END}\n")
     
     def load_json_graph(self, json_path: str):
-        """Cargar grafo JSON y agregarlo a la lista activa"""
+        """Cargar grafo JSON (o su snapshot .npz) y agregarlo a los grafos activos"""
         json_file = Path(json_path)
         
         if not json_file.exists():
             print(f"{Colors.RED}❌ Archivo no encontrado: {json_path}{Colors.END}\n")
             return
         
-        if not json_file.suffix.lower() == '.json':
-            print(f"{Colors.RED}❌ Solo se aceptan archivos JSON{Colors.END}\n")
+        if json_file.suffix.lower() not in ('.json', '.npz'):
+            print(f"{Colors.RED}❌ Solo se aceptan archivos JSON o snapshots .npz{Colors.END}\n")
             return
         
-        print(f"\n{Colors.BLUE}📥 Cargando grafo: {json_file.name}...{Colors.END}")
-        
-        try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                grafo_data = json.load(f)
-            
-            # Validar estructura básica
-            if not isinstance(grafo_data, dict) or 'nodes' not in grafo_data:
-                print(f"{Colors.YELLOW}⚠️  Archivo JSON no parece ser un grafo válido (falta 'nodes'){Colors.END}\n")
-                return
-            
-            # Cargar en el servicio de grafos
-            if graph_service.load_graph(str(json_file)):
-                graph_name = json_file.stem
-                self.loaded_graphs[graph_name] = str(json_file)
-                stats = graph_service.get_stats()
-                print(f"{Colors.GREEN}✅ Grafo '{graph_name}' cargado ({stats['nodes']} nodos, "
-                      f"{stats['edges']} relaciones){Colors.END}\n")
+        # Se carga en segundo plano (parseo e índices): se puede seguir preguntando con los grafos actuales
+        name = graph_registry.load_async(str(json_file))
+        print(f"\n{Colors.BLUE}📥 Cargando grafo '{name}' en segundo plano...{Colors.END}")
+        print(f"{Colors.YELLOW}💡 Puedes seguir preguntando; se avisará cuando esté listo{Colors.END}\n")
+    
+    def check_graph_events(self):
+        """Informar cargas de grafos terminadas y recargas por cambios en los archivos"""
+        for event in graph_registry.pop_events():
+            if event['success']:
+                print(f"{Colors.GREEN}{event['message']}{Colors.END}")
+                if event.get('annotated'):
+                    print(f"{Colors.BLUE}🏷️  {event['annotated']} chunks anotados con entidades del grafo{Colors.END}")
             else:
-                print(f"{Colors.RED}❌ Error al cargar el grafo en el servicio{Colors.END}\n")
-        
-        except json.JSONDecodeError:
-            print(f"{Colors.RED}❌ Archivo JSON inválido (JSON malformado){Colors.END}\n")
-        except Exception as e:
-            print(f"{Colors.RED}❌ Error al cargar grafo: {str(e)}{Colors.END}\n")
+                print(f"{Colors.RED}{event['message']}{Colors.END}")
+            print()
+    
+    def watch_graphs(self):
+        """Recargar automáticamente los grafos cuyo archivo cambia (ej: al reconstruirlos con el builder)"""
+        if graph_registry.start_watching():
+            print(f"{Colors.BLUE}👀 Recarga automática de grafos activada "
+                  f"(cada {settings.GRAPH_WATCH_INTERVAL_SECONDS:g}s){Colors.END}\n")
     
     def print_loaded_graphs(self):
         """Listar grafos cargados"""
-        if not self.loaded_graphs:
+        graphs = graph_registry.list_graphs()
+        loading = graph_registry.loading()
+        if not graphs and not loading:
             print(f"\n{Colors.YELLOW}No hay grafos cargados{Colors.END}\n")
             return
         
         print(f"\n{Colors.BOLD}📊 Grafos disponibles:{Colors.END}")
-        for i, (name, path) in enumerate(self.loaded_graphs.items(), 1):
-            print(f"  {i}. {Colors.GREEN}{name}{Colors.END}")
-            print(f"     📁 {path}")
+        for i, info in enumerate(graphs, 1):
+            if info['enabled']:
+                state = f"{Colors.GREEN}activo{Colors.END}"
+            else:
+                state = f"{Colors.YELLOW}inactivo{Colors.END}"
+            snapshot = " (snapshot .npz)" if info['snapshot'] else ""
+            print(f"  {i}. {Colors.GREEN}{info['name']}{Colors.END} [{state}] - "
+                  f"{info['nodes']} nodos, {info['edges']} relaciones")
+            print(f"     📁 {info['path']}{snapshot}")
+        for name in loading:
+            print(f"  ⏳ {Colors.YELLOW}{name}{Colors.END} [cargando en segundo plano]")
         
         if graph_service.is_loaded:
             stats = graph_service.get_stats()
@@ -274,28 +364,38 @@ class CLIChat:
     
     def reset_graphs(self):
         """Limpiar todos los grafos cargados"""
-        if not self.loaded_graphs:
+        if not len(graph_registry):
             print(f"{Colors.YELLOW}No hay grafos cargados para limpiar{Colors.END}\n")
             return
         
-        confirm = input(f"\n{Colors.YELLOW}⚠️  Descargar TODOS los grafos ({len(self.loaded_graphs)})? (sí/no): {Colors.END}").strip().lower()
+        confirm = input(f"\n{Colors.YELLOW}⚠️  Descargar TODOS los grafos ({len(graph_registry)})? (sí/no): {Colors.END}").strip().lower()
         
         if confirm == "sí" or confirm == "si":
-            self.loaded_graphs.clear()
-            graph_service.is_loaded = False
-            graph_service.nodes = {}
-            graph_service.edges = []
+            graph_registry.clear()
             print(f"{Colors.GREEN}✅ Grafos descargados. Sistema listo.{Colors.END}\n")
         else:
             print(f"{Colors.YELLOW}❌ Cancelado{Colors.END}\n")
     
+    def set_graph_enabled(self, name: str, enabled: bool):
+        """Activar o desactivar un grafo cargado (sin volver a leer el archivo)"""
+        if not name:
+            print(f"{Colors.YELLOW}⚠️  Indica el nombre del grafo (ver 'grafos'){Colors.END}\n")
+            return
+        
+        result = graph_registry.set_enabled(name, enabled)
+        color = Colors.GREEN if result['success'] else Colors.RED
+        print(f"{color}{result['message']}{Colors.END}\n")
+        if result['success'] and enabled:
+            self.annotate_documents()
+    
     def print_graph_stats(self):
         """Mostrar estadísticas del grafo de conocimiento"""
-        if not graph_service.is_loaded:
+        graph = graph_service.pinned()
+        if not graph.is_loaded:
             print(f"{Colors.YELLOW}⚠️  Grafo no cargado{Colors.END}\n")
             return
         
-        stats = graph_service.get_stats()
+        stats = graph.get_stats()
         
         print(f"\n{Colors.BOLD}{Colors.CYAN}📊 ESTADÍSTICAS DEL GRAFO{Colors.END}")
         print(f"{Colors.CYAN}{'='*60}{Colors.END}")
@@ -305,6 +405,10 @@ class CLIChat:
         print(f"  • Relaciones: {stats['edges']}")
         print(f"  • Densidad: {stats['edges']/max(stats['nodes'], 1):.2f} edges por nodo")
         
+        annotations = entity_annotations.get_stats()
+        print(f"  • Chunks anotados: {annotations['annotated_chunks']} "
+              f"({annotations['incidences']} menciones de entidades)")
+        
         print(f"\n{Colors.GREEN}Tipos de entidades:{Colors.END}")
         for entity_type, count in sorted(stats['entity_types'].items(), key=lambda x: x[1], reverse=True):
             print(f"  • {entity_type}: {count}")
@@ -316,12 +420,62 @@ class CLIChat:
         
         print(f"\n{Colors.GREEN}Nodos más conectados:{Colors.END}")
         for node_id, connections in stats['most_connected'][:5]:
-            node = graph_service.nodes.get(node_id, {})
+            node = graph.nodes.get(node_id, {})
             label = node.get('label', 'Unknown')
             print(f"  • {label}: {connections} conexiones")
         
         print(f"\n{Colors.CYAN}{'='*60}{Colors.END}\n")
     
+    def print_llm_stats(self):
+        """Mostrar estadísticas del caché de respuestas del LLM"""
+        stats = get_cache_stats()
+        
+        print(f"\n{Colors.BOLD}{Colors.CYAN}🤖 CACHÉ DE RESPUESTAS DEL LLM{Colors.END}")
+        print(f"{Colors.CYAN}{'='*60}{Colors.END}")
+        
+        backend = get_backend_info()
+        print(f"  • Backend: {backend['backend']} ({backend['model']})")
+        
+        if not stats['enabled']:
+            print(f"{Colors.YELLOW}⚠️  Caché desactivado (LLM_CACHE=0){Colors.END}")
+        
+        print(f"  • Hits: {stats['hits']} ({stats['memory_hits']} en memoria)")
+        print(f"  • Misses: {stats['misses']}")
+        print(f"  • Tasa de aciertos: {stats['hit_rate']*100:.1f}%")
+        print(f"  • Entradas: {stats['entries']}/{stats['max_entries']}")
+        print(f"  • Tamaño: {stats['bytes']/1024:.1f} KB / {stats['max_bytes']/(1024*1024):.0f} MB")
+        print(f"  • Evicciones: {stats['evictions']}")
+        if stats['ttl_seconds']:
+            print(f"  • TTL: {stats['ttl_seconds']:.0f} s")
+        
+        flights = get_single_flight_stats()
+        print(f"  • Requests unidas a una idéntica en vuelo: {flights['coalesced']} "
+              f"({flights['leaders']} llamadas, {flights['in_flight']} en curso)")
+        
+        answers = answer_cache.get_stats()
+        print(f"\n{Colors.GREEN}Caché semántico de respuestas:{Colors.END}")
+        if not settings.ANSWER_CACHE_ENABLED:
+            print(f"{Colors.YELLOW}⚠️  Desactivado (ANSWER_CACHE=1 lo activa){Colors.END}")
+        print(f"  • Hits: {answers['hits']} | Misses: {answers['misses']} "
+              f"(similitud mínima {answers['threshold']:.2f})")
+        print(f"  • Entradas: {answers['entries']}/{answers['max_entries']} "
+              f"en {answers['groups']} contextos | Invalidaciones: {answers['invalidations']}")
+        
+        limits = get_rate_limit_stats()
+        print(f"\n{Colors.GREEN}Límites de la API:{Colors.END}")
+        print(f"  • {limits['requests_per_minute']:.0f} req/min, {limits['tokens_per_minute']:.0f} tokens/min, "
+              f"{limits['max_concurrency']} en paralelo")
+        print(f"  • Respuestas 429: {limits['rate_limited']}")
+        
+        resilience = get_resilience_stats()
+        print(f"\n{Colors.GREEN}Disponibilidad:{Colors.END}")
+        print(f"  • Llamadas: {resilience['calls']} | Reintentos: {resilience['retries']} | "
+              f"Fallas: {resilience['failures']}")
+        print(f"  • Circuito: {resilience['circuit_state']} "
+              f"(abierto {resilience['circuit_opens']} veces, {resilience['short_circuited']} llamadas rechazadas)")
+        
+        print(f"{Colors.CYAN}{'='*60}{Colors.END}\n")
+    
     def print_history(self):
         """Mostrar historial de preguntas"""
         if not self.history:
@@ -368,23 +522,25 @@ class CLIChat:
         
         print(f"{Colors.BLUE}🔄 Buscando información relevante...{Colors.END}")
         
+        # Una sola versión del grafo para toda la pregunta (aunque se recargue mientras tanto)
+        graph = graph_service.pinned()
+        
         # 1. Búsqueda híbrida: embeddings + BM25 + GRAFO (si disponible)
-        results = RAGService.search_hybrid(query, top_k=3, use_graph=graph_service.is_loaded)
-        relevant_docs = self.search_documents(query, top_k=3)
+        results = RAGService.search_hybrid(query, top_k=3, use_graph=graph.is_loaded, graph=graph)
         
         # 2. Búsqueda adicional con keywords específicos si el agente detecta palabras clave
         if self.agent:
             specific_keywords = self.agent.extract_specific_keywords(query)
             if specific_keywords:
                 for keyword in specific_keywords[:3]:  # Máx 3 keywords adicionales
-                    keyword_results = RAGService.search_hybrid(keyword, top_k=2, use_graph=graph_service.is_loaded)
+                    keyword_results = RAGService.search_hybrid(keyword, top_k=2, use_graph=graph.is_loaded, graph=graph)
                     results.extend(keyword_results)
         
         # Eliminar duplicados
         seen = set()
         unique_results = []
         for r in results:
-            key = (r.get('article'), r.get('score'))
+            key = r.get('id') or (r.get('article'), r.get('score'))
             if key not in seen:
                 seen.add(key)
                 unique_results.append(r)
@@ -406,26 +562,47 @@ class CLIChat:
                 else:
                     print(f"   • {article} (relevancia: {relevance:.1f}%)")
             
-            context = self.format_context(relevant_docs)
-            
-            # Enriquecer contexto con información del grafo
-            if graph_service.is_loaded:
-                graph_context = graph_service.enrich_context(query, results, max_entities=5)
-                if graph_context:
-                    context += "\n" + graph_context
-        
-        # 2. Generar respuesta con Groq
-        print(f"\n{Colors.BLUE}⏳ Generando respuesta...{Colors.END}\n")
-        
+            # Contexto dentro del presupuesto de tokens: pasajes + bloques del grafo
+            graph_blocks = graph.get_context_blocks(query, results, max_entities=5)
+            packed = context_builder.build(query, results, graph_blocks)
+            context = packed['context'] or f"La pregunta es: {query}"
+            print(f"{Colors.BLUE}🧮 Contexto: ~{packed['tokens']} tokens "
+                  f"({packed['passages']} pasajes, {packed['graph_blocks']} bloques del grafo){Colors.END}")
+        
+        # 2. Respuesta: caché semántico (pregunta similar con los mismos documentos)
+        #    o Groq en streaming (se imprime a medida que llega)
+        parts = []
         try:
-            response = chat_with_doc(query, context)
+            use_answer_cache = settings.ANSWER_CACHE_ENABLED and bool(results)
+            cached = None
+            if use_answer_cache:
+                fingerprint = self.answer_fingerprint(graph)
+                query_vector = embed_text(query)
+                cached = answer_cache.lookup(query_vector, context, fingerprint)  # Mismo contexto exacto
+            
+            if cached:
+                print(f"\n{Colors.BLUE}♻️  Respuesta de una pregunta similar: \"{cached['query']}\" "
+                      f"(similitud {cached['similarity']:.2f}){Colors.END}\n")
+                deltas = [cached['answer']]
+            else:
+                print(f"\n{Colors.BLUE}⏳ Generando respuesta...{Colors.END}\n")
+                deltas = chat_with_doc_stream(query, context)
+            
+            for delta in deltas:
+                if not parts:
+                    print(f"{Colors.GREEN}{Colors.BOLD}Respuesta:{Colors.END}")
+                    print(Colors.CYAN, end="")
+                parts.append(delta)
+                print(delta, end="", flush=True)
+            response = "".join(parts)
             
-            if response and "Error" not in response:
-                print(f"{Colors.GREEN}{Colors.BOLD}Respuesta:{Colors.END}")
-                print(f"{Colors.CYAN}{response}{Colors.END}\n")
+            if response:
+                print(f"{Colors.END}\n")
                 
                 # Guardar en historial
                 self.history.append((query, response))
+                if use_answer_cache and not cached:
+                    answer_cache.store(query, query_vector, context, response, fingerprint)
                 
                 # Mostrar artículos relevantes
                 if results:
@@ -435,9 +612,11 @@ class CLIChat:
                             print(f"   • {result['article']}")
                     print()
             else:
-                print(f"{Colors.RED}❌ Error: {response}{Colors.END}\n")
+                print(f"{Colors.RED}❌ Error: respuesta vacía del LLM{Colors.END}\n")
         
         except Exception as e:
+            if parts:
+                print(Colors.END)
             print(f"{Colors.RED}❌ Error al generar respuesta: {e}{Colors.END}\n")
     
     def run(self):
@@ -448,7 +627,11 @@ class CLIChat:
         try:
             while True:
                 try:
+                    self.check_finished_jobs()
+                    self.check_graph_events()
                     query = input(f"{Colors.BOLD}{Colors.CYAN}💬 Tu pregunta:{Colors.END} ").strip()
+                    self.check_finished_jobs()
+                    self.check_graph_events()
                     
                     if not query:
                         continue
@@ -459,9 +642,16 @@ class CLIChat:
                     elif query.lower().startswith("cargar "):
                         pdf_path = query[7:].strip()
                         self.load_pdf(pdf_path)
+                    elif query.lower().startswith("cargar-dir "):
+                        dir_path = query[11:].strip()
+                        self.load_pdf_directory(dir_path)
                     elif query.lower().startswith("cargar-grafo "):
                         json_path = query[13:].strip()
                         self.load_json_graph(json_path)
+                    elif query.lower().startswith("activar-grafo"):
+                        self.set_graph_enabled(query[13:].strip(), True)
+                    elif query.lower().startswith("desactivar-grafo"):
+                        self.set_graph_enabled(query[16:].strip(), False)
                     elif query.lower() == "reset-docs":
                         self.reset_documents()
                     elif query.lower() == "reset-grafos":
@@ -470,8 +660,12 @@ class CLIChat:
                         self.print_graph_stats()
                     elif query.lower() == "grafos":
                         self.print_loaded_graphs()
+                    elif query.lower() == "llm":
+                        self.print_llm_stats()
                     elif query.lower() == "historial":
                         self.print_history()
+                    elif query.lower() == "trabajos":
+                        self.print_jobs()
                     elif query.lower() == "docs":
                         self.print_documents()
                     elif query.lower() == "limpiar":
@@ -11,11 +11,15 @@ from pathlib import Path
 # Agregar backend a path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from database.database import SessionLocal
+from database.database import SessionLocal, ensure_schema
 from database.models import Document
-from services.groq_service import embed_text, chat_with_doc
+from services.embeddings import embed_text
+from services.groq_service import chat_with_doc
+from services.llm_errors import LLMError
 from services.rag_service import RAGService
 from services.graph_service import graph_service
+from services.context_builder import context_builder
+from services.entity_annotations import entity_annotations
 from services.agent_service import LegalAgentCodigoTrabajo
 import numpy as np
 
@@ -36,6 +40,7 @@ class CLIChatDebug:
     """Chat interactivo con modo DEBUG verbose"""
     
     def __init__(self):
+        ensure_schema()
         self.db = SessionLocal()
         self.documents = []
         self.history = []
@@ -153,6 +158,7 @@ class CLIChatDebug:
             try:
                 self.db.query(Document).delete()
                 self.db.commit()
+                entity_annotations.clear()
                 self.load_documents()
                 print(f"{Colors.GREEN}✅ Documentos borrados.{Colors.END}\n")
             except Exception as e:
@@ -268,35 +274,34 @@ class CLIChatDebug:
         
         # PASO 4: Extraer contenido
         self.log_step(4, "Extraer snippets de documentos")
-        relevant_docs = self.db.query(Document).all()  # Simplificado para debug
-        print(f"{Colors.DIM}  Documentos disponibles: {len(relevant_docs)}{Colors.END}\n")
+        print(f"{Colors.DIM}  Documentos recuperados: {len(results)}{Colors.END}\n")
         
-        if relevant_docs:
-            for doc in relevant_docs[:3]:
-                snippet = doc.content[:100] + "..." if len(doc.content) > 100 else doc.content
-                print(f"    • Art.{doc.article_number}: {snippet}")
+        for result in results[:3]:
+            text = result.get('text', '')
+            snippet = text[:100] + "..." if len(text) > 100 else text
+            print(f"    • Art.{result.get('article') or 'N/A'}: {snippet}")
         print()
         
-        # PASO 5: Construir contexto
-        self.log_step(5, "Construir contexto para el LLM")
-        context_parts = []
-        
-        for doc in relevant_docs[:3]:
-            context_parts.append(f"[Art.{doc.article_number}] {doc.content[:300]}")
-        
-        context = "\n\n".join(context_parts) if context_parts else f"La pregunta es: {query}"
+        # PASO 5: Bloques del grafo (si disponible)
+        graph_blocks = []
+        if graph_service.is_loaded:
+            self.log_step(5, "Enriquecimiento con Grafo de Conocimiento")
+            graph_blocks = graph_service.get_context_blocks(query, results[:3], max_entities=3)
+            print(f"{Colors.DIM}  Bloques de grafo encontrados: {len(graph_blocks)}{Colors.END}\n")
+        
+        # PASO 6: Construir contexto dentro del presupuesto de tokens
+        self.log_step(6, "Construir contexto para el LLM")
+        packed = context_builder.build(query, results, graph_blocks)
+        context = packed['context'] or f"La pregunta es: {query}"
         context_preview = context[:200] + "..." if len(context) > 200 else context
         self.log_data("Contexto construido", context_preview, indent=1)
-        self.log_data("Tamaño del contexto", f"{len(context)} caracteres", indent=1)
-        
-        # PASO 6: Enriquecer con grafo (si disponible)
-        if graph_service.is_loaded:
-            self.log_step(6, "Enriquecimiento con Grafo de Conocimiento")
-            graph_context = graph_service.enrich_context(query, results[:3], max_entities=3)
-            if graph_context:
-                print(f"{Colors.DIM}  Contexto de grafo añadido:{Colors.END}")
-                print(f"{Colors.DIM}  {graph_context[:150]}...{Colors.END}\n")
-                context += "\n" + graph_context
+        self.log_data("Tamaño del contexto",
+                      f"~{packed['tokens']} tokens / {context_builder.token_budget} "
+                      f"({len(context)} caracteres)", indent=1)
+        self.log_data("Empaquetado",
+                      f"{packed['passages']} pasajes ({packed['truncated']} recortados, "
+                      f"{packed['dropped']} descartados), {packed['graph_blocks']} bloques del grafo",
+                      indent=1)
         
         # PASO 7: Llamar al LLM
         self.log_step(7, "Llamar y procesar respuesta del LLM")
@@ -305,7 +310,7 @@ class CLIChatDebug:
         try:
             response = chat_with_doc(query, context)
             
-            if response and "Error" not in response:
+            if response:
                 self.log_section("RESPUESTA GENERADA")
                 print(f"{Colors.CYAN}{response}{Colors.END}\n")
                 
@@ -324,8 +329,10 @@ class CLIChatDebug:
                 self.history.append((query, response))
                 
             else:
-                print(f"{Colors.RED}❌ Error al generar respuesta: {response}{Colors.END}\n")
+                print(f"{Colors.RED}❌ Error al generar respuesta: respuesta vacía{Colors.END}\n")
         
+        except LLMError as e:
+            print(f"{Colors.RED}❌ Error en LLM ({type(e).__name__}): {str(e)}{Colors.END}\n")
         except Exception as e:
             print(f"{Colors.RED}❌ Error en LLM: {str(e)}{Colors.END}\n")
     
@@ -22,6 +22,57 @@ class Settings:
     GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
     GROQ_CHAT_MODEL = "llama-3.3-70b-versatile"
     
+    # Backend del LLM: groq | openai (servidor compatible, ej: llm_stub_server.py) | record | replay
+    LLM_BACKEND = os.getenv("LLM_BACKEND", "groq")
+    LLM_BASE_URL = os.getenv("LLM_BASE_URL", "http://127.0.0.1:8765/v1")
+    LLM_RECORD_PATH = Path(os.getenv("LLM_RECORD_PATH", str(DATABASE_DIR / "llm_recordings.jsonl")))
+    LLM_RECORD_BACKEND = os.getenv("LLM_RECORD_BACKEND", "groq")  # Backend real que se graba
+    
+    # Caché de respuestas del LLM (LLM_CACHE=0 lo desactiva)
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+    LLM_CACHE_PATH = DATABASE_DIR / "llm_cache.db"
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+    LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "50"))
+    LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "0")) or None  # 0 = sin expiración
+    
+    # Límites de la API del LLM (cuota de la cuenta Groq)
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+    LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))
+    LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "12000"))
+    LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "5"))
+    
+    # Reintentos ante 5xx/timeouts y circuit breaker
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+    LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "20"))
+    LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+    LLM_CIRCUIT_RESET_SECONDS = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+
+    # Caché semántico de respuestas (ANSWER_CACHE=1 lo activa): misma respuesta para
+    # preguntas similares que arman exactamente el mismo contexto. Desactivado por defecto:
+    # con los embeddings sintéticos una negación casi no cambia la similitud
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "0") != "0"
+    ANSWER_CACHE_PATH = DATABASE_DIR / "answer_cache.db"
+    ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+    ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+
+    # Contexto enviado al LLM (tokens aproximados; el grafo sale del mismo presupuesto)
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "900"))
+    CONTEXT_GRAPH_TOKEN_BUDGET = int(os.getenv("CONTEXT_GRAPH_TOKEN_BUDGET", "250"))
+    CONTEXT_MAX_PASSAGE_TOKENS = int(os.getenv("CONTEXT_MAX_PASSAGE_TOKENS", "300"))
+
+    # Grafo: vecindarios k-hop memoizados (LRU) para el reranking
+    GRAPH_NEIGHBOURHOOD_CACHE_SIZE = int(os.getenv("GRAPH_NEIGHBOURHOOD_CACHE_SIZE", "4096"))
+
+    # Grafo: método de reranking ("overlap" = entidades en común, "pagerank" = PageRank personalizado)
+    GRAPH_RERANK_METHOD = os.getenv("GRAPH_RERANK_METHOD", "pagerank")
+    GRAPH_PAGERANK_DAMPING = float(os.getenv("GRAPH_PAGERANK_DAMPING", "0.85"))
+    GRAPH_PAGERANK_MAX_ITERATIONS = int(os.getenv("GRAPH_PAGERANK_MAX_ITERATIONS", "30"))
+    GRAPH_PAGERANK_CACHE_SIZE = int(os.getenv("GRAPH_PAGERANK_CACHE_SIZE", "256"))  # Vectores por conjunto de semillas
+
+    # Grafo: cada cuántos segundos se revisa si cambiaron los archivos cargados (0 = no vigilar)
+    GRAPH_WATCH_INTERVAL_SECONDS = float(os.getenv("GRAPH_WATCH_INTERVAL_SECONDS", "2"))
+    
     # Seguridad
     SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key-change-in-production")
     ALGORITHM = "HS256"
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Conversión entre el JSON de un grafo y su snapshot binario (.npz)
+
+El snapshot se carga mapeado en memoria, sin parsear el JSON ni resolver
+edges (ver services/graph_snapshot.py). El CLI y el agente lo usan en lugar
+del JSON cuando existe y corresponde al contenido actual del JSON.
+
+Uso:
+    python convert_graph.py grafo.json                     # → grafo.npz
+    python convert_graph.py a_graph.json b_graph.json      # varios a la vez
+    python convert_graph.py grafo.npz --to-json -o grafo.json
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+# Agregar backend a path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from services.graph_snapshot import (
+    GraphSnapshot, SNAPSHOT_SUFFIX, convert_json_to_snapshot, is_snapshot
+)
+
+
+def to_snapshot(json_path: Path, output: str = None) -> bool:
+    start = time.time()
+    try:
+        output_path = convert_json_to_snapshot(str(json_path), output)
+    except Exception as e:
+        print(f"❌ {json_path}: {e}")
+        return False
+    size_kb = output_path.stat().st_size / 1024
+    print(f"💾 Snapshot: {output_path} ({size_kb:.0f} KB, {time.time() - start:.2f}s)")
+    return True
+
+
+def to_json(snapshot_path: Path, output: str = None) -> bool:
+    output_path = Path(output) if output else snapshot_path.with_suffix(".json")
+    try:
+        document = GraphSnapshot(str(snapshot_path)).to_document()
+    except Exception as e:
+        print(f"❌ {snapshot_path}: {e}")
+        return False
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, ensure_ascii=False, indent=2)
+    print(f"💾 Grafo guardado: {output_path} ({len(document['nodes'])} nodos, "
+          f"{len(document['edges'])} relaciones)")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compilar grafos JSON a snapshots .npz (o exportar un snapshot a JSON)"
+    )
+    parser.add_argument("paths", nargs="+", help="Grafos JSON (o snapshots con --to-json)")
+    parser.add_argument(
+        "--to-json",
+        action="store_true",
+        help="Exportar snapshots .npz al formato JSON de intercambio"
+    )
+    parser.add_argument(
+        "-o", "--output",
+        default=None,
+        help="Ruta de salida (solo con un archivo de entrada)"
+    )
+
+    args = parser.parse_args()
+
+    if args.output and len(args.paths) > 1:
+        print("❌ Error: --output solo se puede usar con un archivo")
+        sys.exit(1)
+
+    ok = True
+    for path in map(Path, args.paths):
+        if not path.exists():
+            print(f"❌ Archivo no encontrado: {path}")
+            ok = False
+            continue
+
+        if args.to_json:
+            if not is_snapshot(str(path)):
+                print(f"❌ {path}: no es un snapshot {SNAPSHOT_SUFFIX}")
+                ok = False
+                continue
+            ok = to_json(path, args.output) and ok
+        else:
+            ok = to_snapshot(path, args.output) and ok
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
 """
 Capa de acceso a datos
 - database.py: Configuración SQLAlchemy
-- models.py: Modelos ORM (Document, User, ChatHistory)
+- models.py: Modelos ORM (Document, User, ChatHistory, IngestionJob)
 """
-from .database import engine, SessionLocal, Base
+from .database import engine, SessionLocal, Base, ensure_schema
 
-__all__ = ["engine", "SessionLocal", "Base"]
+__all__ = ["engine", "SessionLocal", "Base", "ensure_schema"]
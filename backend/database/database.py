@@ -1,7 +1,7 @@
 """
 Configuración de SQLAlchemy y conexión a base de datos
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 from config.settings import settings
 from pathlib import Path
@@ -25,6 +25,34 @@ SessionLocal = sessionmaker(
 # Base para modelos ORM
 Base = declarative_base()
 
+_schema_ready = set()  # URLs de engines ya verificados
+
+def ensure_schema(bind=None):
+    """
+    Crea las tablas faltantes y agrega a las tablas existentes las columnas
+    nuevas de los modelos (create_all no altera tablas ya creadas en SQLite)
+    
+    bind: engine a verificar (default: engine de la aplicación)
+    """
+    bind = bind or engine
+    if str(bind.url) in _schema_ready:
+        return
+    
+    from database import models  # noqa: F401 - registra los modelos en Base
+    
+    Base.metadata.create_all(bind=bind)
+    inspector = inspect(bind)
+    
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {col['name'] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    col_type = column.type.compile(dialect=bind.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"))
+    
+    _schema_ready.add(str(bind.url))
+
 # Dependency para FastAPI
 def get_db():
     """Dependency injection para obtener sesión de BD"""
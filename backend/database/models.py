@@ -2,7 +2,7 @@
 Modelos ORM (Object-Relational Mapping)
 Definen las tablas en la base de datos
 """
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from database.database import Base
 from datetime import datetime
@@ -31,7 +31,9 @@ class Document(Base):
     source = Column(String(255))  # Ej: "Codigo_del_Trabajo.pdf"
     article_number = Column(String(50), index=True)
     embedding = Column(Text)  # JSON serializado del vector (384 dims)
+    term_counts = Column(Text)  # JSON {término: frecuencia} calculado al ingresar
     chunk_index = Column(Integer, default=0)
+    context = Column(Text)  # JSON: {libro, titulo, capitulo, parrafo} del artículo
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relaciones
@@ -52,3 +54,38 @@ class ChatHistory(Base):
     # Relaciones
     user = relationship("User", back_populates="chat_histories")
     document = relationship("Document", back_populates="chat_histories")
+
+class IngestionJob(Base):
+    """Modelo para trabajos de ingreso de PDFs en segundo plano (con checkpoints)"""
+    __tablename__ = "ingestion_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    pdf_path = Column(String(1024), nullable=False)
+    source = Column(String(255))
+    status = Column(String(20), default="pending", index=True)  # pending/running/completed/failed
+    total_chunks = Column(Integer, default=0)
+    last_chunk_index = Column(Integer, default=-1)  # Último chunk guardado (checkpoint)
+    documents_saved = Column(Integer, default=0)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ChunkAnnotation(Base):
+    """Chunks ya anotados con las entidades de un grafo (identificado por su hash)"""
+    __tablename__ = "chunk_annotations"
+    
+    document_id = Column(Integer, ForeignKey("documents.id"), primary_key=True)
+    graph_hash = Column(String(40), primary_key=True)
+    entity_count = Column(Integer, default=0)
+    content_hash = Column(String(40))  # sha1 del contenido anotado (los ids de documents se reutilizan)
+
+class ChunkEntity(Base):
+    """Incidencia chunk × entidad: qué nodos del grafo menciona cada chunk"""
+    __tablename__ = "chunk_entities"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
+    graph_hash = Column(String(40), nullable=False)
+    node_id = Column(String(64), nullable=False)
+    
+    __table_args__ = (Index("ix_chunk_entities_graph_document", "graph_hash", "document_id"),)
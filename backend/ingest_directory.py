@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Ingreso masivo de PDFs desde un directorio
+
+Extracción, chunking y embeddings corren en paralelo en un pool de procesos;
+un único proceso escritor serializa los INSERT en SQLite.
+
+Uso:
+    python ingest_directory.py documentos/
+    python ingest_directory.py documentos/ --workers 4 --recursive
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+from datetime import timedelta
+
+# Agregar backend a path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from services.rag_service import RAGService
+
+
+def print_progress(done: int, total: int, file_result: dict):
+    """Imprime el avance agregado del ingreso"""
+    pct = int(done / total * 100)
+    if file_result.get('success'):
+        print(f"  [{done}/{total}] {pct:3d}% ✅ {file_result['source']} "
+              f"({file_result['documents_saved']} chunks)")
+    else:
+        print(f"  [{done}/{total}] {pct:3d}% ❌ {file_result['source']}: {file_result.get('error')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Cargar todos los PDFs de un directorio en la BD"
+    )
+    parser.add_argument("directory", help="Directorio con los PDFs")
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=None,
+        help="Procesos worker para extracción y embeddings (default: CPUs)"
+    )
+    parser.add_argument(
+        "--recursive",
+        "-r",
+        action="store_true",
+        help="Buscar PDFs también en subdirectorios"
+    )
+
+    args = parser.parse_args()
+
+    if not Path(args.directory).is_dir():
+        print(f"❌ Error: directorio no encontrado: {args.directory}")
+        sys.exit(1)
+
+    separator = "="*70
+    print("\n" + separator)
+    print("📥 INGRESO MASIVO DE PDFs")
+    print(separator + "\n")
+
+    pdfs = RAGService.find_pdfs(args.directory, recursive=args.recursive)
+    print(f"📚 {len(pdfs)} PDF(s) encontrados en {args.directory}\n")
+
+    start = time.time()
+    result = RAGService.process_directory(
+        args.directory,
+        workers=args.workers,
+        recursive=args.recursive,
+        progress_callback=print_progress
+    )
+    total_td = timedelta(seconds=int(time.time() - start))
+
+    print("\n" + separator)
+    print(result['message'])
+    print(separator)
+    print(f"\n📄 PDFs: {result['files_ok']} ok, {result['files_failed']} con error")
+    print(f"🧩 Chunks: {result['chunks_count']}")
+    print(f"⏱️  Tiempo total: {total_td}\n")
+
+    for error in result['errors']:
+        print(f"  ⚠️  {error}")
+
+    if not result['success']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Servidor LLM local y determinístico (API compatible con OpenAI)
+
+Permite correr el pipeline completo sin Groq (benchmarks, pruebas de carga, CI):
+- POST /v1/chat/completions (normal y stream=True con Server-Sent Events)
+- GET  /v1/models, GET /health
+- Latencia configurable (tiempo hasta el primer token + tokens por segundo)
+- Respuestas fijas por coincidencia de texto (--responses) o generadas
+  de forma determinística a partir del prompt (incluye JSON válido para los
+  prompts de entidades y de títulos por lote de los constructores de grafos)
+- Inyección de fallas: errores 500 y respuestas 429 con retry-after
+
+Uso:
+    python llm_stub_server.py --latency 0.8 --tokens-per-second 200
+    LLM_BACKEND=openai python cli_chat.py
+
+    python llm_stub_server.py --responses respuestas.json --error-rate 0.05
+
+Formato de --responses (se usa la primera regla cuyo "match" aparezca en el prompt):
+    [{"match": "descanso", "response": "El Art. 35 establece..."}]
+"""
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Agregar backend a path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from services.text_utils import tokenize, approx_token_count
+
+
+class StubConfig:
+    """Parámetros del servidor (compartidos por todos los handlers)"""
+
+    def __init__(self, args):
+        self.latency = args.latency
+        self.jitter = args.jitter
+        self.tokens_per_second = args.tokens_per_second
+        self.response_words = args.response_words
+        self.error_rate = args.error_rate
+        self.rate_limit_every = args.rate_limit_every
+        self.retry_after = args.retry_after
+        self.quiet = args.quiet
+        self.rules = self.load_rules(args.responses) if args.responses else []
+        self.rng = random.Random(args.seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    @staticmethod
+    def load_rules(path: str) -> list:
+        with open(path, "r", encoding="utf-8") as f:
+            rules = json.load(f)
+        if isinstance(rules, dict):
+            rules = [{"match": match, "response": response} for match, response in rules.items()]
+        return rules
+
+    def next_request(self) -> tuple:
+        """(número de request, falla a inyectar o None, latencia)"""
+        with self.lock:
+            self.requests += 1
+            number = self.requests
+            failure = None
+            if self.rate_limit_every and number % self.rate_limit_every == 0:
+                failure = 429
+            elif self.error_rate and self.rng.random() < self.error_rate:
+                failure = 500
+            latency = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+        return number, failure, latency
+
+
+def generate_response(messages: list, config: StubConfig) -> str:
+    """Respuesta determinística: misma request → misma respuesta"""
+    prompt = "\n".join(m.get("content", "") for m in messages)
+
+    for rule in config.rules:
+        if rule["match"].lower() in prompt.lower():
+            return rule["response"]
+
+    # Prompt del constructor de grafos: responder JSON válido con entidades del texto
+    if '"entities"' in prompt and '"relations"' in prompt:
+        text = prompt.split("Texto a analizar:", 1)[-1]
+        words = [w for w in tokenize(text) if len(w) > 5]
+        top = [w for w, _ in Counter(words).most_common(5)]
+        entities = [
+            {"id": w, "label": w.capitalize(), "type": "concepto", "description": f"Concepto '{w}' del texto"}
+            for w in top
+        ]
+        relations = [
+            {"source": a, "target": b, "relation": "relacionado_con", "weight": 0.5}
+            for a, b in zip(top, top[1:])
+        ]
+        return json.dumps({"entities": entities, "relations": relations}, ensure_ascii=False)
+
+    # Prompt de títulos por lote: responder {id: título} con las primeras palabras de cada artículo
+    if "Artículos (JSON, clave = número de artículo):" in prompt:
+        block = prompt.split("Artículos (JSON, clave = número de artículo):", 1)[1]
+        block = block.split("RESPONDE SOLO CON UN JSON", 1)[0]
+        try:
+            previews = json.loads(block)
+        except ValueError:
+            previews = {}
+        titles = {
+            article_id: " ".join(tokenize(preview)[:6]).capitalize() or f"Artículo {article_id}"
+            for article_id, preview in previews.items()
+        }
+        return json.dumps(titles, ensure_ascii=False)
+
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    words = tokenize(messages[-1].get("content", "") if messages else "") or ["respuesta"]
+    offset = int(digest[:8], 16)
+    body = " ".join(words[(offset + i) % len(words)] for i in range(config.response_words))
+    return f"Respuesta simulada {digest[:8]}: {body}."
+
+
+def split_stream_chunks(text: str) -> list:
+    """Trozos tipo token (palabra + espacio) para el modo stream"""
+    parts = text.split(" ")
+    return [part + (" " if i < len(parts) - 1 else "") for i, part in enumerate(parts)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Handler HTTP compatible con /v1/chat/completions"""
+
+    protocol_version = "HTTP/1.1"
+    config: StubConfig = None
+
+    def log_message(self, format, *args):
+        if not self.config.quiet:
+            super().log_message(format, *args)
+
+    def send_json(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, data: str):
+        """Escribe un trozo con Transfer-Encoding: chunked"""
+        raw = data.encode("utf-8")
+        self.wfile.write(f"{len(raw):X}\r\n".encode("ascii") + raw + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path in ("/health", "/v1/health"):
+            self.send_json(200, {"status": "ok", "requests": self.config.requests})
+        elif self.path == "/v1/models":
+            self.send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+        else:
+            self.send_json(404, {"error": {"message": f"Ruta no encontrada: {self.path}"}})
+
+    def do_POST(self):
+        if self.path not in ("/v1/chat/completions", "/chat/completions"):
+            self.send_json(404, {"error": {"message": f"Ruta no encontrada: {self.path}"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+            messages = request["messages"]
+        except (ValueError, KeyError):
+            self.send_json(400, {"error": {"message": "JSON inválido o sin 'messages'"}})
+            return
+
+        number, failure, latency = self.config.next_request()
+        if failure == 429:
+            self.send_json(429, {"error": {"message": "Rate limit (simulado)"}},
+                           {"retry-after": str(self.config.retry_after)})
+            return
+        if failure == 500:
+            time.sleep(latency)
+            self.send_json(500, {"error": {"message": "Error interno (simulado)"}})
+            return
+
+        text = generate_response(messages, self.config)
+        max_tokens = int(request.get("max_tokens") or 0)
+        if max_tokens:
+            # Recortar aproximadamente a max_tokens (~4 caracteres por token)
+            text = text[:max_tokens * 4]
+
+        prompt_tokens = sum(approx_token_count(m.get("content", "")) for m in messages)
+        completion_tokens = approx_token_count(text)
+        model = request.get("model", "stub")
+        completion_id = f"chatcmpl-stub-{number}"
+
+        # Tiempo hasta el primer token
+        time.sleep(latency)
+
+        if request.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            delay = 1.0 / self.config.tokens_per_second if self.config.tokens_per_second else 0.0
+            for piece in split_stream_chunks(text):
+                event = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+                }
+                self.write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n")
+                if delay:
+                    time.sleep(delay)
+            self.write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            return
+
+        if self.config.tokens_per_second:
+            time.sleep(completion_tokens / self.config.tokens_per_second)
+
+        self.send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Servidor LLM local compatible con OpenAI (para pruebas y benchmarks offline)"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Host (default: 127.0.0.1)")
+    parser.add_argument("--port", "-p", type=int, default=8765, help="Puerto (default: 8765)")
+    parser.add_argument("--latency", type=float, default=0.5,
+                        help="Segundos hasta el primer token (default: 0.5)")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="Variación aleatoria ± de la latencia en segundos (default: 0)")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0,
+                        help="Velocidad de generación; 0 = instantánea (default: 0)")
+    parser.add_argument("--response-words", type=int, default=60,
+                        help="Palabras de las respuestas generadas (default: 60)")
+    parser.add_argument("--responses", help="JSON con respuestas fijas [{match, response}]")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fracción de requests que responden 500 (default: 0)")
+    parser.add_argument("--rate-limit-every", type=int, default=0,
+                        help="Cada N requests responder 429 (default: 0 = nunca)")
+    parser.add_argument("--retry-after", type=float, default=1.0,
+                        help="retry-after de los 429 simulados en segundos (default: 1)")
+    parser.add_argument("--seed", type=int, default=42, help="Semilla de jitter y fallas (default: 42)")
+    parser.add_argument("--quiet", "-q", action="store_true", help="No loguear cada request")
+
+    args = parser.parse_args()
+
+    StubHandler.config = StubConfig(args)
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.daemon_threads = True
+
+    print(f"🧪 Stub LLM escuchando en http://{args.host}:{args.port}/v1")
+    print(f"   Latencia: {args.latency}s ±{args.jitter}s | Tokens/s: {args.tokens_per_second or '∞'} | "
+          f"Errores: {args.error_rate:.0%} | 429 cada: {args.rate_limit_every or '-'}")
+    print(f"   Usar con: LLM_BACKEND=openai LLM_BASE_URL=http://{args.host}:{args.port}/v1\n")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Stub detenido")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,14 +8,16 @@ import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from database.database import SessionLocal, engine, Base
+from database.database import SessionLocal, engine, Base, ensure_schema
 from database.models import Document, ChatHistory
+from services.entity_annotations import entity_annotations
 from sqlalchemy import text
 
 print("\n" + "="*70)
 print("🧹 LIMPIADOR DE BASE DE DATOS")
 print("="*70 + "\n")
 
+ensure_schema()
 db = SessionLocal()
 
 try:
@@ -38,6 +40,7 @@ try:
         db.query(Document).delete()
         db.query(ChatHistory).delete()
         db.commit()
+        entity_annotations.clear()
         print(f"✅ Eliminados {count} documentos\n")
     
     elif choice == "2":
@@ -49,6 +52,7 @@ try:
         ).delete()
         db.query(ChatHistory).delete()
         db.commit()
+        entity_annotations.prune()
         count_after = db.query(Document).count()
         print(f"✅ Eliminados {count_before - count_after} documentos")
         print(f"✅ {count_after} documentos del PDF mantienen\n")
@@ -60,6 +64,7 @@ try:
             db.query(ChatHistory).delete()
             db.query(Document).delete()
             db.commit()
+            entity_annotations.clear()
             print("✅ BD limpia y lista para usar\n")
         else:
             print("❌ Cancelado\n")
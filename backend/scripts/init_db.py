@@ -4,9 +4,9 @@ Uso: python -m scripts.init_db
 """
 import json
 from pathlib import Path
-from database.database import engine, SessionLocal, Base
+from database.database import engine, SessionLocal, Base, ensure_schema
 from database.models import User, Document
-from services.groq_service import embed_text
+from services.embeddings import embed_text
 import hashlib
 
 def hash_password_simple(password: str) -> str:
@@ -17,7 +17,7 @@ def init_db():
     """Crear tablas e insertar datos de prueba"""
     
     print("🔄 Creando base de datos...")
-    Base.metadata.create_all(bind=engine)
+    ensure_schema()
     print("✅ Tablas creadas\n")
     
     db = SessionLocal()
@@ -1,9 +1,18 @@
 """
 Servicios de negocio
-- groq_service: Integración con Groq API (embeddings y chat)
+- embeddings: Embeddings sintéticos locales (sin API)
+- groq_service: Integración con Groq API (chat)
 - rag_service: Retrieval Augmented Generation
 - auth_service: Autenticación JWT
 """
-from .groq_service import embed_text, chat_with_doc
+from .embeddings import embed_text
 
 __all__ = ["embed_text", "chat_with_doc"]
+
+
+def __getattr__(name):
+    # chat_with_doc se importa recién al usarlo: importar `services` no carga el SDK de Groq
+    if name == "chat_with_doc":
+        from .groq_service import chat_with_doc
+        return chat_with_doc
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -18,12 +18,13 @@ Capacidades:
 import sys
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
-import json
 import re
 
 sys.path.insert(0, str(Path(__file__).parent))
 
 from services import groq_service
+from services.text_utils import normalize_text
+from services.graph_snapshot import load_graph_document, preferred_graph_path
 
 
 class LegalAgentCodigoTrabajo:
@@ -149,6 +150,15 @@ class LegalAgentCodigoTrabajo:
         "trabajar": "prestación de servicios",
     }
     
+    # Keywords importantes para búsqueda RAG adicional
+    SPECIFIC_KEYWORDS = [
+        "vestuario", "uniforme", "implementos", "ropa de trabajo",
+        "equipo de protección", "acto preparatorio", "cambio de ropa",
+        "marcar hora", "reloj control", "protección personal",
+        "jornada", "contrato", "remuneración", "sindicato",
+        "despido", "terminación", "licencia", "maternidad"
+    ]
+    
     def __init__(self, articles_graph_path: str = None):
         """
         Inicializa el agente
@@ -159,14 +169,18 @@ class LegalAgentCodigoTrabajo:
         self.articles_graph = {}
         self.articles_by_number = {}
         
+        # Keywords normalizadas una sola vez (mismo tokenizador que la query)
+        self._topic_keys = [(normalize_text(k), k) for k in self.TOPIC_TO_ARTICLES]
+        self._synonym_keys = [(normalize_text(k), v) for k, v in self.LEGAL_SYNONYMS.items()]
+        self._specific_keys = [(normalize_text(k), k) for k in self.SPECIFIC_KEYWORDS]
+        
         if articles_graph_path and Path(articles_graph_path).exists():
             self._load_articles_graph(articles_graph_path)
     
     def _load_articles_graph(self, path: str):
-        """Carga el grafo de artículos del JSON"""
+        """Carga el grafo de artículos del JSON (o de su snapshot .npz si está al día)"""
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                self.articles_graph = json.load(f)
+            self.articles_graph = load_graph_document(preferred_graph_path(path))
             
             # Construir índice por número
             for node in self.articles_graph.get("nodes", []):
@@ -179,13 +193,11 @@ class LegalAgentCodigoTrabajo:
     
     def normalize_input(self, user_query: str) -> str:
         """
-        Normaliza la query del usuario - SOLO lowercase y cleanup
+        Normaliza la query del usuario - minúsculas, sin acentos ni puntuación
         
         No modifica la query, apenas la prepara para análisis
         """
-        # Solo lowercase y trim
-        query = user_query.lower().strip()
-        return query
+        return normalize_text(user_query)
     
     def extract_topics(self, user_query: str) -> List[str]:
         """
@@ -198,14 +210,14 @@ class LegalAgentCodigoTrabajo:
         topics = []
         
         # Búsqueda simple por keywords - sin modificar query
-        for topic_keyword in self.TOPIC_TO_ARTICLES.keys():
-            if topic_keyword in normalized:
+        for topic_norm, topic_keyword in self._topic_keys:
+            if topic_norm in normalized:
                 topics.append(topic_keyword)
         
         # También buscar por sinónimos (mapeo inverso)
         # Si encontramos un sinónimo, agregamos su reemplazo como tópico
-        for synonym, replacement in self.LEGAL_SYNONYMS.items():
-            if synonym in normalized and replacement not in topics:
+        for synonym_norm, replacement in self._synonym_keys:
+            if synonym_norm in normalized and replacement not in topics:
                 # Verificar que el reemplazo es un tópico válido
                 if replacement in self.TOPIC_TO_ARTICLES:
                     topics.append(replacement)
@@ -219,20 +231,11 @@ class LegalAgentCodigoTrabajo:
         Ej: "vestiario" detecta exactamente ese término
         Retorna lista de keywords específicos detectados
         """
-        lower_query = user_query.lower()
+        normalized = self.normalize_input(user_query)
         specific_keywords = []
         
-        # Keywords importantes para búsqueda
-        important_keywords = [
-            "vestuario", "uniforme", "implementos", "ropa de trabajo",
-            "equipo de protección", "acto preparatorio", "cambio de ropa",
-            "marcar hora", "reloj control", "protección personal",
-            "jornada", "contrato", "remuneración", "sindicato",
-            "despido", "terminación", "licencia", "maternidad"
-        ]
-        
-        for keyword in important_keywords:
-            if keyword in lower_query:
+        for keyword_norm, keyword in self._specific_keys:
+            if keyword_norm in normalized:
                 specific_keywords.append(keyword)
         
         return specific_keywords
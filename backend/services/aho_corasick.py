@@ -0,0 +1,92 @@
+"""
+Autómata Aho–Corasick para buscar muchos patrones a la vez
+
+Encuentra todas las apariciones (como substring) de un conjunto de patrones
+en una sola pasada lineal sobre el texto: el costo depende del largo del
+texto y de las coincidencias, no de la cantidad de patrones.
+
+Lo usa GraphService para detectar los labels del grafo mencionados en un texto.
+Con pocos patrones, hacer una búsqueda `in` (en C) por patrón es más rápido que
+recorrer el texto carácter a carácter en Python: bajo DIRECT_SEARCH_MAX_PATTERNS
+se usa esa estrategia (mismo resultado).
+"""
+from collections import deque
+from typing import Iterable, List, Set
+
+
+# Cruce medido con los textos del Código del Trabajo (~1 ms por chunk con el autómata)
+DIRECT_SEARCH_MAX_PATTERNS = 150
+
+
+class AhoCorasick:
+    """Autómata compilado sobre una lista de patrones (se identifican por su posición)"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = list(patterns)
+        self._goto = [{}]   # Transiciones del trie por estado
+        self._fail = [0]    # Estado al que se cae cuando no hay transición
+        self._out = [()]    # Patrones que terminan en cada estado (incluye los de la cadena de fallas)
+        self._empty = tuple(i for i, pattern in enumerate(self.patterns) if not pattern)
+        self._build()
+
+    def _build(self):
+        goto, out = self._goto, self._out
+
+        # 1. Trie con todos los patrones
+        terminal = {}
+        for index, pattern in enumerate(self.patterns):
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    out.append(())
+                state = next_state
+            terminal.setdefault(state, []).append(index)
+
+        self._fail = [0] * len(goto)
+        fail = self._fail
+        for state, indexes in terminal.items():
+            out[state] = tuple(indexes)
+
+        # 2. Links de falla por BFS (el sufijo propio más largo que también es prefijo)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in goto[state].items():
+                queue.append(child)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[child] = goto[fallback].get(char, 0)
+                if out[fail[child]]:
+                    out[child] = out[child] + out[fail[child]]
+
+    def find_all(self, text: str) -> Set[int]:
+        """Índices de los patrones que aparecen en el texto (al menos una vez)"""
+        if len(self.patterns) <= DIRECT_SEARCH_MAX_PATTERNS:
+            return {i for i, pattern in enumerate(self.patterns) if pattern in text}
+
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set(self._empty)
+        state = 0
+        for char in text:
+            next_state = goto[state].get(char)
+            while next_state is None and state:
+                state = fail[state]
+                next_state = goto[state].get(char)
+            state = next_state or 0
+            if out[state]:
+                found.update(out[state])
+        return found
+
+    def find_patterns(self, text: str) -> List[str]:
+        """Patrones que aparecen en el texto, en el orden de la lista original"""
+        return [self.patterns[i] for i in sorted(self.find_all(text))]
+
+    def __len__(self) -> int:
+        return len(self.patterns)
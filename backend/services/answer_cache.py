@@ -0,0 +1,236 @@
+"""
+Caché semántico de respuestas (preguntas casi duplicadas)
+
+"¿cuántas horas extra puedo hacer?" y "cuantas horas extraordinarias se permiten"
+no comparten la clave exacta del caché del LLM, pero pueden armar el mismo
+contexto y merecer la misma respuesta. Este caché devuelve una respuesta
+guardada cuando:
+1. El contexto enviado al LLM (pasajes + bloques del grafo) es exactamente el
+   mismo: se compara su hash, no los artículos, porque dos chunks del mismo
+   artículo (o el mismo número de artículo en otro PDF) dan contextos distintos, y
+2. El embedding de la pregunta tiene similitud coseno >= threshold con la
+   pregunta guardada.
+
+Con los embeddings sintéticos (bolsa de palabras) una negación casi no mueve la
+similitud ("tengo" / "no tengo" vacaciones ≈ 0.87): el umbral tiene que ser
+alto, y el caché viene desactivado por defecto (ANSWER_CACHE=1 lo activa).
+
+Índice: las entradas se agrupan por contexto; cada grupo tiene una matriz con
+sus vectores, así una búsqueda es un lookup por clave + un producto
+matriz-vector sobre unas pocas filas.
+
+Invalidación: cada entrada queda asociada a la huella del corpus (documentos,
+grafo, modelo); si la huella cambia, el caché se vacía.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+from config.settings import settings
+
+
+class AnswerCache:
+    """Respuestas indexadas por embedding de la pregunta + hash del contexto"""
+
+    def __init__(self,
+                 db_path: str,
+                 threshold: float = 0.95,
+                 max_entries: int = 2000):
+        self.db_path = str(db_path)
+        self.threshold = threshold
+        self.max_entries = max_entries
+
+        self._conn = None
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        # {retrieval_key: {'ids': [row ids], 'answers': [...], 'queries': [...], 'matrix': ndarray}}
+        self._buckets = {}
+        self._entries = 0
+        self._stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0, 'invalidations': 0}
+
+    @staticmethod
+    def context_key(context: str) -> str:
+        """Clave del contexto enviado al LLM"""
+        return hashlib.sha1(context.encode('utf-8')).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Abre la BD y carga el índice en el primer uso"""
+        if self._conn is None:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS answer_cache (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    retrieval_key TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    answer TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_answer_cache_access ON answer_cache(last_access)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS answer_cache_meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.commit()
+
+            row = self._conn.execute(
+                "SELECT value FROM answer_cache_meta WHERE key = 'fingerprint'"
+            ).fetchone()
+            self._fingerprint = row[0] if row else None
+            self._load_index()
+        return self._conn
+
+    def _load_index(self):
+        """Reconstruye los grupos en memoria desde SQLite"""
+        self._buckets = {}
+        rows = self._conn.execute(
+            "SELECT id, retrieval_key, query, vector, answer FROM answer_cache ORDER BY id"
+        ).fetchall()
+        for row_id, key, query, vector, answer in rows:
+            self._add_to_index(row_id, key, query, np.frombuffer(vector, dtype=np.float32), answer)
+        self._entries = len(rows)
+
+    def _add_to_index(self, row_id: int, key: str, query: str, vector: np.ndarray, answer: str):
+        bucket = self._buckets.setdefault(key, {'ids': [], 'queries': [], 'answers': [], 'matrix': None})
+        bucket['ids'].append(row_id)
+        bucket['queries'].append(query)
+        bucket['answers'].append(answer)
+        row = vector.reshape(1, -1)
+        bucket['matrix'] = row if bucket['matrix'] is None else np.vstack([bucket['matrix'], row])
+
+    def _remove_from_index(self, row_ids: set):
+        for key in list(self._buckets):
+            bucket = self._buckets[key]
+            keep = [i for i, row_id in enumerate(bucket['ids']) if row_id not in row_ids]
+            if len(keep) == len(bucket['ids']):
+                continue
+            if not keep:
+                del self._buckets[key]
+                continue
+            bucket['ids'] = [bucket['ids'][i] for i in keep]
+            bucket['queries'] = [bucket['queries'][i] for i in keep]
+            bucket['answers'] = [bucket['answers'][i] for i in keep]
+            bucket['matrix'] = bucket['matrix'][keep]
+
+    def _check_fingerprint(self, fingerprint: str):
+        """Vacía el caché si cambió el corpus (documentos, grafo o modelo)"""
+        if fingerprint == self._fingerprint:
+            return
+        if self._entries:
+            self._conn.execute("DELETE FROM answer_cache")
+            self._stats['invalidations'] += 1
+        self._conn.execute(
+            "INSERT OR REPLACE INTO answer_cache_meta (key, value) VALUES ('fingerprint', ?)", (fingerprint,)
+        )
+        self._conn.commit()
+        self._buckets = {}
+        self._entries = 0
+        self._fingerprint = fingerprint
+
+    def lookup(self, query_vector, context: str, fingerprint: str) -> Optional[Dict]:
+        """
+        Respuesta de una pregunta similar con el mismo contexto
+
+        Retorna: {'answer', 'query', 'similarity'} o None
+        """
+        key = self.context_key(context)
+        vector = np.asarray(query_vector, dtype=np.float32)
+
+        with self._lock:
+            conn = self._connect()
+            self._check_fingerprint(fingerprint)
+
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                self._stats['misses'] += 1
+                return None
+
+            similarities = bucket['matrix'] @ vector
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self._stats['misses'] += 1
+                return None
+
+            conn.execute("UPDATE answer_cache SET last_access = ? WHERE id = ?", (time.time(), bucket['ids'][best]))
+            conn.commit()
+            self._stats['hits'] += 1
+            return {
+                'answer': bucket['answers'][best],
+                'query': bucket['queries'][best],
+                'similarity': similarity
+            }
+
+    def store(self, query: str, query_vector, context: str, answer: str, fingerprint: str):
+        """Guarda la respuesta de una pregunta y aplica la evicción LRU"""
+        if not answer:
+            return
+        key = self.context_key(context)
+        vector = np.asarray(query_vector, dtype=np.float32)
+        now = time.time()
+
+        with self._lock:
+            conn = self._connect()
+            self._check_fingerprint(fingerprint)
+
+            bucket = self._buckets.get(key)
+            if bucket is not None and float(np.max(bucket['matrix'] @ vector)) >= 0.999:
+                return  # La misma pregunta ya está guardada
+
+            cursor = conn.execute(
+                "INSERT INTO answer_cache (retrieval_key, query, vector, answer, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, query, vector.tobytes(), answer, now, now)
+            )
+            self._add_to_index(cursor.lastrowid, key, query, vector, answer)
+            self._entries += 1
+            self._stats['writes'] += 1
+
+            excess = self._entries - self.max_entries
+            if excess > 0:
+                rows = conn.execute(
+                    "SELECT id FROM answer_cache ORDER BY last_access LIMIT ?", (excess,)
+                ).fetchall()
+                evicted = {row_id for (row_id,) in rows}
+                conn.executemany("DELETE FROM answer_cache WHERE id = ?", [(row_id,) for row_id in evicted])
+                self._remove_from_index(evicted)
+                self._entries -= len(evicted)
+                self._stats['evictions'] += len(evicted)
+            conn.commit()
+
+    def clear(self):
+        """Vacía el caché (memoria y disco)"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM answer_cache")
+            conn.commit()
+            self._buckets = {}
+            self._entries = 0
+
+    def get_stats(self) -> Dict:
+        """Estadísticas del caché"""
+        with self._lock:
+            if self._conn is None and Path(self.db_path).exists():
+                self._connect()
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'hit_rate': self._stats['hits'] / lookups if lookups else 0.0,
+                'entries': self._entries,
+                'groups': len(self._buckets),
+                'max_entries': self.max_entries,
+                'threshold': self.threshold
+            }
+
+
+answer_cache = AnswerCache(
+    settings.ANSWER_CACHE_PATH,
+    threshold=settings.ANSWER_CACHE_SIMILARITY,
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES
+)
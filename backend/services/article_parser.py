@@ -0,0 +1,85 @@
+"""
+Parser de artículos del Código del Trabajo
+- Detecta los límites de cada artículo (Art. 1°, Art. 15 bis, etc.)
+- Asigna el contexto jerárquico vigente (Libro, Título, Capítulo, Párrafo)
+
+Compartido por el chunker por artículos de RAGService y por ArticleGraphBuilder,
+para que ambos usen exactamente el mismo parseo.
+"""
+import re
+from bisect import bisect_right
+from typing import Dict, List
+
+# Patrones para detectar estructura
+LIBRO_PATTERN = re.compile(r'(?:^|\n)\s*(?:LIBRO|Libro)\s+([IVX]+|[A-Z]+).*?(?:$|\n)', re.MULTILINE | re.IGNORECASE)
+TITULO_PATTERN = re.compile(r'(?:^|\n)\s*(?:TÍTULO|Título)\s+([IVX]+|[A-Z]+).*?(?:$|\n)', re.MULTILINE | re.IGNORECASE)
+CAPITULO_PATTERN = re.compile(r'(?:^|\n)\s*(?:CAPÍTULO|Capítulo)\s+([IVX]+|[A-Z]+).*?(?:$|\n)', re.MULTILINE | re.IGNORECASE)
+PARRAFO_PATTERN = re.compile(r'(?:^|\n)\s*(?:Párrafo|PÁRRAFO)\s+([0-9°º]+).*?(?:$|\n)', re.MULTILINE | re.IGNORECASE)
+
+# Patrón para artículos: "Art. 1°", "Art. 15 bis", "Art. 25 ter", etc.
+# Captura: Art. [número][opcional sufijo como bis/ter]
+ARTICLE_PATTERN = re.compile(
+    r'(?:^|\n)\s*(?:Art\.?|ARTÍCULO)\s+(\d+)\s*(?:(bis|ter|quáter|bis\s+A|bis\s+B))?\s*[.—\-]?\s*(.+?)(?=(?:\n\s*(?:Art\.?|ARTÍCULO)\s+\d+|$))',
+    re.MULTILINE | re.DOTALL
+)
+
+CONTEXT_PATTERNS = (
+    ('libro', LIBRO_PATTERN),
+    ('titulo', TITULO_PATTERN),
+    ('capitulo', CAPITULO_PATTERN),
+)
+
+
+def parse_articles(text: str) -> List[Dict]:
+    """
+    Extrae los artículos del texto en orden de aparición
+
+    Retorna: [{id, numeric, content, start, end, context}, ...]
+    - start/end: límites del artículo en el texto (hasta el inicio del siguiente)
+    - context: {libro, titulo, capitulo, parrafo} vigente al inicio del artículo
+    """
+    # Construir mapa de posiciones para contexto
+    context_positions = {}
+    for ctx_type, pattern in CONTEXT_PATTERNS:
+        for match in pattern.finditer(text):
+            context_positions[match.start()] = (ctx_type, match.group(1))
+
+    sorted_positions = sorted(context_positions)
+    context_stack = {
+        "libro": None,
+        "titulo": None,
+        "capitulo": None,
+        "parrafo": None
+    }
+
+    articles = []
+    for match in ARTICLE_PATTERN.finditer(text):
+        article_num = match.group(1)
+        suffix = match.group(2) or ""
+
+        # Normalizar número
+        if suffix:
+            article_id = f"{article_num} {suffix}".replace("\n", " ").strip()
+        else:
+            article_id = article_num
+
+        # Actualizar contexto con el marcador más cercano anterior al artículo
+        idx = bisect_right(sorted_positions, match.start()) - 1
+        if idx >= 0:
+            ctx_type, ctx_value = context_positions[sorted_positions[idx]]
+            context_stack[ctx_type] = ctx_value
+
+        articles.append({
+            "id": article_id,
+            "numeric": article_num,
+            "content": match.group(3).strip(),
+            "start": match.start(),
+            "end": len(text),
+            "context": dict(context_stack)
+        })
+
+    # Cada artículo se extiende hasta el inicio del siguiente
+    for current, following in zip(articles, articles[1:]):
+        current["end"] = following["start"]
+
+    return articles
@@ -0,0 +1,261 @@
+"""
+Construcción del contexto que se envía al LLM con presupuesto de tokens
+
+Los tokens del prompt determinan la latencia y el costo de cada llamada.
+El constructor:
+- Cuenta tokens con el estimador local (approx_token_count)
+- Quita ruido del PDF: marcas "--- Página N ---", encabezados de página
+  ("Dirección Del Trabajo  LIBRO I ...") y títulos repetidos entre pasajes
+- Descarta oraciones ya incluidas (los chunks se solapan CHUNK_OVERLAP caracteres)
+- Empaqueta los pasajes por score hasta CONTEXT_TOKEN_BUDGET (cada uno con a lo
+  sumo CONTEXT_MAX_PASSAGE_TOKENS); si un pasaje no cabe entero, conserva las oraciones con más términos de la query (en su orden)
+- Limita los bloques del grafo a CONTEXT_GRAPH_TOKEN_BUDGET
+"""
+import re
+from typing import Dict, List, Optional
+
+from config.settings import settings
+from services.text_utils import approx_token_count, normalize_text, token_set
+
+DOCUMENTS_HEADER = "INFORMACIÓN RELEVANTE DEL CÓDIGO DEL TRABAJO:\n\n"
+GRAPH_HEADER = "📊 CONTEXTO DEL GRAFO DE CONOCIMIENTO:\n\n"
+GRAPH_SEPARATOR = "\n---\n"
+
+_PAGE_MARK = re.compile(r'^\s*-+\s*Página\s+\d+\s*-+\s*$', re.IGNORECASE)
+_PAGE_NUMBER = re.compile(r'^\s*\d{1,4}\s*$')
+_RUNNING_HEADER = re.compile(r'^\s*Dirección\s+Del\s+Trabajo\s*(?:\d+\s+)?')
+_SENTENCE_BREAK = re.compile(r'(?<=[.;:!?])\s+(?=[A-ZÁÉÍÓÚÑ¿¡"“(])')
+_SPACES = re.compile(r'\s+')
+_HEADING_PREFIX = re.compile(r'^(?:LIBRO|T[ÍI]TULO|CAP[ÍI]TULO|P[ÁA]RRAFO)\b', re.IGNORECASE)
+
+# Líneas cortas que se repiten entre pasajes (títulos de libro/capítulo)
+_HEADING_MAX_CHARS = 120
+# Fragmentos más cortos que esto solo se descartan si son idénticos a uno ya incluido
+_MIN_OVERLAP_CHARS = 20
+# Espacio mínimo para que valga la pena incluir un pasaje recortado
+_MIN_PASSAGE_TOKENS = 30
+
+
+def _is_heading(line: str) -> bool:
+    """Línea corta de título: "LIBRO I ...", "Título II : DE ...", "Capítulo I" o en mayúsculas"""
+    if len(line) > _HEADING_MAX_CHARS:
+        return False
+    if _HEADING_PREFIX.match(line):
+        return True
+    letters = [c for c in line if c.isalpha()]
+    return bool(letters) and all(c.isupper() for c in letters)
+
+
+def clean_passage(text: str, seen_headings: Optional[set] = None) -> str:
+    """
+    Quita el ruido del PDF y deja el pasaje en una sola línea
+
+    seen_headings: títulos ya vistos en pasajes anteriores (se actualiza);
+    un título repetido se descarta.
+    """
+    lines = []
+    for line in text.splitlines():
+        if _PAGE_MARK.match(line) or _PAGE_NUMBER.match(line):
+            continue
+
+        header = _RUNNING_HEADER.match(line)
+        if header:
+            # El encabezado de página a veces viene pegado al texto del artículo
+            line = line[header.end():]
+            if _is_heading(line.strip()):
+                continue
+
+        line = line.strip()
+        if not line:
+            continue
+
+        if seen_headings is not None and _is_heading(line):
+            key = normalize_text(line)
+            if key in seen_headings:
+                continue
+            seen_headings.add(key)
+
+        lines.append(line)
+
+    return _SPACES.sub(" ", " ".join(lines)).strip()
+
+
+def split_sentences(text: str) -> List[str]:
+    """Oraciones del pasaje ("Art. 22" o "N° 3" no cortan oración)"""
+    return [s for s in _SENTENCE_BREAK.split(text) if s]
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Recorta en un límite de palabra para que el texto quepa en max_tokens"""
+    if approx_token_count(text) <= max_tokens:
+        return text
+    words = text.split(" ")
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if approx_token_count(" ".join(words[:middle]) + " …") <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return " ".join(words[:low]) + " …" if low else ""
+
+
+class ContextBuilder:
+    """Arma el contexto para el LLM dentro de un presupuesto de tokens"""
+
+    def __init__(self,
+                 token_budget: int = None,
+                 graph_token_budget: int = None,
+                 max_passage_tokens: int = None):
+        self.token_budget = token_budget if token_budget is not None else settings.CONTEXT_TOKEN_BUDGET
+        self.graph_token_budget = (graph_token_budget if graph_token_budget is not None
+                                   else settings.CONTEXT_GRAPH_TOKEN_BUDGET)
+        # Tope por pasaje: un chunk largo (ej: el índice temático) no acapara el presupuesto
+        self.max_passage_tokens = (max_passage_tokens if max_passage_tokens is not None
+                                   else settings.CONTEXT_MAX_PASSAGE_TOKENS)
+
+    def build(self,
+              query: str,
+              documents: List[Dict],
+              graph_blocks: Optional[List[str]] = None) -> Dict:
+        """
+        Construir el contexto
+
+        documents: resultados de RAGService.search_hybrid (ordenados por score)
+        graph_blocks: bloques de GraphService.get_context_blocks (ordenados por relevancia)
+
+        Retorna: {'context', 'tokens', 'passages', 'graph_blocks', 'truncated', 'dropped'}
+        """
+        stats = {'passages': 0, 'graph_blocks': 0, 'truncated': 0, 'dropped': 0}
+
+        # El grafo complementa a los pasajes: se acota primero y el resto es para documentos
+        graph_budget = min(self.graph_token_budget, self.token_budget)
+        graph_context = self._pack_graph(graph_blocks or [], graph_budget, stats)
+        graph_tokens = approx_token_count(graph_context)
+
+        documents_context = self._pack_documents(
+            query, documents, self.token_budget - graph_tokens, stats
+        )
+
+        context = documents_context
+        if graph_context:
+            context = f"{context}\n{graph_context}" if context else graph_context
+
+        stats['context'] = context
+        stats['tokens'] = approx_token_count(context)
+        return stats
+
+    def _pack_documents(self, query: str, documents: List[Dict], budget: int, stats: Dict) -> str:
+        remaining = budget - approx_token_count(DOCUMENTS_HEADER)
+        query_terms = token_set(query)
+        seen_headings = set()
+        included_text = ""  # Texto normalizado ya incluido (para detectar solapamiento)
+        parts = []
+
+        ranked = sorted(documents, key=lambda d: d.get('score', 0), reverse=True)
+        for doc in ranked:
+            label = f"Art. {doc['article']}" if doc.get('article') else "Documento"
+            header = f"[{len(parts) + 1}] {label}\n"
+            available = min(remaining - approx_token_count(header) - 1, self.max_passage_tokens)
+            if available < _MIN_PASSAGE_TOKENS:
+                stats['dropped'] += 1
+                continue
+
+            # Oraciones nuevas (no repetidas ni contenidas en lo ya incluido)
+            sentences = []
+            for sentence in split_sentences(clean_passage(doc.get('text', ''), seen_headings)):
+                normalized = normalize_text(sentence)
+                if not normalized:
+                    continue
+                if normalized in included_text and (
+                        len(normalized) >= _MIN_OVERLAP_CHARS or f" {normalized} " in f" {included_text} "):
+                    continue
+                sentences.append(sentence)
+
+            if not sentences:
+                stats['dropped'] += 1
+                continue
+
+            body = " ".join(sentences)
+            if approx_token_count(body) > available:
+                body = self._select_sentences(sentences, query_terms, available)
+                stats['truncated'] += 1
+            if not body:
+                stats['dropped'] += 1
+                continue
+
+            passage = f"{header}{body}\n"
+            parts.append(passage)
+            remaining -= approx_token_count(passage)
+            included_text += " " + normalize_text(body)
+            stats['passages'] += 1
+
+        if not parts:
+            return ""
+        return DOCUMENTS_HEADER + "\n".join(parts)
+
+    @staticmethod
+    def _select_sentences(sentences: List[str], query_terms: frozenset, budget: int) -> str:
+        """
+        Oraciones que caben en el presupuesto: primero las que comparten más
+        términos con la query, luego las primeras del pasaje; se muestran en su orden
+        """
+        ranked = sorted(
+            range(len(sentences)),
+            key=lambda i: (-len(query_terms & token_set(sentences[i])), i)
+        )
+        chosen = []
+        used = 0
+        for index in ranked:
+            cost = approx_token_count(sentences[index]) + 1  # +1 por el "…" de un salto
+            if used + cost <= budget:
+                chosen.append(index)
+                used += cost
+
+        if not chosen:
+            # Ni una oración completa cabe: cortar la más relevante en un límite de palabra
+            return truncate_to_tokens(sentences[ranked[0]], budget)
+
+        chosen.sort()
+        pieces = []
+        previous = -1
+        for index in chosen:
+            if previous >= 0 and index != previous + 1:
+                pieces.append("…")
+            pieces.append(sentences[index])
+            previous = index
+        if chosen[-1] != len(sentences) - 1:
+            pieces.append("…")
+        return " ".join(pieces)
+
+    @staticmethod
+    def _pack_graph(blocks: List[str], budget: int, stats: Dict) -> str:
+        remaining = budget - approx_token_count(GRAPH_HEADER)
+        packed = []
+        for block in blocks:
+            block = block.strip()
+            if not block:
+                continue
+            cost = approx_token_count(block + GRAPH_SEPARATOR)
+            if cost > remaining:
+                # Conservar la cabecera de la entidad y las relaciones que quepan
+                lines = []
+                for line in block.splitlines():
+                    candidate = "\n".join(lines + [line])
+                    if approx_token_count(candidate + GRAPH_SEPARATOR) > remaining:
+                        break
+                    lines.append(line)
+                if len(lines) < 2:  # Sin al menos "Entidad" y "Tipo" no aporta
+                    continue
+                block = "\n".join(lines).strip()
+                cost = approx_token_count(block + GRAPH_SEPARATOR)
+            packed.append(block)
+            remaining -= cost
+            stats['graph_blocks'] += 1
+
+        if not packed:
+            return ""
+        return GRAPH_HEADER + "".join(block + GRAPH_SEPARATOR for block in packed)
+
+
+context_builder = ContextBuilder()
@@ -0,0 +1,64 @@
+"""
+Embeddings sintéticos 100% locales (sin API ni red)
+- Hashing de tokens a un vector de 384 dimensiones
+- Usa el tokenizador compartido de text_utils
+
+Separado de groq_service para que el ingreso, la búsqueda y los scripts
+offline no importen el cliente HTTP ni necesiten API key.
+"""
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+
+from services.text_utils import term_counts
+
+
+@lru_cache(maxsize=65536)
+def _token_index(token: str, embedding_dim: int = 384) -> int:
+    """Hash determinístico del token → índice del vector"""
+    return int(hashlib.md5(token.encode()).hexdigest(), 16) % embedding_dim
+
+
+def embed_term_counts(counts: dict) -> list[float]:
+    """
+    Genera el embedding a partir de términos ya contados ({token: frecuencia})
+    
+    Permite reutilizar los tokens calculados en el ingreso sin re-tokenizar.
+    """
+    embedding_dim = 384
+    embedding = np.zeros(embedding_dim)
+    
+    for token, count in counts.items():
+        # TF-IDF simple: incrementar la dimensión correspondiente
+        embedding[_token_index(token, embedding_dim)] += count
+    
+    # Normalizar a norma unitaria (para similitud de coseno)
+    norm = np.linalg.norm(embedding)
+    if norm > 0:
+        embedding = embedding / norm
+    else:
+        # Texto vacío: retornar vector pequeño
+        embedding[0] = 1.0
+    
+    return embedding.tolist()
+
+
+def embed_text(text: str) -> list[float]:
+    """
+    Genera un embedding (vector semántico) del texto usando hashing eficiente.
+    
+    Opción B: Sin dependencias externas - usa técnicas de TF-IDF sintético.
+    - Tokeniza el texto (tokenizador compartido: minúsculas, sin acentos ni puntuación)
+    - Mapea tokens a índices del vector usando hashing
+    - Normaliza para similitud de coseno
+    
+    Entrada: text (str): Texto a convertir
+    Salida: list[float]: Vector de 384 dimensiones (estándar en embeddings)
+    """
+    try:
+        return embed_term_counts(term_counts(text))
+    
+    except Exception as e:
+        print(f"❌ Error en embed_text: {e}")
+        return [0.0] * 384  # Retornar vector fallback
@@ -0,0 +1,264 @@
+"""
+Anotaciones chunk → entidades del grafo
+
+El reranking y el contexto del grafo necesitan saber qué entidades menciona
+cada chunk. En vez de buscarlas en el texto en cada consulta, se detectan una
+sola vez por chunk y por grafo, y quedan en SQLite:
+- chunk_annotations: chunks ya anotados con un grafo (aunque no mencionen nada)
+- chunk_entities: incidencia chunk × nodo
+
+Cuándo se anota (solo los chunks pendientes para el grafo activo):
+- Al cargar un grafo
+- Después de ingresar documentos (process_pdf, process_directory, trabajos en segundo plano)
+
+Cada grafo se identifica por su GraphService.content_hash: los ids de nodos
+(n0, n1, ...) solo son válidos para ese JSON. Con varios grafos (GraphRegistry)
+cada uno tiene sus propias anotaciones y los ids se traducen a los de la vista
+combinada. Al anotar se descartan las anotaciones de grafos que ya no están
+cargados. En la consulta, search_hybrid agrega 'entity_ids' a cada resultado y
+el reranking se reduce a intersecciones de conjuntos.
+
+SQLite reutiliza los ids de documents después de borrarlos (no hay
+AUTOINCREMENT): cada anotación guarda el sha1 del contenido que se anotó, y
+una anotación cuyo chunk ya no tiene ese contenido se descarta y se rehace.
+"""
+import hashlib
+import threading
+from typing import Dict, Iterable, List
+
+from database.database import SessionLocal, ensure_schema
+from database.models import ChunkAnnotation, ChunkEntity, Document
+from services.graph_service import graph_service
+from services.graph_registry import namespaced
+
+
+def content_hash(content: str) -> str:
+    """Huella del contenido de un chunk"""
+    return hashlib.sha1((content or "").encode('utf-8')).hexdigest()
+
+
+class EntityAnnotationService:
+    """Anota chunks con las entidades del grafo activo y las consulta por documento"""
+
+    BATCH_SIZE = 500  # Chunks por commit
+
+    def __init__(self, graph=None):
+        self.graph = graph or graph_service
+        self._lock = threading.Lock()  # Un solo anotador a la vez (CLI + trabajos de ingreso)
+
+    def _components(self, graph=None):
+        """[(namespace, GraphService)] de los grafos que componen el grafo activo (o el dado)"""
+        graph = graph or self.graph
+        if not graph.is_loaded:
+            return []
+        return [(namespace, component) for namespace, component in graph.components if component.content_hash]
+
+    def annotate_pending(self, batch_size: int = None) -> int:
+        """
+        Anota los chunks que aún no tienen anotación para cada grafo activo
+
+        Con varios grafos (GraphRegistry) cada uno se anota por separado con su
+        propio hash: habilitar o deshabilitar un grafo no obliga a reanotar.
+
+        Retorna: cantidad de anotaciones nuevas (chunk × grafo)
+        """
+        components = self._components()
+        if not components:
+            return 0
+        retained = self.graph.retained_hashes or {component.content_hash for _, component in components}
+        batch_size = batch_size or self.BATCH_SIZE
+
+        ensure_schema()
+        with self._lock:
+            db = SessionLocal()
+            try:
+                # Las anotaciones de grafos que ya no están cargados no sirven (sus ids son otros)
+                db.query(ChunkEntity).filter(~ChunkEntity.graph_hash.in_(retained)).delete(synchronize_session=False)
+                db.query(ChunkAnnotation).filter(~ChunkAnnotation.graph_hash.in_(retained)).delete(synchronize_session=False)
+                db.commit()
+
+                contents = self._content_hashes(db)
+                done = 0
+                annotated_hashes = set()
+                for _, component in components:
+                    if component.content_hash not in annotated_hashes:
+                        annotated_hashes.add(component.content_hash)
+                        done += self._annotate_component(db, component, contents, batch_size)
+                return done
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+    def annotate_graph(self, graph, batch_size: int = None) -> int:
+        """
+        Anota los chunks pendientes con un grafo cargado de archivo que todavía no
+        está en la vista (GraphRegistry lo hace antes de cambiarla, así la primera
+        consulta con el grafo nuevo ya tiene sus anotaciones)
+
+        A diferencia de annotate_pending no descarta las anotaciones de otros grafos.
+        Retorna: cantidad de chunks anotados
+        """
+        if not graph.is_loaded or not graph.content_hash:
+            return 0
+        ensure_schema()
+        with self._lock:
+            db = SessionLocal()
+            try:
+                return self._annotate_component(db, graph, self._content_hashes(db), batch_size or self.BATCH_SIZE)
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+    @staticmethod
+    def _content_hashes(db) -> Dict[int, str]:
+        """{document_id: content_hash} de todos los documentos"""
+        return {doc_id: content_hash(content) for doc_id, content in db.query(Document.id, Document.content)}
+
+    @staticmethod
+    def _annotate_component(db, graph, contents: Dict[int, str], batch_size: int) -> int:
+        """
+        Anota con un grafo los chunks sin anotación para su hash, o anotados con
+        otro contenido (id reutilizado)
+
+        contents: {document_id: content_hash} de los documentos actuales
+        """
+        graph_hash = graph.content_hash
+        annotated = dict(db.query(ChunkAnnotation.document_id, ChunkAnnotation.content_hash).filter(
+            ChunkAnnotation.graph_hash == graph_hash))
+        pending = sorted(doc_id for doc_id, digest in contents.items() if annotated.get(doc_id) != digest)
+
+        done = 0
+        for start in range(0, len(pending), batch_size):
+            batch_ids = pending[start:start + batch_size]
+            rows = db.query(Document.id, Document.content).filter(Document.id.in_(batch_ids))
+
+            # Anotaciones de un contenido anterior con el mismo id
+            stale = [doc_id for doc_id in batch_ids if doc_id in annotated]
+            if stale:
+                for model in (ChunkEntity, ChunkAnnotation):
+                    db.query(model).filter(model.graph_hash == graph_hash,
+                                           model.document_id.in_(stale)).delete(synchronize_session=False)
+
+            annotations, incidences = [], []
+            for doc_id, content in rows:
+                node_ids = graph.entity_ids_in_text(content or "")
+                annotations.append({'document_id': doc_id, 'graph_hash': graph_hash,
+                                    'entity_count': len(node_ids), 'content_hash': content_hash(content)})
+                incidences.extend({'document_id': doc_id, 'graph_hash': graph_hash, 'node_id': node_id}
+                                  for node_id in node_ids)
+
+            if graph.content_hash != graph_hash:
+                db.rollback()
+                break  # Se cargó otro grafo en este servicio mientras se anotaba
+            db.bulk_insert_mappings(ChunkAnnotation, annotations)
+            db.bulk_insert_mappings(ChunkEntity, incidences)
+            db.commit()
+            done += len(annotations)
+        return done
+
+    def get_entities(self, document_ids: Iterable[int], contents: Dict[int, str] = None,
+                     graph=None) -> Dict[int, List[str]]:
+        """
+        Entidades anotadas de cada documento para el grafo activo (ids de la vista)
+
+        contents: {document_id: content_hash} opcional; se ignoran las anotaciones
+        hechas sobre otro contenido
+        graph: vista fija de la consulta (GraphService.pinned()); default: el grafo activo
+        Retorna: {document_id: [node_ids]}; los documentos sin anotación (vigente)
+        para alguno de los grafos activos no aparecen
+        """
+        document_ids = [doc_id for doc_id in set(document_ids) if doc_id is not None]
+        components = self._components(graph)
+        if not components or not document_ids:
+            return {}
+
+        namespaces = {}  # {hash: [namespaces]} (el mismo grafo puede estar cargado con dos nombres)
+        for namespace, component in components:
+            namespaces.setdefault(component.content_hash, []).append(namespace)
+
+        ensure_schema()
+        db = SessionLocal()
+        try:
+            annotated = db.query(ChunkAnnotation.document_id, ChunkAnnotation.graph_hash,
+                                 ChunkAnnotation.content_hash).filter(
+                ChunkAnnotation.graph_hash.in_(list(namespaces)),
+                ChunkAnnotation.document_id.in_(document_ids)
+            )
+            hashes_per_document = {}
+            for doc_id, graph_hash, digest in annotated:
+                if contents and doc_id in contents and contents[doc_id] != digest:
+                    continue
+                hashes_per_document[doc_id] = hashes_per_document.get(doc_id, 0) + 1
+            entities = {doc_id: [] for doc_id, count in hashes_per_document.items() if count == len(namespaces)}
+
+            if entities:
+                incidences = db.query(ChunkEntity.document_id, ChunkEntity.graph_hash, ChunkEntity.node_id).filter(
+                    ChunkEntity.graph_hash.in_(list(namespaces)),
+                    ChunkEntity.document_id.in_(list(entities))
+                )
+                for doc_id, graph_hash, node_id in incidences:
+                    entities[doc_id].extend(namespaced(namespace, node_id) for namespace in namespaces[graph_hash])
+            return entities
+        finally:
+            db.close()
+
+    def attach(self, results: List[Dict], graph=None) -> List[Dict]:
+        """
+        Agrega 'entity_ids' a los resultados de búsqueda que tienen anotación
+
+        graph: vista con la que después se rerankea (ids de la misma versión)
+        """
+        contents = {r['id']: content_hash(r['text']) for r in results if r.get('id') is not None and 'text' in r}
+        entities = self.get_entities((r.get('id') for r in results), contents, graph)
+        for result in results:
+            if result.get('id') in entities:
+                result['entity_ids'] = entities[result['id']]
+        return results
+
+    def prune(self):
+        """Borra las anotaciones de documentos que ya no existen"""
+        ensure_schema()
+        with self._lock:
+            db = SessionLocal()
+            try:
+                existing = db.query(Document.id)
+                db.query(ChunkEntity).filter(~ChunkEntity.document_id.in_(existing)).delete(synchronize_session=False)
+                db.query(ChunkAnnotation).filter(~ChunkAnnotation.document_id.in_(existing)).delete(synchronize_session=False)
+                db.commit()
+            finally:
+                db.close()
+
+    def clear(self):
+        """Borra todas las anotaciones (al borrar los documentos)"""
+        ensure_schema()
+        with self._lock:
+            db = SessionLocal()
+            try:
+                db.query(ChunkEntity).delete()
+                db.query(ChunkAnnotation).delete()
+                db.commit()
+            finally:
+                db.close()
+
+    def get_stats(self) -> Dict:
+        """Chunks anotados e incidencias para los grafos activos"""
+        ensure_schema()
+        hashes = list({component.content_hash for _, component in self._components()})
+        db = SessionLocal()
+        try:
+            return {
+                'graph_hashes': hashes,
+                'annotated_chunks': db.query(ChunkAnnotation.document_id).filter(
+                    ChunkAnnotation.graph_hash.in_(hashes)).distinct().count(),
+                'incidences': db.query(ChunkEntity).filter(ChunkEntity.graph_hash.in_(hashes)).count()
+            }
+        finally:
+            db.close()
+
+
+# Instancia global
+entity_annotations = EntityAnnotationService()
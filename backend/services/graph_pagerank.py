@@ -0,0 +1,169 @@
+"""
+PageRank personalizado sobre el grafo de conocimiento
+
+Reranking alternativo al conteo de entidades en común: las entidades de la
+query son las semillas del PageRank y cada documento recibe la masa de las
+entidades que menciona. Así también suman las entidades que el documento no
+comparte con la query pero que están cerca de ella en el grafo (ponderado por
+el peso de los edges).
+
+- Matriz de transición: scipy.sparse (CSR), edges no dirigidos como en la
+  adyacencia, filas normalizadas por la suma de pesos
+- Iteración de potencias vectorizada (matriz × vector), pocas iteraciones
+- Vectores memoizados por conjunto de semillas (LRU), invalidados al cambiar
+  el content_hash del grafo
+
+scipy se importa al construir la matriz: sin scipy, GraphService vuelve al
+reranking por entidades en común.
+"""
+import threading
+from collections import OrderedDict
+from typing import Iterable, Tuple
+
+import numpy as np
+
+from config.settings import settings
+from services.graph_snapshot import SnapshotEdges
+
+
+def _component_edge_arrays(graph) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(origen, destino, peso) de un grafo cargado de archivo, nodos como posición"""
+    if isinstance(graph.edges, SnapshotEdges):
+        # Las posiciones del snapshot son las de graph.nodes (mismo orden)
+        sources, targets, weights = graph.edges.position_arrays()
+        return (np.asarray(sources, dtype=np.int64), np.asarray(targets, dtype=np.int64),
+                np.asarray(weights, dtype=np.float64))
+
+    position = graph._node_position
+    sources, targets, weights = [], [], []
+    for edge in graph.edges:
+        source, target = position.get(edge['source']), position.get(edge['target'])
+        if source is None or target is None:
+            continue
+        sources.append(source)
+        targets.append(target)
+        weights.append(edge.get('weight', 1.0))
+    return (np.array(sources, dtype=np.int64), np.array(targets, dtype=np.int64),
+            np.array(weights, dtype=np.float64))
+
+
+def edge_arrays(graph) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (origen, destino, peso) de todos los edges del grafo, con los nodos como
+    posición en graph.nodes. En la vista de GraphRegistry los nodos de cada
+    componente van seguidos, así que basta desplazar sus posiciones.
+    """
+    parts = []
+    offset = 0
+    for _, component in graph.components:
+        sources, targets, weights = _component_edge_arrays(component)
+        parts.append((sources + offset, targets + offset, weights))
+        offset += len(component.nodes)
+    if not parts:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.float64)
+    return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+
+class PersonalizedPageRank:
+    """PageRank con teleport a las semillas, sobre la matriz dispersa del grafo"""
+
+    TOLERANCE = 1e-6  # Cambio L1 entre iteraciones para detenerse
+
+    def __init__(self, graph, damping: float = None, max_iterations: int = None, cache_size: int = None):
+        self.graph = graph
+        self.damping = damping if damping is not None else settings.GRAPH_PAGERANK_DAMPING
+        self.max_iterations = max_iterations or settings.GRAPH_PAGERANK_MAX_ITERATIONS
+        self.cache_size = cache_size if cache_size is not None else settings.GRAPH_PAGERANK_CACHE_SIZE
+        self._graph_hash = None
+        self._transition_t = None  # Transpuesta de la matriz de transición (CSR)
+        self._dangling = None  # Nodos sin edges (su masa vuelve a las semillas)
+        self._cache = OrderedDict()  # {frozenset(posiciones semilla): vector de scores}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'iterations': 0}
+
+    def clear(self):
+        """Descarta la matriz y los vectores memoizados"""
+        with self._lock:
+            self._graph_hash = None
+            self._transition_t = None
+            self._dangling = None
+            self._cache.clear()
+
+    def prepare(self):
+        """Construye la matriz de transición ahora (en vez de en la primera consulta)"""
+        with self._lock:
+            self._ensure_matrix()
+
+    def _ensure_matrix(self):
+        """Construye la matriz si el grafo cambió (llamar con el lock tomado)"""
+        if self._transition_t is not None and self._graph_hash == self.graph.content_hash:
+            return
+        from scipy import sparse
+
+        n = len(self.graph.nodes)
+        sources, targets, weights = edge_arrays(self.graph)
+        # Sin autoloops ni pesos no positivos: no aportan cercanía entre entidades
+        keep = (sources != targets) & (weights > 0)
+        sources, targets, weights = sources[keep], targets[keep], weights[keep]
+
+        # No dirigido (como la adyacencia): cada edge se recorre en ambos sentidos
+        rows = np.concatenate([sources, targets])
+        cols = np.concatenate([targets, sources])
+        values = np.concatenate([weights, weights])
+        matrix = sparse.csr_matrix((values, (rows, cols)), shape=(n, n))
+
+        out_weight = np.asarray(matrix.sum(axis=1)).ravel()
+        self._dangling = out_weight == 0
+        inverse = np.divide(1.0, out_weight, out=np.zeros(n), where=~self._dangling)
+        self._transition_t = (sparse.diags(inverse) @ matrix).T.tocsr()
+        self._graph_hash = self.graph.content_hash
+        self._cache.clear()
+
+    def scores(self, seed_positions: Iterable[int]) -> np.ndarray:
+        """
+        Vector de PageRank personalizado (uno por nodo, en el orden de graph.nodes)
+
+        seed_positions: posiciones de los nodos semilla (teleport uniforme entre ellos)
+        Retorna un array de solo lectura (compartido por el caché)
+        """
+        seeds = frozenset(seed_positions)
+        with self._lock:
+            self._ensure_matrix()
+            cached = self._cache.get(seeds)
+            if cached is not None:
+                self._cache.move_to_end(seeds)
+                self.stats['hits'] += 1
+                return cached
+            self.stats['misses'] += 1
+            transition_t, dangling = self._transition_t, self._dangling
+
+        n = transition_t.shape[0]
+        personalization = np.zeros(n)
+        if seeds:
+            personalization[list(seeds)] = 1.0 / len(seeds)
+
+        rank = personalization.copy()
+        damping = self.damping
+        for iteration in range(1, self.max_iterations + 1):
+            # La masa de los nodos sin edges vuelve a las semillas junto con el teleport
+            lost = damping * rank[dangling].sum() + (1.0 - damping)
+            new_rank = damping * (transition_t @ rank) + lost * personalization
+            delta = np.abs(new_rank - rank).sum()
+            rank = new_rank
+            if delta < self.TOLERANCE:
+                break
+        rank.setflags(write=False)
+
+        with self._lock:
+            self.stats['iterations'] += iteration
+            if self._graph_hash == self.graph.content_hash and self.cache_size:
+                self._cache[seeds] = rank
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return rank
+
+    def node_scores(self, seed_ids: Iterable[str]) -> Tuple[np.ndarray, dict]:
+        """PageRank sembrado con ids de nodos; retorna (scores, {node_id: posición})"""
+        position = self.graph._node_position
+        return self.scores(position[node_id] for node_id in seed_ids if node_id in position), position
@@ -0,0 +1,426 @@
+"""
+Registro de varios grafos de conocimiento usados a la vez
+
+Cada grafo se carga una sola vez en su propio GraphService (JSON o snapshot).
+El graph_service global es una vista combinada de los grafos habilitados:
+- ids de nodos con namespace: "<grafo>:<node_id>" (ej: "conceptos:n12")
+- índices de búsqueda unificados (labels, autómata de entidades, orden de nodos)
+- adyacencia, edges y edges incidentes se leen del grafo de cada nodo (sin copiarlos)
+
+Habilitar o deshabilitar un grafo solo recompone la vista: no se vuelve a
+parsear ningún archivo. El reranking y el contexto recorren todos los grafos
+habilitados en una sola pasada.
+
+Recarga en caliente: la vista se arma en un GraphService nuevo y se cambia de
+una vez (GraphService.swap_in). Las cargas con load_async y las recargas de
+archivos modificados (start_watching) corren en un hilo de fondo, índices y
+anotaciones de chunks incluidos; las consultas siguen con el grafo anterior
+hasta el cambio. Una consulta fija su versión con graph_service.pinned().
+"""
+import os
+import bisect
+import hashlib
+import threading
+from collections.abc import Mapping, Sequence
+from itertools import chain
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config.settings import settings
+from services.graph_service import GraphService, graph_service
+from services.graph_snapshot import preferred_graph_path
+
+NAMESPACE_SEPARATOR = ":"
+
+
+def namespaced(namespace: str, node_id: str) -> str:
+    return f"{namespace}{NAMESPACE_SEPARATOR}{node_id}" if namespace else node_id
+
+
+def split_node_id(node_id: str):
+    """(namespace, node_id local) de un id de la vista combinada"""
+    namespace, separator, local_id = node_id.partition(NAMESPACE_SEPARATOR)
+    return (namespace, local_id) if separator else ("", node_id)
+
+
+def _namespaced_edge(namespace: str, edge: Dict) -> Dict:
+    return {**edge,
+            'source': namespaced(namespace, edge['source']),
+            'target': namespaced(namespace, edge['target'])}
+
+
+class NamespacedAdjacency(Mapping):
+    """Adyacencia de la vista combinada: delega en el grafo del nodo"""
+
+    def __init__(self, components: Dict[str, GraphService], nodes: Dict):
+        self._components = components
+        self._nodes = nodes
+
+    def __getitem__(self, node_id: str) -> frozenset:
+        if node_id not in self._nodes:
+            raise KeyError(node_id)
+        namespace, local_id = split_node_id(node_id)
+        neighbours = self._components[namespace].adjacency.get(local_id, ())
+        return frozenset(namespaced(namespace, neighbour) for neighbour in neighbours)
+
+    def __iter__(self):
+        return iter(self._nodes)
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+
+class NamespacedIncidentEdges(Mapping):
+    """Edges incidentes de la vista combinada (mismo orden por peso del grafo de origen)"""
+
+    def __init__(self, components: Dict[str, GraphService], nodes: Dict):
+        self._components = components
+        self._nodes = nodes
+
+    def __getitem__(self, node_id: str) -> List[Dict]:
+        if node_id not in self._nodes:
+            raise KeyError(node_id)
+        namespace, local_id = split_node_id(node_id)
+        edges = self._components[namespace].incident_edges.get(local_id, [])
+        return [_namespaced_edge(namespace, edge) for edge in edges]
+
+    def __iter__(self):
+        return iter(self._nodes)
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+
+class NamespacedEdges(Sequence):
+    """Edges de todos los grafos habilitados, concatenados en el orden del registro"""
+
+    def __init__(self, components: Dict[str, GraphService]):
+        self._parts = [(namespace, graph.edges) for namespace, graph in components.items()]
+        self._starts = []
+        total = 0
+        for _, edges in self._parts:
+            self._starts.append(total)
+            total += len(edges)
+        self._total = total
+
+    def __len__(self) -> int:
+        return self._total
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += self._total
+        if not 0 <= index < self._total:
+            raise IndexError(index)
+        part = bisect.bisect_right(self._starts, index) - 1
+        namespace, edges = self._parts[part]
+        return _namespaced_edge(namespace, edges[index - self._starts[part]])
+
+    def __iter__(self):
+        return chain.from_iterable(
+            (_namespaced_edge(namespace, edge) for edge in edges) for namespace, edges in self._parts
+        )
+
+
+class GraphRegistry:
+    """Grafos cargados por nombre, cada uno habilitable por separado"""
+
+    def __init__(self, view: GraphService):
+        self.view = view
+        self._graphs = {}  # {nombre: {'graph': GraphService, 'path': str, 'enabled': bool}}
+        self._lock = threading.Lock()
+        self._generation = 0  # Aumenta con cada cambio del registro; la vista de un cambio viejo no se instala
+        self._loading = set()  # Nombres que se están cargando en segundo plano
+        self._events = []  # Cargas en segundo plano terminadas aún no informadas
+        self._watcher = None
+        self._stop_watching = threading.Event()
+
+    @staticmethod
+    def graph_name(path: str) -> str:
+        """Nombre por defecto: el nombre del archivo sin extensión (sin ':' del namespace)"""
+        return Path(path).stem.replace(NAMESPACE_SEPARATOR, "_")
+
+    def load(self, path: str, name: str = None, enabled: bool = True) -> Dict:
+        """
+        Carga un grafo (su snapshot si está al día) y lo agrega a la vista
+
+        Si ya hay un grafo con ese nombre, se reemplaza.
+        """
+        name = (name or self.graph_name(path)).replace(NAMESPACE_SEPARATOR, "_")
+        graph, load_path = self._read_graph(path)
+        if graph is None:
+            return {'success': False, 'name': name, 'message': f"❌ No se pudo cargar el grafo: {path}"}
+
+        with self._lock:
+            change = self._install(name, path, graph, load_path, enabled)
+        self._compose(change)
+        return self._loaded_result(name, graph)
+
+    def load_async(self, path: str, name: str = None, enabled: bool = True) -> str:
+        """
+        Carga un grafo en un hilo de fondo; las consultas siguen usando la vista
+        actual hasta que el grafo nuevo (con sus índices) está listo
+
+        El resultado se informa con pop_events(). Retorna el nombre del grafo.
+        """
+        name = (name or self.graph_name(path)).replace(NAMESPACE_SEPARATOR, "_")
+        with self._lock:
+            self._loading.add(name)
+        threading.Thread(
+            target=self._background_load, args=(str(path), name, enabled),
+            name=f"graph-load-{name}", daemon=True
+        ).start()
+        return name
+
+    def _read_graph(self, path: str):
+        """Carga un archivo en un GraphService nuevo: (grafo, ruta cargada) o (None, ruta)"""
+        try:
+            # mtime antes de leer: un cambio durante la carga se detecta en la próxima revisión
+            source_mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            print(f"⚠️  Grafo no encontrado: {path}")
+            return None, path
+        graph = GraphService()
+        load_path = preferred_graph_path(path)
+        if not graph.load_graph(load_path):
+            return None, load_path
+        # Se vigila el JSON aunque se haya cargado su snapshot (mismo content_hash)
+        graph.source_path, graph.source_mtime = str(path), source_mtime
+        return graph, load_path
+
+    def _install(self, name: str, path: str, graph: GraphService, load_path: str, enabled: bool):
+        """Registra el grafo (llamar con el lock tomado); retorna el cambio para _compose"""
+        self._graphs[name] = {'graph': graph, 'path': str(path), 'load_path': load_path, 'enabled': enabled}
+        return self._changed()
+
+    @staticmethod
+    def _loaded_result(name: str, graph: GraphService) -> Dict:
+        return {
+            'success': True,
+            'name': name,
+            'nodes': len(graph.nodes),
+            'edges': len(graph.edges),
+            'message': f"✅ Grafo '{name}' cargado ({len(graph.nodes)} nodos, {len(graph.edges)} relaciones)"
+        }
+
+    def _background_load(self, path: str, name: str, enabled: bool, reload: bool = False) -> Dict:
+        """Carga (o recarga) un grafo fuera del hilo de las consultas y cambia la vista de una vez"""
+        try:
+            graph, load_path = self._read_graph(path)
+            if graph is None:
+                message = (f"⚠️  No se pudo recargar el grafo '{name}' desde {path} (se sigue usando la versión anterior)"
+                           if reload else f"❌ No se pudo cargar el grafo: {path}")
+                result = {'success': False, 'name': name, 'message': message}
+            else:
+                # Anotar antes de cambiar la vista: la primera consulta ya usa las anotaciones
+                annotated = self._annotate_graph(graph)
+                change = None
+                with self._lock:
+                    entry = self._graphs.get(name)
+                    if not reload or (entry is not None and entry['path'] == path):
+                        if reload:
+                            enabled = entry['enabled']  # Pudo cambiar mientras se cargaba
+                        change = self._install(name, path, graph, load_path, enabled)
+                if change is None:
+                    result = {'success': False, 'name': name, 'message': f"Grafo '{name}' ya no está cargado"}
+                else:
+                    # Los índices de la vista también se arman aquí: la primera consulta no espera
+                    self._compose(change)
+                    result = self._loaded_result(name, graph)
+                    if reload:
+                        result['message'] = (f"🔄 Grafo '{name}' actualizado desde {Path(path).name} "
+                                             f"({result['nodes']} nodos, {result['edges']} relaciones)")
+                    # Descarta las anotaciones de la versión anterior y anota lo ingresado mientras tanto
+                    result['annotated'] = annotated + self._annotate_documents()
+        except Exception as e:
+            result = {'success': False, 'name': name, 'message': f"❌ Error al cargar grafo '{name}': {e}"}
+        finally:
+            with self._lock:
+                self._loading.discard(name)
+
+        result['reload'] = reload
+        with self._lock:
+            self._events.append(result)
+        return result
+
+    @staticmethod
+    def _annotate_graph(graph: GraphService) -> int:
+        """Anota los chunks con un grafo recién leído, antes de que entre a la vista"""
+        try:
+            from services.entity_annotations import entity_annotations
+            return entity_annotations.annotate_graph(graph)
+        except Exception as e:
+            print(f"⚠️  No se pudieron anotar entidades: {e}")
+            return 0
+
+    @staticmethod
+    def _annotate_documents() -> int:
+        """Anota los chunks con el grafo nuevo (en el mismo hilo de fondo)"""
+        from services.rag_service import RAGService
+        return RAGService.annotate_documents()
+
+    def pop_events(self) -> List[Dict]:
+        """Resultados de cargas y recargas en segundo plano terminadas desde la última llamada"""
+        with self._lock:
+            events, self._events = self._events, []
+        return events
+
+    def loading(self) -> List[str]:
+        """Grafos que se están cargando en segundo plano"""
+        with self._lock:
+            return sorted(self._loading)
+
+    def check_for_changes(self) -> List[str]:
+        """
+        Recarga los grafos cuyo archivo cambió (mtime y luego sha1, ver
+        GraphService.source_changed). Retorna los nombres recargados.
+
+        Si el archivo nuevo no se puede cargar (ej: JSON inválido) se sigue
+        usando el grafo anterior y no se reintenta hasta que el archivo vuelva
+        a cambiar.
+        """
+        with self._lock:
+            entries = [(name, entry) for name, entry in self._graphs.items() if name not in self._loading]
+
+        reloaded = []
+        for name, entry in entries:
+            graph = entry['graph']
+            try:
+                mtime = os.stat(entry['path']).st_mtime_ns
+            except OSError:
+                continue
+            if entry.get('failed_mtime') == mtime or not graph.source_changed():
+                continue
+
+            with self._lock:
+                self._loading.add(name)
+            result = self._background_load(entry['path'], name, entry['enabled'], reload=True)
+            if result['success']:
+                reloaded.append(name)
+            else:
+                entry['failed_mtime'] = mtime
+        return reloaded
+
+    def start_watching(self, interval: float = None) -> bool:
+        """
+        Revisa los archivos de los grafos cada `interval` segundos en un hilo
+        de fondo y recarga los que cambiaron (default: settings.GRAPH_WATCH_INTERVAL_SECONDS)
+
+        Retorna False si la vigilancia está desactivada (intervalo 0) o ya corría.
+        """
+        interval = settings.GRAPH_WATCH_INTERVAL_SECONDS if interval is None else interval
+        if interval <= 0 or (self._watcher and self._watcher.is_alive()):
+            return False
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,),
+                                         name="graph-watcher", daemon=True)
+        self._watcher.start()
+        return True
+
+    def stop_watching(self):
+        self._stop_watching.set()
+        if self._watcher:
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch(self, interval: float):
+        while not self._stop_watching.wait(interval):
+            try:
+                self.check_for_changes()
+            except Exception as e:
+                print(f"⚠️  Error revisando cambios en los grafos: {e}")
+
+    def set_enabled(self, name: str, enabled: bool) -> Dict:
+        """Habilita o deshabilita un grafo (recompone la vista sin recargar archivos)"""
+        with self._lock:
+            entry = self._graphs.get(name)
+            if entry is None:
+                return {'success': False, 'message': f"❌ Grafo no cargado: {name}"}
+            change = None
+            if entry['enabled'] != enabled:
+                entry['enabled'] = enabled
+                change = self._changed()
+        if change is not None:
+            self._compose(change)
+        state = "habilitado" if enabled else "deshabilitado"
+        return {'success': True, 'message': f"✅ Grafo '{name}' {state}"}
+
+    def enable(self, name: str) -> Dict:
+        return self.set_enabled(name, True)
+
+    def disable(self, name: str) -> Dict:
+        return self.set_enabled(name, False)
+
+    def unload(self, name: str) -> Dict:
+        """Quita un grafo del registro"""
+        with self._lock:
+            if self._graphs.pop(name, None) is None:
+                return {'success': False, 'message': f"❌ Grafo no cargado: {name}"}
+            change = self._changed()
+        self._compose(change)
+        return {'success': True, 'message': f"✅ Grafo '{name}' descargado"}
+
+    def clear(self):
+        """Descarga todos los grafos"""
+        with self._lock:
+            self._graphs.clear()
+            change = self._changed()
+        self._compose(change)
+
+    def get(self, name: str) -> Optional[GraphService]:
+        entry = self._graphs.get(name)
+        return entry['graph'] if entry else None
+
+    def list_graphs(self) -> List[Dict]:
+        """Grafos registrados con su estado"""
+        with self._lock:
+            return [
+                {
+                    'name': name,
+                    'path': entry['path'],
+                    'snapshot': entry['load_path'] != entry['path'],
+                    'enabled': entry['enabled'],
+                    'nodes': len(entry['graph'].nodes),
+                    'edges': len(entry['graph'].edges)
+                }
+                for name, entry in self._graphs.items()
+            ]
+
+    def __len__(self) -> int:
+        return len(self._graphs)
+
+    def _changed(self):
+        """Registra un cambio (llamar con el lock tomado); retorna su versión y los grafos a componer"""
+        self._generation += 1
+        components = {name: entry['graph'] for name, entry in self._graphs.items() if entry['enabled']}
+        retained = {entry['graph'].content_hash for entry in self._graphs.values()}
+        return self._generation, components, retained
+
+    def _compose(self, change):
+        """
+        Arma la vista de un cambio en un GraphService nuevo, con sus índices, y
+        la cambia de una vez en el servicio compartido (llamar sin el lock)
+
+        El armado no toma el lock: las recargas, listados y eventos no esperan.
+        Si mientras tanto hubo otro cambio, esta vista ya quedó vieja y no se
+        instala; la instala el _compose de ese cambio.
+        """
+        generation, components, retained = change
+        view = GraphService()
+        if components:
+            view.load_components(components, retained_hashes=retained)
+            view.build_indexes()
+        with self._lock:
+            if generation == self._generation:
+                self.view.swap_in(view)
+
+
+def combined_hash(components: Dict[str, GraphService]) -> str:
+    """Hash de la vista: nombres y contenido de los grafos habilitados"""
+    parts = [f"{name}={graph.content_hash}" for name, graph in components.items()]
+    return hashlib.sha1("|".join(parts).encode('utf-8')).hexdigest()
+
+
+# Instancia global (la vista es el graph_service compartido)
+graph_registry = GraphRegistry(graph_service)
@@ -9,9 +9,41 @@ Funcionalidades:
 """
 import json
 import os
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+from itertools import compress, repeat
 from pathlib import Path
 from typing import Dict, List, Set, Tuple, Optional
 import re
+import numpy as np
+from services.text_utils import normalize_text, token_set
+from services.aho_corasick import AhoCorasick
+from services.node_search_index import NodeSearchIndex
+from services.graph_snapshot import (
+    GraphSnapshot, SnapshotEdges, CSRAdjacency, CSRIncidentEdges, file_sha1, is_snapshot
+)
+from services.graph_pagerank import PersonalizedPageRank
+from config.settings import settings
+
+
+RERANK_METHODS = ("overlap", "pagerank")
+
+
+def _pinned_state(method):
+    """
+    Ejecuta el método sobre el estado del grafo vigente al llamarlo
+
+    GraphRegistry reemplaza el grafo completo de una vez (swap_in); una llamada
+    que empezó antes del reemplazo termina con el grafo anterior, sin mezclar
+    índices de dos versiones. Una consulta que hace varias llamadas (anotar,
+    rerankear, armar el contexto) usa GraphService.pinned() una sola vez.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return method(self.pinned(), *args, **kwargs)
+    return wrapper
 
 
 class GraphService:
@@ -22,30 +54,64 @@ class GraphService:
         self.nodes = {}  # {id: {label, type, description}}
         self.edges = []
         self.node_by_label = {}  # Índice de búsqueda rápida por label
+        self.node_by_id = {}  # {id del JSON: node_id} (grafos cuyos nodos traen "id")
+        # Índices para resolver referencias de edges por substring del label
+        self._label_order = []  # node_ids en el orden del JSON
+        self._labels_lower = []  # label.lower() de cada nodo, mismo orden
+        self._trigram_postings = {}  # {trigrama: [posiciones de labels que lo contienen]}
+        self._first_short_gram = {}  # {substring de 1-2 caracteres: primera posición}
+        # Detección de entidades: un autómata sobre todos los labels (una pasada por texto),
+        # construido en el primer uso: (autómata, [posiciones de los nodos de cada patrón])
+        self._entity_matcher = None
+        self._node_search_index = None  # Índice invertido de labels/descriptions (primer uso de find_nodes_by_text)
+        self._node_position = {}  # {node_id: posición en el orden del JSON}
         self.adjacency = {}  # {node_id: set(connected_node_ids)}
+        self.incident_edges = {}  # {node_id: [edges que entran o salen del nodo, por peso desc]}
+        # LRU de vecindarios k-hop de los nodos más consultados: {(node_id, k): frozenset}
+        self._neighbourhood_cache = OrderedDict()
+        self._neighbourhood_cache_size = settings.GRAPH_NEIGHBOURHOOD_CACHE_SIZE
+        self._neighbourhood_lock = threading.Lock()
+        self.content_hash = None  # sha1 del JSON cargado (invalida cachés derivados del grafo)
+        # PageRank personalizado para el reranking (matriz y vectores se arman en el primer uso)
+        self.pagerank = PersonalizedPageRank(self)
+        self._pagerank_unavailable = False  # scipy no instalado: se avisa una sola vez
+        # Grafos que componen este servicio: [(namespace, GraphService)]; un grafo
+        # cargado de archivo es su propio componente, la vista de GraphRegistry tiene varios
+        self.components = []
+        self.retained_hashes = None  # Hashes cuyas anotaciones de chunks se conservan
+        # Archivo de origen y su mtime al cargarlo (ver source_changed)
+        self.source_path = None
+        self.source_mtime = None
         self.is_loaded = False
     
     def load_graph(self, graph_path: str) -> bool:
-        """Cargar grafo desde archivo JSON"""
+        """Cargar grafo desde archivo JSON (o desde su snapshot .npz, ver graph_snapshot)"""
         try:
             if not os.path.exists(graph_path):
                 print(f"⚠️  Grafo no encontrado: {graph_path}")
                 return False
             
-            with open(graph_path, 'r', encoding='utf-8') as f:
-                self.graph = json.load(f)
+            source_mtime = os.stat(graph_path).st_mtime_ns  # Antes de leer: un cambio posterior se detecta
+            if is_snapshot(graph_path):
+                self._load_snapshot(graph_path)
+                self.source_path, self.source_mtime = str(graph_path), source_mtime
+                return True
+            
+            with open(graph_path, 'rb') as f:
+                raw = f.read()
+            graph = json.loads(raw.decode('utf-8'))
+            if not isinstance(graph, dict) or 'nodes' not in graph:
+                print(f"⚠️  El archivo no parece ser un grafo válido (falta 'nodes'): {graph_path}")
+                return False
+            self.graph = graph
+            self.content_hash = hashlib.sha1(raw).hexdigest()
             
             # Parsear nodos - los ID vienen como parte de los edges
             self.nodes = {}
             self.node_by_label = {}
+            self.node_by_id = {}
             self.edges = self.graph.get('edges', [])
             
-            # Recolectar todos los IDs de los edges para crear nodos
-            all_node_ids = set()
-            for edge in self.edges:
-                all_node_ids.add(edge.get('source'))
-                all_node_ids.add(edge.get('target'))
-            
             # Procesar nodos del JSON
             for idx, node in enumerate(self.graph.get('nodes', [])):
                 # Crear ID si no existe - usar index como fallback
@@ -53,23 +119,27 @@ class GraphService:
                 label = node.get('label', '').lower()
                 
                 node_data = node.copy()
-                node_data['_label_search'] = label  # Para búsqueda
+                # Para búsqueda (normalizados con el tokenizador compartido)
+                node_data['_label_search'] = normalize_text(node.get('label', ''))
+                node_data['_desc_search'] = normalize_text(node.get('description', ''))
                 self.nodes[node_id] = node_data
                 
                 # Índice por label para búsqueda
                 if label not in self.node_by_label:
                     self.node_by_label[label] = []
                 self.node_by_label[label].append(node_id)
+                
+                if node.get('id') is not None:
+                    self.node_by_id.setdefault(str(node['id']), node_id)
+            
+            self._build_label_index()
             
             # IMPORTANTE: mapear IDs de edges a nuestros IDs de nodos basados en labels
             # Los edges tienen IDs como 'E1', 'E2' que corresponden a descripciones
             # Necesitamos normalizar esto
             
-            # Primero, crear un mapa de labels encontrados en edges
-            edge_labels_map = {}  # {edge_node_id: label}
-            
-            # Leer el JSON source para obtener información de aristas
             remapped_edges = []
+            resolved = {}  # Memo: los edges repiten mucho sus extremos
             
             # Construir adyacencia SIN mappings por ahora
             # La idea es usar los IDs directamente del grafo
@@ -81,8 +151,12 @@ class GraphService:
                 target = edge.get('target')
                 
                 # Buscar source en nodos por label aproximado
-                source_node_id = self._find_node_by_id_or_label(source)
-                target_node_id = self._find_node_by_id_or_label(target)
+                if source not in resolved:
+                    resolved[source] = self._find_node_by_id_or_label(source)
+                if target not in resolved:
+                    resolved[target] = self._find_node_by_id_or_label(target)
+                source_node_id = resolved[source]
+                target_node_id = resolved[target]
                 
                 if source_node_id and target_node_id:
                     if source_node_id not in self.adjacency:
@@ -101,7 +175,12 @@ class GraphService:
                     })
             
             self.edges = remapped_edges
+            self._build_incident_edges()
+            self.clear_neighbourhood_cache()
             
+            self.components = [("", self)]
+            self.retained_hashes = None
+            self.source_path, self.source_mtime = str(graph_path), source_mtime
             self.is_loaded = True
             metadata = self.graph.get('metadata', {})
             print(f"✅ Grafo cargado: {len(self.nodes)} nodos, "
@@ -117,20 +196,280 @@ class GraphService:
             traceback.print_exc()
             return False
     
+    def _load_snapshot(self, snapshot_path: str) -> bool:
+        """
+        Cargar un snapshot compilado: edges ya resueltos, adyacencia y edges
+        incidentes se leen del CSR mapeado en memoria (sin reconstruir índices)
+        """
+        snapshot = GraphSnapshot(snapshot_path)
+        
+        self.graph = {'metadata': snapshot.metadata}
+        self.content_hash = snapshot.content_hash
+        self.nodes = dict(zip(snapshot.node_ids, snapshot.node_dicts()))
+        self.node_by_label = {}
+        self.node_by_id = {}
+        for node_id, node in self.nodes.items():
+            self.node_by_label.setdefault(node.get('label', '').lower(), []).append(node_id)
+            if node.get('id') is not None:
+                self.node_by_id.setdefault(str(node['id']), node_id)
+        
+        # Los índices de trigramas solo sirven para resolver edges del JSON
+        self._index_node_order()
+        self._trigram_postings = {}
+        self._first_short_gram = {}
+        self._entity_matcher = None
+        self._node_search_index = None
+        
+        self.edges = SnapshotEdges(snapshot)
+        self.adjacency = CSRAdjacency(snapshot)
+        self.incident_edges = CSRIncidentEdges(snapshot, self.edges)
+        self.clear_neighbourhood_cache()
+        
+        self.components = [("", self)]
+        self.retained_hashes = None
+        self.is_loaded = True
+        print(f"✅ Grafo cargado (snapshot): {len(self.nodes)} nodos, "
+              f"{len(self.edges)} relaciones")
+        return True
+    
+    def load_components(self, components: Dict[str, 'GraphService'], retained_hashes: Set[str] = None):
+        """
+        Vista combinada de varios grafos ya cargados (ver GraphRegistry)
+        
+        Los ids de nodos llevan el namespace de su grafo ("<nombre>:<node_id>");
+        los índices de labels se unifican y la adyacencia/edges se leen del
+        grafo de cada nodo. No se copia ni se vuelve a parsear ningún grafo.
+        """
+        from services.graph_registry import (
+            NamespacedAdjacency, NamespacedEdges, NamespacedIncidentEdges, combined_hash, namespaced
+        )
+        
+        nodes = {}
+        node_by_label = {}
+        node_by_id = {}
+        for namespace, graph in components.items():
+            for node_id, node in graph.nodes.items():
+                nodes[namespaced(namespace, node_id)] = node
+            for label, node_ids in graph.node_by_label.items():
+                node_by_label.setdefault(label, []).extend(namespaced(namespace, n) for n in node_ids)
+            for ref, node_id in graph.node_by_id.items():
+                node_by_id.setdefault(namespaced(namespace, ref), namespaced(namespace, node_id))
+        
+        self.graph = {'metadata': {'graphs': list(components)}}
+        self.content_hash = combined_hash(components)
+        self.nodes = nodes
+        self.node_by_label = node_by_label
+        self.node_by_id = node_by_id
+        self._index_node_order()
+        self._trigram_postings = {}
+        self._first_short_gram = {}
+        self._entity_matcher = None
+        self._node_search_index = None
+        
+        self.edges = NamespacedEdges(components)
+        self.adjacency = NamespacedAdjacency(components, nodes)
+        self.incident_edges = NamespacedIncidentEdges(components, nodes)
+        self.clear_neighbourhood_cache()
+        
+        self.components = list(components.items())
+        self.retained_hashes = set(retained_hashes) if retained_hashes else None
+        self.is_loaded = True
+    
+    def swap_in(self, other: 'GraphService'):
+        """
+        Reemplaza todo el estado de este servicio por el de otro ya construido
+        
+        Es una sola asignación: las consultas nuevas ven el grafo completo nuevo
+        y las que están en curso terminan con el anterior (ver _pinned_state).
+        """
+        self.__dict__ = other.__dict__
+    
+    def pinned(self) -> 'GraphService':
+        """
+        Vista fija del grafo vigente: no cambia aunque después se haga swap_in
+
+        Para una consulta completa: los ids namespaced ("grafo:n12") de las
+        anotaciones, el reranking y el contexto son todos de la misma versión.
+        """
+        pinned = object.__new__(type(self))
+        pinned.__dict__ = self.__dict__
+        return pinned
+    
+    def build_indexes(self):
+        """Construye ahora los índices que se arman en el primer uso (para hacerlo en segundo plano)"""
+        if not self.is_loaded:
+            return
+        self._get_entity_matcher()
+        self._get_node_search_index()
+        if settings.GRAPH_RERANK_METHOD == "pagerank":
+            try:
+                self.pagerank.prepare()
+            except ImportError:
+                pass  # Sin scipy el reranking usa entidades en común
+    
+    def source_changed(self) -> bool:
+        """
+        ¿Cambió el archivo de origen desde que se cargó?
+        
+        Primero se compara el mtime (barato); solo si cambió se compara el sha1
+        del contenido con content_hash. Si el archivo solo se tocó, se recuerda
+        el mtime nuevo para no volver a calcular el hash.
+        """
+        if not self.source_path or not self.is_loaded:
+            return False
+        try:
+            mtime = os.stat(self.source_path).st_mtime_ns
+            if mtime == self.source_mtime:
+                return False
+            if is_snapshot(self.source_path):
+                changed = GraphSnapshot.read_meta(self.source_path).get('content_hash') != self.content_hash
+            else:
+                changed = file_sha1(self.source_path) != self.content_hash
+        except Exception:
+            return False  # Archivo borrado o a medio escribir: se revisa en la próxima pasada
+        if not changed:
+            self.source_mtime = mtime
+        return changed
+    
+    def unload(self):
+        """Descargar el grafo (el servicio queda como recién creado)"""
+        self.is_loaded = False
+        self.graph = None
+        self.nodes = {}
+        self.edges = []
+        self.node_by_label = {}
+        self.node_by_id = {}
+        self._label_order = []
+        self._labels_lower = []
+        self._node_position = {}
+        self._trigram_postings = {}
+        self._first_short_gram = {}
+        self._entity_matcher = None
+        self._node_search_index = None
+        self.adjacency = {}
+        self.incident_edges = {}
+        self.clear_neighbourhood_cache()
+        self.pagerank.clear()
+        self.content_hash = None
+        self.components = []
+        self.retained_hashes = None
+    
+    def _build_incident_edges(self):
+        """
+        Índice de edges por nodo (entrantes y salientes), ordenados por peso
+        
+        get_entity_context queda en O(grado) en vez de recorrer todos los edges.
+        A igual peso se conserva el orden del JSON.
+        """
+        incident = {}
+        for edge in self.edges:
+            incident.setdefault(edge['source'], []).append(edge)
+            if edge['target'] != edge['source']:
+                incident.setdefault(edge['target'], []).append(edge)
+        
+        for node_edges in incident.values():
+            node_edges.sort(key=lambda edge: edge.get('weight', 0.5), reverse=True)
+        self.incident_edges = incident
+    
+    def _build_label_index(self):
+        """
+        Índices de labels para resolver referencias sin recorrer todos los nodos:
+        - trigramas → posiciones (en orden) de los labels que los contienen
+        - substrings de 1-2 caracteres → primera posición que los contiene
+        """
+        self._index_node_order()
+        self._trigram_postings = {}
+        self._first_short_gram = {}
+        
+        postings_by_gram = self._trigram_postings
+        first_short = self._first_short_gram
+        for position, label in enumerate(self._labels_lower):
+            for gram in {label[i:i + 2] for i in range(len(label) - 1)}.union(label):
+                if gram not in first_short:
+                    first_short[gram] = position
+            for gram in {label[i:i + 3] for i in range(len(label) - 2)}:
+                postings = postings_by_gram.get(gram)
+                if postings is None:
+                    postings_by_gram[gram] = [position]
+                else:
+                    postings.append(position)
+        
+        self._entity_matcher = None
+        self._node_search_index = None
+    
+    def _index_node_order(self):
+        """Orden de los nodos (posiciones) y sus labels en minúsculas"""
+        self._label_order = list(self.nodes.keys())
+        self._node_position = {node_id: position for position, node_id in enumerate(self._label_order)}
+        self._labels_lower = [self.nodes[node_id].get('label', '').lower() for node_id in self._label_order]
+    
+    def _get_entity_matcher(self) -> Tuple[AhoCorasick, List[List[int]]]:
+        """
+        Autómata sobre los labels distintos (detección de entidades en textos)
+        
+        Se construye en el primer uso y no al cargar: es el índice más caro y
+        un grafo puede cargarse sin que se extraigan entidades.
+        """
+        matcher = self._entity_matcher
+        if matcher is None:
+            labels = {}
+            for position, label in enumerate(self._labels_lower):
+                labels.setdefault(label, []).append(position)
+            matcher = self._entity_matcher = (AhoCorasick(labels.keys()), list(labels.values()))
+        return matcher
+
+    
+    def _find_label_containing(self, ref_lower: str) -> Optional[str]:
+        """Primer nodo (en orden del JSON) cuyo label contiene ref_lower"""
+        if not self._label_order:
+            return None
+        if not ref_lower:
+            return self._label_order[0]
+        
+        if len(ref_lower) <= 2:
+            position = self._first_short_gram.get(ref_lower)
+            return self._label_order[position] if position is not None else None
+        
+        # Candidatos: labels con el trigrama menos frecuente de la referencia
+        shortest = None
+        for i in range(len(ref_lower) - 2):
+            postings = self._trigram_postings.get(ref_lower[i:i + 3])
+            if postings is None:
+                return None
+            if shortest is None or len(postings) < len(shortest):
+                shortest = postings
+        
+        # Primer candidato que contiene la referencia completa (filtrado en C, se detiene al encontrarlo)
+        candidates = map(self._labels_lower.__getitem__, shortest)
+        position = next(compress(shortest, map(str.__contains__, candidates, repeat(ref_lower))), None)
+        return self._label_order[position] if position is not None else None
+    
     def _find_node_by_id_or_label(self, node_ref: str) -> Optional[str]:
         """
         Encuentra un nodo por ID o label
         node_ref puede ser un ID como 'E1' o un label
+        
+        Orden: label exacto → "id" del nodo en el JSON → label que contiene
+        la referencia → 'E<n>' como índice. Cada paso es un lookup en los
+        índices de _build_label_index (no se recorren los nodos).
         """
+        if node_ref is None:
+            return None
+        node_ref = str(node_ref)
+        ref_lower = node_ref.lower()
+        
         # Buscar primero por label exact
-        for node_id, node in self.nodes.items():
-            if node.get('label', '').lower() == node_ref.lower():
-                return node_id
+        exact = self.node_by_label.get(ref_lower)
+        if exact:
+            return exact[0]
+        
+        if node_ref in self.node_by_id:
+            return self.node_by_id[node_ref]
         
         # Si no encuentra, buscar por coincidencia parcial
-        for node_id, node in self.nodes.items():
-            if node_ref.lower() in node.get('label', '').lower():
-                return node_id
+        partial = self._find_label_containing(ref_lower)
+        if partial:
+            return partial
         
         # Si aún no encuentra y es un ID corto, tomar el primer nodo
         # (fallback para when IDs no corresponden directo)
@@ -145,40 +484,35 @@ class GraphService:
         
         return None
     
-    def find_nodes_by_text(self, text: str, top_k: int = 5) -> List[Dict]:
+    @_pinned_state
+    def find_nodes_by_text(self, text: str, top_k: int = 5, prefix: bool = True) -> List[Dict]:
         """
         Buscar nodos que coincidan con el texto
-        Busca en labels y descriptions
+        Busca en labels y descriptions (índice invertido de términos, ver node_search_index)
+        
+        prefix: un término también coincide con los que empiezan con él ("trabaj" → "trabajador")
         """
         if not self.is_loaded:
             return []
         
         # Normalizar texto de búsqueda
-        search_terms = set(text.lower().split())
+        search_terms = token_set(text)
         
-        scored_nodes = []
-        
-        for node_id, node in self.nodes.items():
-            label = node.get('label', '').lower()
-            description = node.get('description', '').lower()
-            
-            # Score por coincidencia en label (más importante)
-            label_score = sum(1 for term in search_terms if term in label)
-            
-            # Score por coincidencia en description
-            desc_score = sum(1 for term in search_terms if term in description) * 0.5
-            
-            total_score = label_score + desc_score
-            
-            if total_score > 0:
-                scored_nodes.append((node_id, node, total_score))
-        
-        # Ordenar por score
-        scored_nodes.sort(key=lambda x: x[2], reverse=True)
-        
-        return [{'id': nid, **node, 'match_score': score} 
-                for nid, node, score in scored_nodes[:top_k]]
+        index = self._get_node_search_index()
+        return [{'id': self._label_order[position], **self.nodes[self._label_order[position]], 'match_score': score}
+                for position, score in index.search(search_terms, top_k, prefix)]
     
+    def _get_node_search_index(self) -> NodeSearchIndex:
+        """Índice de términos de labels y descriptions (se construye en el primer uso)"""
+        index = self._node_search_index
+        if index is None:
+            index = self._node_search_index = NodeSearchIndex(
+                (self.nodes[node_id].get('_label_search', ''), self.nodes[node_id].get('_desc_search', ''))
+                for node_id in self._label_order
+            )
+        return index
+    
+    @_pinned_state
     def get_related_nodes(self, node_id: str, max_depth: int = 2) -> Set[str]:
         """
         Obtener todos los nodos relacionados a uno dado
@@ -186,6 +520,16 @@ class GraphService:
         """
         if not self.is_loaded or node_id not in self.nodes:
             return set()
+        return set(self._neighbourhood(node_id, max_depth))
+    
+    def _neighbourhood(self, node_id: str, max_depth: int) -> frozenset:
+        """Vecindario k-hop de un nodo (memoizado en un LRU acotado)"""
+        key = (node_id, max_depth)
+        with self._neighbourhood_lock:
+            cached = self._neighbourhood_cache.get(key)
+            if cached is not None:
+                self._neighbourhood_cache.move_to_end(key)
+                return cached
         
         related = {node_id}
         to_explore = {node_id}
@@ -205,8 +549,19 @@ class GraphService:
             to_explore = next_layer
             current_depth += 1
         
+        related = frozenset(related)
+        with self._neighbourhood_lock:
+            self._neighbourhood_cache[key] = related
+            while len(self._neighbourhood_cache) > self._neighbourhood_cache_size:
+                self._neighbourhood_cache.popitem(last=False)
         return related
     
+    def clear_neighbourhood_cache(self):
+        """Descarta los vecindarios memoizados (al cargar o descargar un grafo)"""
+        with self._neighbourhood_lock:
+            self._neighbourhood_cache.clear()
+    
+    @_pinned_state
     def extract_entities_from_text(self, text: str) -> Dict[str, List[Dict]]:
         """
         Extraer entidades mencionadas en el texto usando el grafo
@@ -214,28 +569,52 @@ class GraphService:
         """
         if not self.is_loaded:
             return {}
+        return self.entities_from_ids(self.entity_ids_in_text(text))
+    
+    @_pinned_state
+    def entity_ids_in_text(self, text: str) -> List[str]:
+        """Ids de los nodos cuyo label aparece en el texto, en el orden del grafo"""
+        if not self.is_loaded:
+            return []
         
-        text_lower = text.lower()
+        # Labels que aparecen en el texto (case insensitive), en una sola pasada del autómata
+        automaton, pattern_positions = self._get_entity_matcher()
+        matched = sorted(
+            position
+            for pattern in automaton.find_all(text.lower())
+            for position in pattern_positions[pattern]
+        )
+        return [self._label_order[position] for position in matched]
+    
+    @_pinned_state
+    def entities_from_ids(self, node_ids) -> Dict[str, List[Dict]]:
+        """
+        Agrupa ids de nodos por tipo, con el mismo formato que extract_entities_from_text
+        (sirve para las anotaciones precalculadas de los chunks)
+        """
+        positions = sorted(self._node_position[node_id] for node_id in node_ids
+                           if node_id in self._node_position)
         entities_found = {}
         
-        for node_id, node in self.nodes.items():
+        for position in positions:
+            node_id = self._label_order[position]
+            node = self.nodes[node_id]
             label = node.get('label', '')
             node_type = node.get('type', 'unknown')
             
-            # Buscar el label en el texto (case insensitive)
-            if label.lower() in text_lower:
-                if node_type not in entities_found:
-                    entities_found[node_type] = []
-                
-                entities_found[node_type].append({
-                    'id': node_id,
-                    'label': label,
-                    'type': node_type,
-                    'description': node.get('description', '')
-                })
+            if node_type not in entities_found:
+                entities_found[node_type] = []
+            
+            entities_found[node_type].append({
+                'id': node_id,
+                'label': label,
+                'type': node_type,
+                'description': node.get('description', '')
+            })
         
         return entities_found
     
+    @_pinned_state
     def get_entity_context(self, node_id: str) -> str:
         """
         Obtener contexto enriquecido de una entidad
@@ -251,15 +630,12 @@ class GraphService:
         if node.get('description'):
             context += f"Descripción: {node.get('description')}\n"
         
-        # Encontrar edges relacionados
-        related_edges = []
-        for edge in self.edges:
-            if edge.get('source') == node_id or edge.get('target') == node_id:
-                related_edges.append(edge)
+        # Edges relacionados (ya ordenados por peso)
+        related_edges = self.incident_edges.get(node_id, [])
         
         if related_edges:
             context += "\nRelaciones:\n"
-            for edge in related_edges[:5]:  # Limitar a 5 relaciones
+            for edge in related_edges[:5]:  # Limitar a las 5 relaciones de mayor peso
                 relation = edge.get('relation', 'connected_to')
                 if edge.get('source') == node_id:
                     target_id = edge.get('target')
@@ -272,10 +648,12 @@ class GraphService:
         
         return context
     
+    @_pinned_state
     def rerank_documents_with_graph(self, 
                                    query: str, 
                                    documents: List[Dict],
-                                   boost_factor: float = 0.3) -> List[Dict]:
+                                   boost_factor: float = 0.3,
+                                   method: str = None) -> List[Dict]:
         """
         Reranking de documentos usando información del grafo
         
@@ -285,7 +663,14 @@ class GraphService:
         3. Boostar score de documentos con más entidades relacionadas
         
         boost_factor: qué tanto boost dar (0-1, recomendado 0.2-0.4)
+        method: "overlap" (entidades en común con la query) o "pagerank"
+                (masa de PageRank personalizado de las entidades del documento);
+                por defecto settings.GRAPH_RERANK_METHOD
         """
+        method = method or settings.GRAPH_RERANK_METHOD
+        if method not in RERANK_METHODS:
+            raise ValueError(f"Método de reranking desconocido: {method} (opciones: {', '.join(RERANK_METHODS)})")
+        
         if not self.is_loaded or not documents:
             return documents
         
@@ -296,9 +681,21 @@ class GraphService:
             return documents
         
         # Aplanar lista de entidades encontradas
-        all_query_entities = []
+        all_query_entities = set()
         for entity_type, entities in query_entities.items():
-            all_query_entities.extend([e['id'] for e in entities])
+            all_query_entities.update(e['id'] for e in entities)
+        
+        if method == "pagerank" and not self._pagerank_unavailable:
+            try:
+                return self._rerank_with_pagerank(all_query_entities, documents, boost_factor)
+            except ImportError:
+                self._pagerank_unavailable = True
+                print("⚠️  scipy no instalado: reranking por entidades en común")
+        
+        # Relaciones indirectas: solo dependen de la query, se calculan una vez
+        related_to_query = set()
+        for entity_id in all_query_entities:
+            related_to_query.update(self._neighbourhood(entity_id, 1))
         
         # Para cada documento, calcular factor de boost
         reranked = []
@@ -306,22 +703,13 @@ class GraphService:
         for doc in documents:
             doc_copy = doc.copy()
             
-            # Extraer entidades del documento
-            doc_entities = self.extract_entities_from_text(doc.get('text', ''))
-            doc_entity_ids = []
-            for entity_type, entities in doc_entities.items():
-                doc_entity_ids.extend([e['id'] for e in entities])
+            # Entidades del documento: anotación precalculada o, si no hay, detección en el texto
+            doc_entity_ids = self._document_entity_ids(doc)
             
             # Calcular superposición de entidades
-            matching_entities = set(all_query_entities) & set(doc_entity_ids)
+            matching_entities = all_query_entities & doc_entity_ids
             
             if matching_entities:
-                # Calcular también relaciones indirectas
-                related_to_query = set()
-                for entity_id in all_query_entities:
-                    related = self.get_related_nodes(entity_id, max_depth=1)
-                    related_to_query.update(related)
-                
                 connectivity_score = len(matching_entities & related_to_query) / len(related_to_query) if related_to_query else 0
                 
                 # Aplicar boost
@@ -341,6 +729,88 @@ class GraphService:
         
         return reranked
     
+    def _rerank_with_pagerank(self, query_entities: Set[str], documents: List[Dict],
+                              boost_factor: float) -> List[Dict]:
+        """
+        Reranking por PageRank personalizado sembrado en las entidades de la query
+        
+        El score de un documento es la masa promedio de las entidades que menciona
+        (no solo las de la query): el promedio, y no la suma, evita favorecer a los
+        chunks que nombran muchas entidades. El boost es proporcional a ese score,
+        relativo al mejor documento entre los candidatos.
+        """
+        scores, position = self.pagerank.node_scores(query_entities)
+        
+        # Masa promedio por documento en una sola operación: posiciones de todas las entidades + índice del documento
+        doc_entity_ids = [self._document_entity_ids(doc) for doc in documents]
+        positions, owners = [], []
+        for index, entity_ids in enumerate(doc_entity_ids):
+            for node_id in entity_ids:
+                node_position = position.get(node_id)
+                if node_position is not None:
+                    positions.append(node_position)
+                    owners.append(index)
+        if positions:
+            totals = np.bincount(owners, weights=scores[positions], minlength=len(documents))
+            counts = np.bincount(owners, minlength=len(documents))
+            masses = np.divide(totals, counts, out=np.zeros(len(documents)), where=counts > 0)
+        else:
+            masses = np.zeros(len(documents))
+        top_mass = masses.max()
+        
+        reranked = []
+        for doc, entity_ids, mass in zip(documents, doc_entity_ids, masses.tolist()):
+            doc_copy = doc.copy()
+            boost = boost_factor * mass / top_mass if top_mass > 0 else 0
+            doc_copy['score'] = doc.get('score', 0) + boost
+            doc_copy['graph_boost'] = boost
+            doc_copy['matching_entities'] = list(query_entities & entity_ids)
+            reranked.append(doc_copy)
+        
+        reranked.sort(key=lambda x: x['score'], reverse=True)
+        return reranked
+    
+    def _document_entity_ids(self, doc: Dict) -> Set[str]:
+        """Ids de las entidades de un documento (anotadas al ingresar o detectadas en su texto)"""
+        if doc.get('entity_ids') is not None:
+            return set(doc['entity_ids'])
+        return set(self.entity_ids_in_text(doc.get('text', '')))
+    
+    @_pinned_state
+    def get_context_blocks(self,
+                           query: str,
+                           documents: List[Dict],
+                           max_entities: int = 5) -> List[str]:
+        """
+        Bloques de contexto del grafo (uno por entidad), ordenados por relevancia:
+        primero las entidades de la query, luego las de los documentos en su orden.
+        El ContextBuilder los empaqueta según su presupuesto de tokens.
+        """
+        if not self.is_loaded:
+            return []
+        
+        relevant_entities = []
+        seen = set()
+        entity_groups = [self.extract_entities_from_text(query)]
+        entity_groups += [self.entities_from_ids(self._document_entity_ids(doc)) for doc in documents]
+        for groups in entity_groups:
+            for entity_type, entities in groups.items():
+                for entity in entities:
+                    if entity['id'] not in seen:
+                        seen.add(entity['id'])
+                        relevant_entities.append(entity['id'])
+        
+        blocks = []
+        for entity_id in relevant_entities:
+            if len(blocks) >= max_entities:
+                break
+            entity_context = self.get_entity_context(entity_id)
+            if entity_context:
+                blocks.append(entity_context)
+        
+        return blocks
+    
+    @_pinned_state
     def enrich_context(self, 
                       query: str,
                       documents: List[Dict],
@@ -348,43 +818,19 @@ class GraphService:
         """
         Enriquecer contexto con información del grafo
         
-        Retorna: string con contexto enriquecido del grafo
+        Retorna: string con contexto enriquecido del grafo (sin límite de tamaño;
+        para acotar tokens usar get_context_blocks + ContextBuilder)
         """
-        if not self.is_loaded:
-            return ""
-        
-        # Encontrar entidades relevantes
-        relevant_entities = set()
-        
-        # De la query
-        query_entities = self.extract_entities_from_text(query)
-        for entity_type, entities in query_entities.items():
-            relevant_entities.update([e['id'] for e in entities])
-        
-        # De los documentos
-        for doc in documents:
-            doc_entities = self.extract_entities_from_text(doc.get('text', ''))
-            for entity_type, entities in doc_entities.items():
-                relevant_entities.update([e['id'] for e in entities])
-        
-        if not relevant_entities:
+        blocks = self.get_context_blocks(query, documents, max_entities)
+        if not blocks:
             return ""
         
-        # Construir contexto del grafo
         context = "📊 CONTEXTO DEL GRAFO DE CONOCIMIENTO:\n\n"
-        
-        added = 0
-        for entity_id in list(relevant_entities)[:max_entities]:
-            entity_context = self.get_entity_context(entity_id)
-            if entity_context:
-                context += entity_context + "\n---\n"
-                added += 1
-        
-        if added > 0:
-            return context
-        
-        return ""
+        for entity_context in blocks:
+            context += entity_context + "\n---\n"
+        return context
     
+    @_pinned_state
     def get_stats(self) -> Dict:
         """Obtener estadísticas del grafo"""
         if not self.is_loaded:
@@ -0,0 +1,423 @@
+"""
+Snapshots binarios de grafos (.npz sin comprimir)
+
+El JSON sigue siendo el formato de intercambio (lo escriben los builders y se
+puede editar a mano), pero cargarlo implica parsear todo el archivo, resolver
+las referencias de cada edge y reconstruir los índices. El snapshot guarda el
+resultado ya compilado por GraphService:
+- Tabla de strings internados (labels, tipos, descripciones, relaciones):
+  un blob UTF-8 + offsets
+- Nodos: una columna por campo de texto (índice en la tabla de strings) y los
+  campos no textuales como JSON compacto
+- Edges ya resueltos a posiciones de nodos (source, target, relación, peso)
+- Adyacencia no dirigida en formato CSR (indptr + indices)
+- Edges incidentes por nodo en CSR, ordenados por peso
+
+Carga: los arrays se mapean en memoria (np.memmap sobre los miembros del zip,
+que se guardan sin comprimir); la adyacencia y los edges se leen al consultarlos,
+solo los nodos se materializan.
+
+El snapshot guarda el hash del JSON de origen: GraphService.content_hash es el
+mismo con ambos formatos (las anotaciones de chunks siguen siendo válidas) y
+preferred_graph_path() usa el snapshot solo si corresponde al JSON actual.
+"""
+import hashlib
+import json
+import os
+import struct
+import zipfile
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = ".npz"
+EXTRA_FIELD = "__extra__"  # Columna con los campos no textuales de cada nodo (JSON)
+
+
+def snapshot_path_for(json_path: str) -> Path:
+    """Ruta del snapshot que corresponde a un JSON (mismo nombre, extensión .npz)"""
+    return Path(json_path).with_suffix(SNAPSHOT_SUFFIX)
+
+
+def is_snapshot(path: str) -> bool:
+    return Path(path).suffix.lower() == SNAPSHOT_SUFFIX
+
+
+def file_sha1(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _encode_strings(strings: List[str]):
+    """Blob UTF-8 + offsets en caracteres (se decodifica una vez y se corta por slices)"""
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    if strings:
+        offsets[1:] = np.cumsum([len(s) for s in strings])
+    blob = np.frombuffer("".join(strings).encode('utf-8'), dtype=np.uint8)
+    return blob, offsets
+
+
+def _decode_strings(blob: np.ndarray, offsets: np.ndarray) -> List[str]:
+    text = blob.tobytes().decode('utf-8')
+    bounds = offsets.tolist()
+    return [text[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+def _csr(rows: List[List[int]]):
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    if rows:
+        indptr[1:] = np.cumsum([len(row) for row in rows])
+    indices = np.fromiter((i for row in rows for i in row), dtype=np.int32, count=int(indptr[-1]))
+    return indptr, indices
+
+
+def write_snapshot(graph, output_path: str, source: str = None) -> Path:
+    """
+    Escribe el snapshot de un GraphService ya cargado desde JSON
+
+    La escritura es atómica (archivo temporal + rename): un proceso que tenga
+    mapeado el snapshot anterior sigue leyendo el archivo viejo.
+    """
+    if not graph.is_loaded:
+        raise ValueError("El grafo no está cargado")
+
+    node_ids = list(graph.nodes.keys())
+    position = {node_id: i for i, node_id in enumerate(node_ids)}
+
+    strings = {}
+
+    def intern(value: str) -> int:
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    # Nodos: columnas para los campos de texto, el resto como JSON compacto
+    fields = []
+    for node in graph.nodes.values():
+        for key, value in node.items():
+            if isinstance(value, str) and key not in fields:
+                fields.append(key)
+    fields.append(EXTRA_FIELD)
+    field_index = {field: i for i, field in enumerate(fields)}
+
+    columns = np.full((len(fields), len(node_ids)), -1, dtype=np.int32)
+    for column, node in enumerate(graph.nodes.values()):
+        extra = {}
+        for key, value in node.items():
+            if isinstance(value, str):
+                columns[field_index[key], column] = intern(value)
+            else:
+                extra[key] = value
+        if extra:
+            columns[field_index[EXTRA_FIELD], column] = intern(
+                json.dumps(extra, ensure_ascii=False, separators=(',', ':'))
+            )
+
+    # Edges resueltos (mismo orden que GraphService.edges)
+    edges = list(graph.edges)
+    edge_source = np.fromiter((position[e['source']] for e in edges), dtype=np.int32, count=len(edges))
+    edge_target = np.fromiter((position[e['target']] for e in edges), dtype=np.int32, count=len(edges))
+    edge_relation = np.fromiter((intern(str(e.get('relation', 'related_to'))) for e in edges),
+                                dtype=np.int32, count=len(edges))
+    edge_weight = np.fromiter((float(e.get('weight', 0.5)) for e in edges), dtype=np.float64, count=len(edges))
+
+    adjacency = [sorted(position[n] for n in graph.adjacency.get(node_id, ())) for node_id in node_ids]
+
+    # Edges incidentes: mismo orden que GraphService._build_incident_edges (peso desc, estable)
+    incident = [[] for _ in node_ids]
+    for i, (start, end) in enumerate(zip(edge_source.tolist(), edge_target.tolist())):
+        incident[start].append(i)
+        if end != start:
+            incident[end].append(i)
+    weights = edge_weight.tolist()
+    for row in incident:
+        row.sort(key=lambda i: weights[i], reverse=True)
+    adj_indptr, adj_indices = _csr(adjacency)
+    inc_indptr, inc_edges = _csr(incident)
+
+    string_list = list(strings)  # Orden de inserción = índice
+    strings_text, strings_offsets = _encode_strings(string_list)
+
+    meta = {
+        'version': SNAPSHOT_VERSION,
+        'content_hash': graph.content_hash,
+        'source': source,
+        'metadata': (graph.graph or {}).get('metadata', {}),
+        'node_fields': fields,
+        'nodes': len(node_ids),
+        'edges': len(edges)
+    }
+
+    output_path = Path(output_path)
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    with open(tmp_path, 'wb') as f:
+        np.savez(
+            f,
+            meta=np.frombuffer(json.dumps(meta, ensure_ascii=False).encode('utf-8'), dtype=np.uint8),
+            strings_text=strings_text,
+            strings_offsets=strings_offsets,
+            node_columns=columns,
+            edge_source=edge_source,
+            edge_target=edge_target,
+            edge_relation=edge_relation,
+            edge_weight=edge_weight,
+            adj_indptr=adj_indptr,
+            adj_indices=adj_indices,
+            inc_indptr=inc_indptr,
+            inc_edges=inc_edges
+        )
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def convert_json_to_snapshot(json_path: str, output_path: str = None, source: str = None) -> Path:
+    """
+    Carga un JSON con GraphService (misma resolución de edges) y escribe su snapshot
+
+    source: nombre del JSON que se guarda en los metadatos (default: el de json_path)
+    """
+    from services.graph_service import GraphService
+
+    graph = GraphService()
+    if not graph.load_graph(str(json_path)):
+        raise ValueError(f"No se pudo cargar el grafo: {json_path}")
+    return write_snapshot(graph, output_path or snapshot_path_for(json_path), source=source or Path(json_path).name)
+
+
+def _map_npz_members(path: str) -> Dict[str, np.ndarray]:
+    """
+    Mapea en memoria los arrays de un .npz sin comprimir
+
+    np.load ignora mmap_mode para .npz; como los miembros están guardados sin
+    comprimir, cada array es un bloque contiguo del archivo y se puede mapear
+    directamente (después del header local del zip y el header .npy).
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"Snapshot comprimido (no se puede mapear): {info.filename}")
+
+            f.seek(info.header_offset)
+            local_header = f.read(30)
+            name_length, extra_length = struct.unpack('<HH', local_header[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject:
+                raise ValueError(f"Array con objetos en el snapshot: {info.filename}")
+
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.empty(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(),
+                                         shape=shape, order='F' if fortran_order else 'C')
+    return arrays
+
+
+class GraphSnapshot:
+    """Snapshot abierto: arrays mapeados en memoria + tabla de strings decodificada"""
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        self.arrays = _map_npz_members(self.path)
+        self.meta = json.loads(self.arrays['meta'].tobytes().decode('utf-8'))
+        if self.meta.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Versión de snapshot no soportada: {self.meta.get('version')} "
+                             f"(esperada {SNAPSHOT_VERSION}); regenerarlo con convert_graph.py")
+        self.strings = _decode_strings(self.arrays['strings_text'], self.arrays['strings_offsets'])
+        self.node_ids = [f"n{i}" for i in range(self.meta['nodes'])]
+        self._node_position = None
+
+    @staticmethod
+    def read_meta(path: str) -> Dict:
+        """Lee solo los metadatos (sin mapear el resto)"""
+        with zipfile.ZipFile(path) as archive, archive.open('meta.npy') as f:
+            return json.loads(np.lib.format.read_array(f).tobytes().decode('utf-8'))
+
+    @property
+    def content_hash(self) -> Optional[str]:
+        return self.meta.get('content_hash')
+
+    @property
+    def metadata(self) -> Dict:
+        return self.meta.get('metadata', {})
+
+    @property
+    def node_position(self) -> Dict[str, int]:
+        if self._node_position is None:
+            self._node_position = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        return self._node_position
+
+    def node_dicts(self, include_private: bool = True) -> List[Dict]:
+        """
+        Nodos como diccionarios (mismo contenido que GraphService.nodes)
+
+        include_private=False omite los campos internos de GraphService (_label_search, ...)
+        """
+        fields = self.meta['node_fields']
+        strings = self.strings
+        columns = [self.arrays['node_columns'][i].tolist() for i in range(len(fields))]
+
+        nodes = []
+        for column in range(len(self.node_ids)):
+            node = {}
+            for field, values in zip(fields, columns):
+                index = values[column]
+                if index < 0:
+                    continue
+                if field == EXTRA_FIELD:
+                    node.update(json.loads(strings[index]))
+                elif include_private or not field.startswith('_'):
+                    node[field] = strings[index]
+            nodes.append(node)
+        return nodes
+
+    def to_document(self) -> Dict:
+        """
+        Grafo en el formato de intercambio JSON ({metadata, nodes, edges})
+
+        Los extremos de cada edge se escriben con el "id" del nodo si lo tiene,
+        si no con su label. Los nodos sin "id" cuyo label se repite reciben su
+        node_id como "id", para que GraphService los vuelva a resolver al mismo nodo.
+        """
+        nodes = self.node_dicts(include_private=False)
+        label_counts = {}
+        for node in nodes:
+            label = node.get('label', '').lower()
+            label_counts[label] = label_counts.get(label, 0) + 1
+
+        refs = []
+        for node_id, node in zip(self.node_ids, nodes):
+            if node.get('id') is None and label_counts[node.get('label', '').lower()] > 1:
+                node['id'] = node_id
+            refs.append(str(node['id']) if node.get('id') is not None else node.get('label', ''))
+        return {
+            'metadata': self.metadata,
+            'nodes': nodes,
+            'edges': [
+                {'source': refs[source], 'target': refs[target], 'relation': relation, 'weight': weight}
+                for source, target, relation, weight in zip(
+                    self.arrays['edge_source'].tolist(),
+                    self.arrays['edge_target'].tolist(),
+                    (self.strings[i] for i in self.arrays['edge_relation'].tolist()),
+                    self.arrays['edge_weight'].tolist()
+                )
+            ]
+        }
+
+
+class SnapshotEdges(Sequence):
+    """GraphService.edges sobre los arrays del snapshot (cada edge se arma al leerlo)"""
+
+    def __init__(self, snapshot: GraphSnapshot):
+        self._snapshot = snapshot
+        arrays = snapshot.arrays
+        self._source = arrays['edge_source']
+        self._target = arrays['edge_target']
+        self._relation = arrays['edge_relation']
+        self._weight = arrays['edge_weight']
+
+    def __len__(self) -> int:
+        return len(self._source)
+
+    def position_arrays(self):
+        """(origen, destino, peso) de todos los edges; nodos como posición en el snapshot"""
+        return self._source, self._target, self._weight
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        node_ids, strings = self._snapshot.node_ids, self._snapshot.strings
+        return {
+            'source': node_ids[self._source[index]],
+            'target': node_ids[self._target[index]],
+            'relation': strings[self._relation[index]],
+            'weight': float(self._weight[index])
+        }
+
+    def __iter__(self):
+        node_ids, strings = self._snapshot.node_ids, self._snapshot.strings
+        for source, target, relation, weight in zip(self._source.tolist(), self._target.tolist(),
+                                                    self._relation.tolist(), self._weight.tolist()):
+            yield {'source': node_ids[source], 'target': node_ids[target],
+                   'relation': strings[relation], 'weight': weight}
+
+
+class CSRAdjacency(Mapping):
+    """GraphService.adjacency ({node_id: vecinos}) leída del CSR mapeado en memoria"""
+
+    def __init__(self, snapshot: GraphSnapshot):
+        self._snapshot = snapshot
+        self._indptr = snapshot.arrays['adj_indptr']
+        self._indices = snapshot.arrays['adj_indices']
+
+    def __getitem__(self, node_id: str) -> frozenset:
+        position = self._snapshot.node_position[node_id]
+        start, end = int(self._indptr[position]), int(self._indptr[position + 1])
+        node_ids = self._snapshot.node_ids
+        return frozenset(node_ids[i] for i in self._indices[start:end].tolist())
+
+    def __iter__(self):
+        return iter(self._snapshot.node_ids)
+
+    def __len__(self) -> int:
+        return len(self._snapshot.node_ids)
+
+
+class CSRIncidentEdges(Mapping):
+    """GraphService.incident_edges ({node_id: [edges por peso]}) leída del CSR"""
+
+    def __init__(self, snapshot: GraphSnapshot, edges: SnapshotEdges):
+        self._snapshot = snapshot
+        self._edges = edges
+        self._indptr = snapshot.arrays['inc_indptr']
+        self._indices = snapshot.arrays['inc_edges']
+
+    def __getitem__(self, node_id: str) -> List[Dict]:
+        position = self._snapshot.node_position[node_id]
+        start, end = int(self._indptr[position]), int(self._indptr[position + 1])
+        return [self._edges[i] for i in self._indices[start:end].tolist()]
+
+    def __iter__(self):
+        return iter(self._snapshot.node_ids)
+
+    def __len__(self) -> int:
+        return len(self._snapshot.node_ids)
+
+
+def preferred_graph_path(json_path: str) -> str:
+    """
+    Snapshot del JSON si existe y fue generado desde su contenido actual; si no, el JSON
+
+    Comparar el hash es barato (leer y hashear el JSON) frente a parsearlo.
+    """
+    if is_snapshot(json_path):
+        return str(json_path)
+    snapshot_path = snapshot_path_for(json_path)
+    if not snapshot_path.exists() or not Path(json_path).exists():
+        return str(json_path)
+    try:
+        meta = GraphSnapshot.read_meta(str(snapshot_path))
+    except Exception:
+        return str(json_path)
+    if meta.get('version') == SNAPSHOT_VERSION and meta.get('content_hash') == file_sha1(json_path):
+        return str(snapshot_path)
+    return str(json_path)
+
+
+def load_graph_document(path: str) -> Dict:
+    """Grafo en formato de intercambio desde un JSON o un snapshot"""
+    if is_snapshot(path):
+        return GraphSnapshot(path).to_document()
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
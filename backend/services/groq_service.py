@@ -1,115 +1,352 @@
 """
 Módulo para conectar con Groq API
 Contiene funciones para:
-- Embeddings (convertir texto a números)
 - Chat (conversación con LLM)
-"""
 
-import os
-from pathlib import Path
-from groq import Groq
+Las llamadas pasan por un backend intercambiable (services/llm_backends.py,
+variable LLM_BACKEND): Groq, un servidor compatible con OpenAI (ej: el stub
+local) o record/replay. Caché, límites de tasa y reintentos aplican a todos.
+Requests idénticas concurrentes se unen en una sola llamada (services/single_flight.py).
+
+El backend (y el .env / cliente Groq) se crean recién en la primera llamada al LLM:
+importar este módulo no requiere API key ni importa el SDK.
+Los embeddings (locales) viven en services/embeddings.py.
+"""
 
-# Cargar API key desde .env (mismo método que test_models.py)
-env_file = Path(__file__).parent.parent / ".env"
-if env_file.exists():
-    with open(env_file, 'r') as f:
-        for line in f:
-            if '=' in line:
-                key, value = line.strip().split('=', 1)
-                os.environ[key] = value
+import asyncio
+import threading
+import weakref
+from config.settings import settings
+from services.embeddings import embed_text, embed_term_counts  # Compatibilidad: antes vivían acá
+from services.llm_backends import LLMBackend, make_backend
+from services.llm_cache import LLMResponseCache
+from services.llm_errors import LLMError, translate_error
+from services.llm_resilience import CircuitBreaker, RetryPolicy
+from services.rate_limiter import RateLimiter
+from services.single_flight import AsyncSingleFlight, SingleFlight
+from services.text_utils import approx_token_count
 
-# Inicializar cliente Groq
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+_backend = None
+_backend_lock = threading.Lock()
 
 # Modelo actual disponible en tu cuenta de Groq
 GROQ_CHAT_MODEL = "llama-3.3-70b-versatile"
 
+# Caché persistente de respuestas (misma request → misma respuesta, sin llamar a Groq)
+response_cache = LLMResponseCache(
+    settings.LLM_CACHE_PATH,
+    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+    max_bytes=int(settings.LLM_CACHE_MAX_MB * 1024 * 1024),
+    ttl_seconds=settings.LLM_CACHE_TTL_SECONDS
+)
+
+# Cuota compartida por llamadas sync y async (RPM + TPM)
+rate_limiter = RateLimiter(settings.LLM_REQUESTS_PER_MINUTE, settings.LLM_TOKENS_PER_MINUTE)
+
+# Reintentos con backoff + circuit breaker (compartidos por sync y async)
+retry_policy = RetryPolicy(
+    CircuitBreaker(settings.LLM_CIRCUIT_FAILURE_THRESHOLD, settings.LLM_CIRCUIT_RESET_SECONDS),
+    max_retries=settings.LLM_MAX_RETRIES,
+    rate_limit_retries=settings.LLM_RATE_LIMIT_RETRIES,
+    backoff_base=settings.LLM_BACKOFF_BASE_SECONDS,
+    backoff_max=settings.LLM_BACKOFF_MAX_SECONDS,
+    rate_limiter=rate_limiter
+)
+
+# Requests idénticas en vuelo: una sola llamada al LLM por clave
+in_flight = SingleFlight()
+async_in_flight = AsyncSingleFlight()
+
+# Semáforo de concurrencia por event loop (no se puede compartir entre loops)
+_async_semaphores = weakref.WeakKeyDictionary()
+
+
+def get_backend() -> LLMBackend:
+    """Backend configurado en LLM_BACKEND, creado en el primer uso"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = make_backend()
+    return _backend
+
+
+def set_backend(backend: LLMBackend):
+    """Reemplaza el backend (benchmarks, pruebas offline)"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
 
-def embed_text(text: str) -> list[float]:
+
+def __getattr__(name):
+    # Compatibilidad: `groq_service.client` sigue funcionando, pero se crea recién al pedirlo
+    if name == "client":
+        return get_backend().client
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _cached_response(backend: LLMBackend, messages: list, temperature: float, max_tokens: int, use_cache: bool):
     """
-    Genera un embedding (vector semántico) del texto usando hashing eficiente.
+    (clave, respuesta en caché o None)
+
+    La clave identifica la request para el caché y el single-flight;
+    es None con use_cache=False (se fuerza una llamada propia).
+    """
+    if not use_cache:
+        return None, None
+    key = LLMResponseCache.make_key(backend.cache_namespace(GROQ_CHAT_MODEL), messages, temperature, max_tokens)
+    if not settings.LLM_CACHE_ENABLED:
+        return key, None
+    return key, response_cache.get(key)
+
+
+def _store_response(backend: LLMBackend, key, response_text: str):
+    if key and response_text and settings.LLM_CACHE_ENABLED:
+        response_cache.set(key, backend.cache_namespace(GROQ_CHAT_MODEL), response_text)
+
+
+def _recheck_cache(key):
+    """El líder vuelve a mirar el caché: otra llamada pudo terminar justo antes"""
+    if key and settings.LLM_CACHE_ENABLED:
+        return response_cache.get(key)
+    return None
+
+
+def _estimate_request_tokens(messages: list, max_tokens: int) -> int:
+    """Tokens a reservar: prompt estimado + máximo de la respuesta"""
+    return sum(approx_token_count(m.get("content", "")) for m in messages) + max_tokens
+
+
+def _chat_completion(messages: list, temperature: float, max_tokens: int, use_cache: bool = True) -> str:
+    """
+    Llamada al LLM pasando por el caché de respuestas
+    
+    Reintenta con backoff los errores transitorios y lanza LLMError si falla.
+    Solo se cachean respuestas exitosas. Llamadas concurrentes idénticas
+    esperan a la primera en lugar de repetirla.
+    """
+    backend = get_backend()
+    key, cached = _cached_response(backend, messages, temperature, max_tokens, use_cache)
+    if cached is not None:
+        return cached
+    
+    reserved = _estimate_request_tokens(messages, max_tokens)
     
-    Opción B: Sin dependencias externas - usa técnicas de TF-IDF sintético.
-    - Tokeniza el texto
-    - Mapea tokens a índices del vector usando hashing
-    - Normaliza para similitud de coseno
+    def request():
+        if backend.rate_limited:
+            rate_limiter.acquire_blocking(reserved)
+        return backend.complete(GROQ_CHAT_MODEL, messages, temperature, max_tokens)
     
-    Entrada: text (str): Texto a convertir
-    Salida: list[float]: Vector de 384 dimensiones (estándar en embeddings)
+    def call() -> str:
+        cached = _recheck_cache(key)
+        if cached is not None:
+            return cached
+        completion = retry_policy.call(request, rate_limited=backend.rate_limited)
+        if backend.rate_limited:
+            rate_limiter.record_usage(reserved, completion.total_tokens)
+        _store_response(backend, key, completion.text)
+        return completion.text
+    
+    if key is None:
+        return call()
+    return in_flight.do(key, call)
+
+
+def _get_async_semaphore() -> asyncio.Semaphore:
+    """Semáforo de concurrencia del event loop actual"""
+    loop = asyncio.get_running_loop()
+    semaphore = _async_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+        _async_semaphores[loop] = semaphore
+    return semaphore
+
+
+async def _achat_completion(messages: list, temperature: float, max_tokens: int, use_cache: bool = True) -> str:
     """
-    import hashlib
-    import numpy as np
+    Versión async de _chat_completion
     
-    try:
-        embedding_dim = 384
-        embedding = np.zeros(embedding_dim)
-        
-        # Tokenizar: dividir por espacios y caracteres especiales
-        tokens = text.lower().split()
-        
-        for token in tokens:
-            # Limpiar puntuación
-            token = ''.join(c for c in token if c.isalnum())
-            if len(token) > 0:
-                # Hash determinístico del token → índice del vector
-                hash_value = int(hashlib.md5(token.encode()).hexdigest(), 16)
-                index = hash_value % embedding_dim
-                # TF-IDF simple: incrementar la dimensión correspondiente
-                embedding[index] += 1.0
-        
-        # Normalizar a norma unitaria (para similitud de coseno)
-        norm = np.linalg.norm(embedding)
-        if norm > 0:
-            embedding = embedding / norm
-        else:
-            # Texto vacío: retornar vector pequeño
-            embedding[0] = 1.0
-        
-        return embedding.tolist()
+    - Máximo LLM_MAX_CONCURRENCY requests en vuelo
+    - Espera cupo en el limitador RPM/TPM antes de cada intento
+    - Mismos reintentos y circuit breaker que la versión sync
+    - Corutinas idénticas en vuelo comparten una sola llamada
+    """
+    backend = get_backend()
+    key, cached = _cached_response(backend, messages, temperature, max_tokens, use_cache)
+    if cached is not None:
+        return cached
     
-    except Exception as e:
-        print(f"❌ Error en embed_text: {e}")
-        return [0.0] * 384  # Retornar vector fallback
+    reserved = _estimate_request_tokens(messages, max_tokens)
+    
+    async def request():
+        if backend.rate_limited:
+            await rate_limiter.acquire(reserved)
+        return await backend.acomplete(GROQ_CHAT_MODEL, messages, temperature, max_tokens)
+    
+    async def call() -> str:
+        cached = _recheck_cache(key)
+        if cached is not None:
+            return cached
+        async with _get_async_semaphore():
+            completion = await retry_policy.acall(request, rate_limited=backend.rate_limited)
+        if backend.rate_limited:
+            rate_limiter.record_usage(reserved, completion.total_tokens)
+        _store_response(backend, key, completion.text)
+        return completion.text
+    
+    if key is None:
+        return await call()
+    return await async_in_flight.do(key, call)
+
+
+def get_cache_stats() -> dict:
+    """Estadísticas del caché de respuestas (hits, misses, entradas, bytes)"""
+    stats = response_cache.get_stats()
+    stats['enabled'] = settings.LLM_CACHE_ENABLED
+    return stats
+
+
+def get_rate_limit_stats() -> dict:
+    """Estadísticas del limitador (429 recibidos, segundos esperando cupo)"""
+    stats = rate_limiter.get_stats()
+    stats['max_concurrency'] = settings.LLM_MAX_CONCURRENCY
+    return stats
+
+
+def get_single_flight_stats() -> dict:
+    """Requests unidas a otra idéntica en vuelo (llamadas ahorradas)"""
+    sync_stats = in_flight.get_stats()
+    async_stats = async_in_flight.get_stats()
+    return {name: sync_stats[name] + async_stats[name] for name in sync_stats}
+
+
+def get_backend_info() -> dict:
+    """Backend activo (sin crearlo si todavía no se usó)"""
+    name = _backend.name if _backend is not None else settings.LLM_BACKEND
+    return {'backend': name, 'model': GROQ_CHAT_MODEL}
+
+
+def get_resilience_stats() -> dict:
+    """Contadores de llamadas, reintentos, fallas y estado del circuit breaker"""
+    return retry_policy.get_stats()
 
 
-def chat_with_doc(query: str, context: str) -> str:
+def _doc_messages(query: str, context: str) -> list:
+    """Mensajes de la consulta legal con contexto (compartidos por todas las variantes)"""
+    return [
+        {
+            "role": "system",
+            "content": "Eres un abogado experto en Derecho Laboral Chileno. Responde basándose SOLO en el contexto proporcionado."
+        },
+        {
+            "role": "user",
+            "content": f"Contexto:\n{context}\n\nPregunta: {query}"
+        }
+    ]
+
+
+def chat_with_doc(query: str, context: str, use_cache: bool = True) -> str:
     """
     Llama a Groq para generar una respuesta
     
     Entrada:
         query (str): Pregunta del usuario
         context (str): Contexto del PDF
+        use_cache (bool): False para ignorar el caché y forzar una llamada nueva
     
     Salida:
         str: Respuesta del LLM
+    
+    Lanza:
+        LLMError: si la llamada falla tras los reintentos (ver services/llm_errors.py)
     """
-    try:
-        # Usar modelo ACTUAL de Groq (llama-3.3-70b-versatile)
-        response = client.chat.completions.create(
-            model=GROQ_CHAT_MODEL,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Eres un abogado experto en Derecho Laboral Chileno. Responde basándose SOLO en el contexto proporcionado."
-                },
-                {
-                    "role": "user",
-                    "content": f"Contexto:\n{context}\n\nPregunta: {query}"
-                }
-            ],
-            temperature=0.3,
-            max_tokens=500
-        )
+    # Usar modelo ACTUAL de Groq (llama-3.3-70b-versatile)
+    return _chat_completion(
+        messages=_doc_messages(query, context),
+        temperature=0.3,
+        max_tokens=500,
+        use_cache=use_cache
+    )
+
+
+def chat_with_doc_stream(query: str, context: str, use_cache: bool = True):
+    """
+    Igual que chat_with_doc, pero entrega la respuesta a medida que se genera
+    
+    Uso:
+        for delta in chat_with_doc_stream(query, context):
+            print(delta, end="", flush=True)
+    
+    Si la respuesta está en caché se entrega completa en un solo trozo.
+    La respuesta completa se guarda en caché al terminar el stream.
+    Si la misma pregunta ya se está generando en otro hilo, se espera esa
+    respuesta y se entrega completa en un solo trozo.
+    Solo se reintenta la apertura del stream: si se corta a mitad de camino
+    se lanza LLMError (no se repiten trozos ya entregados).
+    """
+    messages = _doc_messages(query, context)
+    temperature, max_tokens = 0.3, 500
+    backend = get_backend()
+    
+    key, cached = _cached_response(backend, messages, temperature, max_tokens, use_cache)
+    if cached is not None:
+        yield cached
+        return
+    
+    if key is not None:
+        future, leader = in_flight.acquire(key)
+        if not leader:
+            shared = future.result()
+            if shared:
+                yield shared
+                return
+            # El stream líder se abandonó antes de terminar: hacer la llamada propia
+            yield from chat_with_doc_stream(query, context, use_cache=False)
+            return
+        
+        cached = _recheck_cache(key)
+        if cached is not None:
+            in_flight.release(key, future, cached)
+            yield cached
+            return
         
-        response_text = response.choices[0].message.content
-        return response_text
+        parts = []
+        try:
+            for delta in _stream_completion(backend, messages, temperature, max_tokens):
+                parts.append(delta)
+                yield delta
+        except GeneratorExit:
+            in_flight.release(key, future, None)
+            raise
+        except BaseException as e:
+            in_flight.release(key, future, error=e)
+            raise
+        response = "".join(parts)
+        _store_response(backend, key, response)
+        in_flight.release(key, future, response)
+        return
+    
+    yield from _stream_completion(backend, messages, temperature, max_tokens)
+
+
+def _stream_completion(backend: LLMBackend, messages: list, temperature: float, max_tokens: int):
+    """Deltas de una respuesta en stream (reintenta solo la apertura)"""
+    def request():
+        if backend.rate_limited:
+            rate_limiter.acquire_blocking(_estimate_request_tokens(messages, max_tokens))
+        return backend.open_stream(GROQ_CHAT_MODEL, messages, temperature, max_tokens)
     
+    deltas = retry_policy.call(request, rate_limited=backend.rate_limited)
+    
+    try:
+        yield from deltas
+    except LLMError:
+        raise
     except Exception as e:
-        print(f"❌ Error: {e}")
-        return f"Error: {e}"
+        raise translate_error(e)
 
 
-def chat_simple(prompt: str, temperature: float = 0.7, max_tokens: int = 1000) -> str:
+def chat_simple(prompt: str, temperature: float = 0.7, max_tokens: int = 1000, use_cache: bool = True) -> str:
     """
     Chat simple con el LLM (sin contexto específico)
     
@@ -117,20 +354,47 @@ def chat_simple(prompt: str, temperature: float = 0.7, max_tokens: int = 1000) -
         prompt (str): Prompt para el LLM
         temperature (float): Creatividad (0.0-1.0)
         max_tokens (int): Máximo de tokens a generar
+        use_cache (bool): False para ignorar el caché y forzar una llamada nueva
     
     Salida:
         str: Respuesta del LLM
+    
+    Lanza:
+        LLMError: si la llamada falla tras los reintentos
     """
-    try:
-        response = client.chat.completions.create(
-            model=GROQ_CHAT_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=temperature,
-            max_tokens=max_tokens
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error: {e}"
+    return _chat_completion(
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+        max_tokens=max_tokens,
+        use_cache=use_cache
+    )
+
+
+async def achat_with_doc(query: str, context: str, use_cache: bool = True) -> str:
+    """
+    Versión async de chat_with_doc (respeta concurrencia y límites de la cuenta)
+    """
+    return await _achat_completion(
+        messages=_doc_messages(query, context),
+        temperature=0.3,
+        max_tokens=500,
+        use_cache=use_cache
+    )
+
+
+async def achat_simple(prompt: str, temperature: float = 0.7, max_tokens: int = 1000, use_cache: bool = True) -> str:
+    """
+    Versión async de chat_simple, pensada para lotes:
+    
+        responses = await asyncio.gather(*(achat_simple(p) for p in prompts),
+                                         return_exceptions=True)
+    """
+    return await _achat_completion(
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+        max_tokens=max_tokens,
+        use_cache=use_cache
+    )
 
 
 if __name__ == "__main__":
@@ -159,8 +423,11 @@ if __name__ == "__main__":
     test_query = "¿Cuál es mi derecho a descanso?"
     test_context = "Artículo 65: El trabajador tendrá derecho a un día de descanso cada siete días, preferentemente domingo."
     
-    response = chat_with_doc(test_query, test_context)
-    print(f"Pregunta: {test_query}")
-    print(f"Respuesta: {response}\n")
+    try:
+        response = chat_with_doc(test_query, test_context)
+        print(f"Pregunta: {test_query}")
+        print(f"Respuesta: {response}\n")
+    except LLMError as e:
+        print(f"❌ Error: {e}\n")
     
     print("✅ Test completado")
@@ -0,0 +1,236 @@
+"""
+Servicio de ingreso de PDFs en segundo plano
+- Cola de trabajos persistida en la BD (tabla ingestion_jobs)
+- Un único hilo worker: los trabajos se procesan de a uno (un solo escritor SQLite)
+- Checkpoints: cada CHECKPOINT_EVERY chunks se hace commit de los documentos
+  junto con el índice del último chunk guardado
+- Reanudación: al reiniciar, los trabajos pendientes o interrumpidos
+  continúan desde su último checkpoint; volver a enviar un PDF cuyo trabajo
+  falló reanuda ese trabajo (no se duplican los chunks ya guardados)
+"""
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from database.database import SessionLocal, ensure_schema
+from database.models import Document, IngestionJob
+from services.rag_service import RAGService
+
+
+class IngestionJobManager:
+    """Administra trabajos de ingreso de PDFs en un hilo de fondo"""
+
+    CHECKPOINT_EVERY = 25  # Chunks por commit
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self._queued = set()        # IDs en cola o en proceso
+        self._finished = []         # IDs terminados aún no informados
+        self._phase = {}            # {job_id: fase actual (extrayendo, chunking, ...)}
+
+    def submit(self, pdf_path: str, source_name: str = None) -> int:
+        """
+        Registra un trabajo y lo encola. Retorna el ID del trabajo
+
+        Si el mismo PDF tiene un trabajo sin terminar (fallido, pendiente o
+        interrumpido) se reanuda ese trabajo desde su checkpoint en vez de crear
+        otro que volvería a insertar los chunks ya guardados.
+        """
+        ensure_schema()
+        pdf_path = str(Path(pdf_path).resolve())
+        source = source_name or Path(pdf_path).name
+        db = SessionLocal()
+        try:
+            job = (db.query(IngestionJob)
+                   .filter(IngestionJob.pdf_path == pdf_path,
+                           IngestionJob.source == source,
+                           IngestionJob.status.in_(["failed", "pending", "running"]))
+                   .order_by(IngestionJob.id.desc())
+                   .first())
+            if job is None:
+                job = IngestionJob(pdf_path=pdf_path, source=source, status="pending")
+                db.add(job)
+            elif job.status == "failed":
+                job.status = "pending"
+            db.commit()
+            job_id = job.id
+        finally:
+            db.close()
+
+        self._enqueue(job_id)
+        return job_id
+
+    def resume_pending(self) -> List[int]:
+        """Reencola trabajos pendientes o interrumpidos (status pending/running)"""
+        ensure_schema()
+        db = SessionLocal()
+        try:
+            job_ids = [
+                job.id for job in db.query(IngestionJob)
+                .filter(IngestionJob.status.in_(["pending", "running"]))
+                .order_by(IngestionJob.id)
+            ]
+        finally:
+            db.close()
+
+        for job_id in job_ids:
+            self._enqueue(job_id)
+        return job_ids
+
+    def list_jobs(self, limit: int = 10) -> List[Dict]:
+        """Últimos trabajos con su avance (según el último checkpoint)"""
+        ensure_schema()
+        db = SessionLocal()
+        try:
+            jobs = (db.query(IngestionJob)
+                    .order_by(IngestionJob.id.desc())
+                    .limit(limit)
+                    .all())
+            return [self._job_to_dict(job) for job in jobs]
+        finally:
+            db.close()
+
+    def has_active_jobs(self) -> bool:
+        """True si hay trabajos en cola o en proceso"""
+        with self._lock:
+            return bool(self._queued)
+
+    def pop_finished(self) -> List[Dict]:
+        """Trabajos terminados desde la última consulta (para notificar al usuario)"""
+        with self._lock:
+            finished, self._finished = self._finished, []
+
+        if not finished:
+            return []
+
+        db = SessionLocal()
+        try:
+            return [self._job_to_dict(db.get(IngestionJob, job_id)) for job_id in finished]
+        finally:
+            db.close()
+
+    def _job_to_dict(self, job: IngestionJob) -> Dict:
+        processed = job.last_chunk_index + 1
+        progress = processed / job.total_chunks if job.total_chunks else 0.0
+        return {
+            'id': job.id,
+            'source': job.source,
+            'status': job.status,
+            'phase': self._phase.get(job.id),
+            'total_chunks': job.total_chunks,
+            'processed_chunks': processed,
+            'documents_saved': job.documents_saved,
+            'progress': progress,
+            'error': job.error,
+            'updated_at': job.updated_at
+        }
+
+    def _enqueue(self, job_id: int):
+        with self._lock:
+            if job_id in self._queued:
+                return
+            self._queued.add(job_id)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._work_loop, daemon=True)
+                self._worker.start()
+        self._queue.put(job_id)
+
+    def _work_loop(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self.run_job(job_id)
+            finally:
+                with self._lock:
+                    self._queued.discard(job_id)
+                    self._finished.append(job_id)
+                    self._phase.pop(job_id, None)
+                self._queue.task_done()
+
+    def run_job(self, job_id: int) -> Optional[Dict]:
+        """
+        Ejecuta (o reanuda) un trabajo en el hilo actual
+
+        Los chunks ya guardados (hasta last_chunk_index) no se reprocesan.
+        Si falla, el trabajo queda en 'failed' conservando su último checkpoint.
+        """
+        db = SessionLocal()
+        job = db.get(IngestionJob, job_id)
+        if job is None:
+            db.close()
+            return None
+
+        try:
+            if not os.path.exists(job.pdf_path):
+                raise FileNotFoundError(f"PDF no encontrado: {job.pdf_path}")
+
+            job.status = "running"
+            job.error = None
+            db.commit()
+
+            # Extraer y chunkear es determinístico: al reanudar se obtienen los mismos chunks
+            self._phase[job_id] = "extrayendo texto"
+            text = RAGService.extract_text_from_pdf(job.pdf_path)
+
+            self._phase[job_id] = "dividiendo en chunks"
+            chunks = RAGService.make_chunks(text)
+
+            if job.last_chunk_index >= 0 and job.total_chunks not in (0, len(chunks)):
+                # El PDF cambió desde el último checkpoint: los chunks guardados no
+                # corresponden a los nuevos, se descartan y se empieza de nuevo
+                self._discard_saved_chunks(db, job)
+
+            job.total_chunks = len(chunks)
+            db.commit()
+
+            self._phase[job_id] = "generando embeddings"
+            for batch_start in range(job.last_chunk_index + 1, len(chunks), self.CHECKPOINT_EVERY):
+                batch = chunks[batch_start:batch_start + self.CHECKPOINT_EVERY]
+                records = RAGService.build_document_records(
+                    batch, job.source, start_index=batch_start, total=len(chunks)
+                )
+
+                # Checkpoint: documentos + avance en la misma transacción
+                saved = RAGService.save_document_records(db, records)
+                job.last_chunk_index = batch_start + len(batch) - 1
+                job.documents_saved += saved
+                db.commit()
+
+            self._phase[job_id] = "anotando entidades"
+            RAGService.annotate_documents()
+
+            job.status = "completed"
+            db.commit()
+
+        except Exception as e:
+            db.rollback()
+            job = db.get(IngestionJob, job_id)
+            job.status = "failed"
+            job.error = str(e)
+            db.commit()
+
+        finally:
+            result = self._job_to_dict(job)
+            db.close()
+
+        return result
+
+    @staticmethod
+    def _discard_saved_chunks(db, job: IngestionJob):
+        """Borra los documentos guardados por el trabajo y reinicia su checkpoint"""
+        db.query(Document).filter(
+            Document.source == job.source,
+            Document.chunk_index <= job.last_chunk_index,
+            Document.created_at >= job.created_at  # No los de un ingreso anterior del mismo PDF
+        ).delete(synchronize_session=False)
+        job.last_chunk_index = -1
+        job.documents_saved = 0
+        db.commit()
+
+
+# Instancia global
+ingestion_jobs = IngestionJobManager()
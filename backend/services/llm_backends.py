@@ -0,0 +1,430 @@
+"""
+Backends intercambiables para el LLM
+- groq: API de Groq (SDK oficial)
+- openai: cualquier servidor compatible con la API de OpenAI
+  (ej: llm_stub_server.py para pruebas offline, vLLM, Ollama)
+- record / replay: graba las respuestas de otro backend en un JSONL
+  y luego las reproduce sin red, de forma determinística
+
+Se elige con la variable de entorno LLM_BACKEND (default: groq).
+groq_service aplica caché, límites de tasa y reintentos por encima de cualquier backend.
+"""
+import asyncio
+import json
+import os
+import threading
+import weakref
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from config.settings import settings
+from services.llm_cache import LLMResponseCache
+from services.llm_errors import (
+    LLMError,
+    LLMRateLimitError,
+    LLMRequestError,
+    LLMTimeoutError,
+    LLMUnavailableError,
+    retry_after_from_headers,
+    translate_error,
+)
+
+ENV_FILE = Path(__file__).parent.parent / ".env"
+
+_env_loaded = False
+
+
+def load_env():
+    """Carga la API key desde .env (mismo método que test_models.py), una sola vez"""
+    global _env_loaded
+    if _env_loaded:
+        return
+    if ENV_FILE.exists():
+        with open(ENV_FILE, 'r') as f:
+            for line in f:
+                if '=' in line:
+                    key, value = line.strip().split('=', 1)
+                    os.environ[key] = value
+    _env_loaded = True
+
+
+class Completion(NamedTuple):
+    """Respuesta de un backend: texto + tokens consumidos (si el backend los informa)"""
+    text: str
+    total_tokens: Optional[int] = None
+
+
+class LLMBackend(ABC):
+    """
+    Interfaz común de los backends
+
+    complete, acomplete y open_stream son abstractos: un backend al que le falte
+    alguno falla al instanciarse, no en medio de una request.
+    Todos los métodos lanzan LLMError (o una excepción que translate_error convierte).
+    open_stream hace la request al llamarse (así se puede reintentar) y retorna
+    un iterador de trozos de texto.
+    """
+
+    name = "base"
+    rate_limited = False  # True si aplica la cuota RPM/TPM de la cuenta
+
+    @abstractmethod
+    def complete(self, model: str, messages: List[Dict], temperature: float, max_tokens: int) -> Completion:
+        """Respuesta completa"""
+
+    @abstractmethod
+    async def acomplete(self, model: str, messages: List[Dict], temperature: float, max_tokens: int) -> Completion:
+        """Versión async de complete"""
+
+    @abstractmethod
+    def open_stream(self, model: str, messages: List[Dict], temperature: float, max_tokens: int) -> Iterator[str]:
+        """Abre la request y retorna los trozos de texto"""
+
+    def cache_namespace(self, model: str) -> str:
+        """Prefijo de las claves de caché: respuestas de backends distintos no se mezclan"""
+        return f"{self.name}:{model}"
+
+
+class GroqBackend(LLMBackend):
+    """API de Groq; el SDK se importa y el cliente se crea en el primer uso"""
+
+    name = "groq"
+    rate_limited = True
+
+    def __init__(self, api_key: Optional[str] = None):
+        self._api_key = api_key
+        self._client = None
+        self._lock = threading.Lock()
+        self._async_clients = weakref.WeakKeyDictionary()  # Un cliente async por event loop
+
+    def _get_api_key(self) -> str:
+        load_env()
+        api_key = self._api_key or os.getenv("GROQ_API_KEY")
+        if not api_key:
+            raise LLMRequestError("GROQ_API_KEY no configurada (ver backend/.env)")
+        return api_key
+
+    @property
+    def client(self):
+        """Cliente Groq sync (los reintentos los maneja groq_service, no el SDK)"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    api_key = self._get_api_key()
+                    from groq import Groq
+                    self._client = Groq(api_key=api_key, max_retries=0)
+        return self._client
+
+    def _async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            api_key = self._get_api_key()
+            from groq import AsyncGroq
+            client = AsyncGroq(api_key=api_key, max_retries=0)
+            self._async_clients[loop] = client
+        return client
+
+    def cache_namespace(self, model: str) -> str:
+        # Sin prefijo: conserva las entradas de caché creadas antes de los backends
+        return model
+
+    @staticmethod
+    def _to_completion(response) -> Completion:
+        usage = getattr(response, "usage", None)
+        return Completion(response.choices[0].message.content, getattr(usage, "total_tokens", None))
+
+    def complete(self, model, messages, temperature, max_tokens) -> Completion:
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        return self._to_completion(response)
+
+    async def acomplete(self, model, messages, temperature, max_tokens) -> Completion:
+        response = await self._async_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        return self._to_completion(response)
+
+    def open_stream(self, model, messages, temperature, max_tokens) -> Iterator[str]:
+        stream = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        return self._iter_deltas(stream)
+
+    @staticmethod
+    def _iter_deltas(stream) -> Iterator[str]:
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        except LLMError:
+            raise
+        except Exception as e:
+            raise translate_error(e)
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """Servidor HTTP compatible con /v1/chat/completions de OpenAI (vía httpx)"""
+
+    name = "openai"
+
+    def __init__(self, base_url: str, api_key: Optional[str] = None, timeout: float = 60.0):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = timeout
+        self._client = None
+        self._lock = threading.Lock()
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import httpx
+                    self._client = httpx.Client(base_url=self.base_url, headers=self._headers(),
+                                                timeout=self.timeout)
+        return self._client
+
+    def _async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            import httpx
+            client = httpx.AsyncClient(base_url=self.base_url, headers=self._headers(), timeout=self.timeout)
+            self._async_clients[loop] = client
+        return client
+
+    @staticmethod
+    def _payload(model, messages, temperature, max_tokens, stream: bool = False) -> Dict:
+        return {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": stream
+        }
+
+    @staticmethod
+    def _check_status(response):
+        """Convierte los códigos HTTP de error en LLMError tipados"""
+        status = response.status_code
+        if status < 400:
+            return
+        if status == 429:
+            raise LLMRateLimitError(f"Límite de la API excedido ({status})", retry_after_from_headers(response.headers))
+        if status >= 500:
+            raise LLMUnavailableError(f"API no disponible ({status})")
+        raise LLMRequestError(f"Request rechazada ({status}): {response.text[:200]}")
+
+    def _transport_error(self, error: Exception) -> LLMError:
+        import httpx
+        if isinstance(error, httpx.TimeoutException):
+            return LLMTimeoutError(f"Timeout de la API: {error}")
+        if isinstance(error, httpx.TransportError):
+            return LLMUnavailableError(f"No se pudo conectar con {self.base_url}: {error}")
+        return translate_error(error)
+
+    @staticmethod
+    def _to_completion(data: Dict) -> Completion:
+        try:
+            text = data["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError):
+            raise LLMError(f"Respuesta con formato inesperado: {str(data)[:200]}")
+        return Completion(text, (data.get("usage") or {}).get("total_tokens"))
+
+    def complete(self, model, messages, temperature, max_tokens) -> Completion:
+        try:
+            response = self.client.post("/chat/completions",
+                                        json=self._payload(model, messages, temperature, max_tokens))
+        except LLMError:
+            raise
+        except Exception as e:
+            raise self._transport_error(e)
+        self._check_status(response)
+        return self._to_completion(response.json())
+
+    async def acomplete(self, model, messages, temperature, max_tokens) -> Completion:
+        try:
+            response = await self._async_client().post(
+                "/chat/completions", json=self._payload(model, messages, temperature, max_tokens)
+            )
+        except LLMError:
+            raise
+        except Exception as e:
+            raise self._transport_error(e)
+        self._check_status(response)
+        return self._to_completion(response.json())
+
+    def open_stream(self, model, messages, temperature, max_tokens) -> Iterator[str]:
+        try:
+            request = self.client.build_request(
+                "POST", "/chat/completions",
+                json=self._payload(model, messages, temperature, max_tokens, stream=True)
+            )
+            response = self.client.send(request, stream=True)
+        except Exception as e:
+            raise self._transport_error(e)
+
+        if response.status_code >= 400:
+            response.read()
+            response.close()
+            self._check_status(response)
+        return self._iter_sse(response)
+
+    def _iter_sse(self, response) -> Iterator[str]:
+        """Lee el stream Server-Sent Events ("data: {...}" hasta "data: [DONE]")"""
+        try:
+            for line in response.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                delta = choices[0].get("delta", {}).get("content") if choices else None
+                if delta:
+                    yield delta
+        except LLMError:
+            raise
+        except Exception as e:
+            raise self._transport_error(e)
+        finally:
+            response.close()
+
+
+class RecordReplayBackend(LLMBackend):
+    """
+    Graba o reproduce respuestas en un archivo JSONL
+
+    - record: delega en `inner` y agrega cada respuesta al archivo
+    - replay: responde solo desde el archivo (sin red); una request no grabada
+      lanza LLMRequestError
+    La clave de cada grabación es la misma que usa el caché (modelo, mensajes,
+    temperature, max_tokens), así que un replay es determinístico.
+    """
+
+    def __init__(self, path: str, mode: str = "replay", inner: Optional[LLMBackend] = None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Modo inválido: {mode} (usa 'record' o 'replay')")
+        if mode == "record" and inner is None:
+            raise ValueError("El modo record necesita un backend interno")
+        self.path = Path(path)
+        self.mode = mode
+        self.inner = inner
+        self.name = mode
+        self.rate_limited = inner.rate_limited if inner else False
+        self._recordings = None
+        self._lock = threading.Lock()
+
+    def cache_namespace(self, model: str) -> str:
+        # Al grabar, las respuestas son las del backend real
+        return self.inner.cache_namespace(model) if self.mode == "record" else f"replay:{model}"
+
+    def _load(self) -> Dict[str, Dict]:
+        if self._recordings is None:
+            recordings = {}
+            if self.path.exists():
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            recordings[entry["key"]] = entry
+            self._recordings = recordings
+        return self._recordings
+
+    @staticmethod
+    def _key(model, messages, temperature, max_tokens) -> str:
+        return LLMResponseCache.make_key(model, messages, temperature, max_tokens)
+
+    def _replay(self, key: str) -> Completion:
+        entry = self._load().get(key)
+        if entry is None:
+            raise LLMRequestError(f"Sin grabación para esta request ({key[:12]}…) en {self.path}")
+        return Completion(entry["text"], entry.get("total_tokens"))
+
+    def _record(self, key, model, messages, temperature, max_tokens, completion: Completion):
+        entry = {
+            "key": key,
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "text": completion.text,
+            "total_tokens": completion.total_tokens
+        }
+        with self._lock:
+            self._load()[key] = entry
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def complete(self, model, messages, temperature, max_tokens) -> Completion:
+        key = self._key(model, messages, temperature, max_tokens)
+        if self.mode == "replay":
+            return self._replay(key)
+        completion = self.inner.complete(model, messages, temperature, max_tokens)
+        self._record(key, model, messages, temperature, max_tokens, completion)
+        return completion
+
+    async def acomplete(self, model, messages, temperature, max_tokens) -> Completion:
+        key = self._key(model, messages, temperature, max_tokens)
+        if self.mode == "replay":
+            return self._replay(key)
+        completion = await self.inner.acomplete(model, messages, temperature, max_tokens)
+        self._record(key, model, messages, temperature, max_tokens, completion)
+        return completion
+
+    def open_stream(self, model, messages, temperature, max_tokens) -> Iterator[str]:
+        key = self._key(model, messages, temperature, max_tokens)
+        if self.mode == "replay":
+            return iter([self._replay(key).text])
+        return self._record_stream(key, model, messages, temperature, max_tokens,
+                                   self.inner.open_stream(model, messages, temperature, max_tokens))
+
+    def _record_stream(self, key, model, messages, temperature, max_tokens, deltas) -> Iterator[str]:
+        parts = []
+        for delta in deltas:
+            parts.append(delta)
+            yield delta
+        self._record(key, model, messages, temperature, max_tokens, Completion("".join(parts)))
+
+
+def make_backend(name: Optional[str] = None) -> LLMBackend:
+    """Crea el backend configurado (LLM_BACKEND: groq | openai | record | replay)"""
+    name = (name or settings.LLM_BACKEND).lower()
+
+    if name == "groq":
+        return GroqBackend()
+    if name == "openai":
+        load_env()
+        return OpenAICompatibleBackend(settings.LLM_BASE_URL, api_key=os.getenv("LLM_API_KEY"))
+    if name == "record":
+        if settings.LLM_RECORD_BACKEND.lower() in ("record", "replay"):
+            raise ValueError("LLM_RECORD_BACKEND debe ser un backend real (groq u openai)")
+        return RecordReplayBackend(settings.LLM_RECORD_PATH, "record", make_backend(settings.LLM_RECORD_BACKEND))
+    if name == "replay":
+        return RecordReplayBackend(settings.LLM_RECORD_PATH, "replay")
+
+    raise ValueError(f"LLM_BACKEND desconocido: {name} (usa groq, openai, record o replay)")
@@ -0,0 +1,186 @@
+"""
+Caché persistente de respuestas del LLM
+- Clave: hash de (modelo, mensajes, temperature, max_tokens)
+- Persistido en SQLite (sobrevive reinicios del CLI)
+- Capa en memoria (LRU) para que los hits frecuentes no toquen disco
+- Evicción LRU por cantidad de entradas y por tamaño total
+- TTL opcional
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+class LLMResponseCache:
+    """Caché de respuestas del LLM respaldado en SQLite"""
+
+    def __init__(self,
+                 db_path: str,
+                 max_entries: int = 5000,
+                 max_bytes: int = 50 * 1024 * 1024,
+                 ttl_seconds: Optional[float] = None,
+                 memory_entries: int = 256):
+        self.db_path = str(db_path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.memory_entries = memory_entries
+
+        self._conn = None
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # {key: (response, created_at)}
+        self._entries = 0
+        self._bytes = 0
+        self._stats = {'hits': 0, 'memory_hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'writes': 0}
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict], temperature: float, max_tokens: int) -> str:
+        """Clave determinística de la request"""
+        payload = json.dumps(
+            [model, messages, round(float(temperature), 4), int(max_tokens)],
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Abre la BD en el primer uso"""
+        if self._conn is None:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)")
+            self._conn.commit()
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            self._entries, self._bytes = count, total
+        return self._conn
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def _remember(self, key: str, response: str, created_at: float):
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        """Respuesta guardada para la clave, o None"""
+        now = time.time()
+
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                response, created_at = cached
+                if not self._is_expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self._stats['hits'] += 1
+                    self._stats['memory_hits'] += 1
+                    return response
+                del self._memory[key]
+
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT response, size, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self._stats['misses'] += 1
+                return None
+
+            response, size, created_at = row
+            if self._is_expired(created_at, now):
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                conn.commit()
+                self._entries -= 1
+                self._bytes -= size
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None
+
+            conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self._remember(key, response, created_at)
+            self._stats['hits'] += 1
+            return response
+
+    def set(self, key: str, model: str, response: str):
+        """Guarda una respuesta y aplica la evicción LRU"""
+        now = time.time()
+        size = len(response.encode('utf-8'))
+
+        with self._lock:
+            conn = self._connect()
+            previous = conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now)
+            )
+            if previous:
+                self._bytes -= previous[0]
+            else:
+                self._entries += 1
+            self._bytes += size
+            self._stats['writes'] += 1
+
+            self._evict(conn)
+            conn.commit()
+            self._remember(key, response, now)
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Elimina las entradas menos usadas hasta respetar los límites"""
+        while self._entries > self.max_entries or self._bytes > self.max_bytes:
+            excess = max(self._entries - self.max_entries, 1)
+            rows = conn.execute(
+                "SELECT key, size FROM llm_cache ORDER BY last_access LIMIT ?", (excess,)
+            ).fetchall()
+            if not rows:
+                break
+            conn.executemany("DELETE FROM llm_cache WHERE key = ?", [(k,) for k, _ in rows])
+            for key, size in rows:
+                self._memory.pop(key, None)
+                self._entries -= 1
+                self._bytes -= size
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        """Vacía el caché (memoria y disco)"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+            self._memory.clear()
+            self._entries = 0
+            self._bytes = 0
+
+    def get_stats(self) -> Dict:
+        """Estadísticas del caché"""
+        with self._lock:
+            if self._conn is None and Path(self.db_path).exists():
+                self._connect()
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'hit_rate': self._stats['hits'] / lookups if lookups else 0.0,
+                'entries': self._entries,
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds
+            }
@@ -0,0 +1,93 @@
+"""
+Errores tipados de las llamadas al LLM
+
+Jerarquía:
+    LLMError
+    ├── LLMRequestError       → request inválida / API key incorrecta (no se reintenta)
+    ├── LLMRateLimitError     → 429, trae retry_after (se reintenta)
+    ├── LLMTimeoutError       → la API no respondió a tiempo (se reintenta)
+    └── LLMUnavailableError   → 5xx o error de conexión (se reintenta)
+        └── LLMCircuitOpenError → circuito abierto: se falla de inmediato sin llamar a la API
+"""
+from typing import Optional
+
+
+class LLMError(Exception):
+    """Error base de las llamadas al LLM"""
+
+    retryable = False
+
+
+class LLMRequestError(LLMError):
+    """La API rechazó la request (4xx distinto de 429)"""
+
+
+class LLMRateLimitError(LLMError):
+    """Se excedió la cuota de la cuenta (429)"""
+
+    retryable = True
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMTimeoutError(LLMError):
+    """La API no respondió a tiempo"""
+
+    retryable = True
+
+
+class LLMUnavailableError(LLMError):
+    """La API no está disponible (5xx o error de conexión)"""
+
+    retryable = True
+
+
+class LLMCircuitOpenError(LLMUnavailableError):
+    """Circuito abierto tras fallas consecutivas: no se llama a la API"""
+
+    retryable = False
+
+
+def retry_after_from_headers(headers) -> Optional[float]:
+    """Segundos indicados por los headers retry-after(-ms), si vienen"""
+    headers = headers or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """retry-after de la respuesta HTTP asociada a una excepción del SDK"""
+    return retry_after_from_headers(getattr(getattr(error, "response", None), "headers", None))
+
+
+def translate_error(error: Exception) -> LLMError:
+    """Convierte una excepción del SDK de Groq en un LLMError tipado"""
+    if isinstance(error, LLMError):
+        return error
+
+    import groq  # Solo se llega acá tras una llamada real, con el SDK ya cargado
+
+    if isinstance(error, groq.RateLimitError):
+        translated = LLMRateLimitError(f"Límite de la API excedido: {error}", retry_after_seconds(error))
+    elif isinstance(error, groq.APITimeoutError):
+        translated = LLMTimeoutError(f"Timeout de la API: {error}")
+    elif isinstance(error, groq.APIConnectionError):
+        translated = LLMUnavailableError(f"No se pudo conectar con la API: {error}")
+    elif isinstance(error, groq.APIStatusError):
+        if error.status_code >= 500:
+            translated = LLMUnavailableError(f"API no disponible ({error.status_code}): {error}")
+        else:
+            translated = LLMRequestError(f"Request rechazada ({error.status_code}): {error}")
+    else:
+        translated = LLMError(f"Error inesperado del LLM: {error}")
+
+    translated.__cause__ = error
+    return translated
@@ -0,0 +1,194 @@
+"""
+Reintentos y circuit breaker para las llamadas al LLM
+- Backoff exponencial acotado con jitter para 5xx, timeouts y errores de conexión
+- Los 429 esperan lo que indica retry-after: con cuota compartida (Groq) se
+  pausa el limitador de tasa; con otros backends espera solo esa llamada
+- Circuit breaker: tras N fallas consecutivas se falla de inmediato durante
+  un tiempo de enfriamiento; luego se deja pasar una request de prueba
+- Contadores de llamadas, reintentos y fallas
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Dict
+
+from services.llm_errors import (
+    LLMCircuitOpenError,
+    LLMRateLimitError,
+    translate_error,
+)
+
+
+class CircuitBreaker:
+    """Circuit breaker clásico: closed → open → half-open → closed"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.short_circuited = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Lanza LLMCircuitOpenError si el circuito no deja pasar la llamada"""
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.reset_seconds - (time.monotonic() - self.opened_at)
+                if remaining > 0:
+                    self.short_circuited += 1
+                    raise LLMCircuitOpenError(
+                        f"API del LLM no disponible tras {self.consecutive_failures} fallas "
+                        f"consecutivas; se reintentará en {remaining:.0f}s"
+                    )
+                # Enfriamiento cumplido: dejar pasar una sola request de prueba
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = True
+                return
+
+            if self.state == self.HALF_OPEN and self._probe_in_flight:
+                self.short_circuited += 1
+                raise LLMCircuitOpenError("API del LLM en prueba tras una caída; reintenta en unos segundos")
+
+    def record_success(self):
+        """La API respondió (aunque sea con un 4xx): cerrar el circuito"""
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        """Falla de disponibilidad (5xx, timeout, conexión)"""
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opens += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+class RetryPolicy:
+    """Ejecuta una llamada al LLM con reintentos, backoff y circuit breaker"""
+
+    def __init__(self,
+                 breaker: CircuitBreaker,
+                 max_retries: int = 3,
+                 rate_limit_retries: int = 5,
+                 backoff_base: float = 0.5,
+                 backoff_max: float = 20.0,
+                 rate_limiter=None):
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.rate_limit_retries = rate_limit_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = rate_limiter
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'retries': 0, 'rate_limited': 0, 'failures': 0}
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Backoff exponencial acotado con jitter ("equal jitter")"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _handle_failure(self, error: Exception, attempts: Dict[str, int], rate_limited: bool) -> float:
+        """
+        Decide qué hacer con una falla: retorna los segundos a esperar
+        antes de reintentar, o lanza el LLMError si no se reintenta
+
+        rate_limited: el backend pasa por el limitador (cuota RPM/TPM de la cuenta)
+        """
+        error = translate_error(error)
+
+        if isinstance(error, LLMRateLimitError):
+            # La API respondió: está disponible, solo sin cuota
+            self.breaker.record_success()
+            self._count('rate_limited')
+            attempts['rate_limit'] += 1
+            wait = error.retry_after or self.backoff_delay(attempts['rate_limit'])
+            if attempts['rate_limit'] > self.rate_limit_retries:
+                self._count('failures')
+                raise error
+            self._count('retries')
+            if rate_limited and self.rate_limiter is not None:
+                # El limitador hace esperar a todas las llamadas (no solo a esta),
+                # y el reintento espera en él antes de salir
+                self.rate_limiter.pause(wait)
+                return 0.0
+            return wait
+
+        if isinstance(error, LLMCircuitOpenError) or not error.retryable:
+            if not isinstance(error, LLMCircuitOpenError):
+                self.breaker.record_success()
+            self._count('failures')
+            raise error
+
+        self.breaker.record_failure()
+        attempts['error'] += 1
+        if attempts['error'] > self.max_retries:
+            self._count('failures')
+            raise error
+        self._count('retries')
+        return self.backoff_delay(attempts['error'])
+
+    def call(self, func: Callable, rate_limited: bool = False):
+        """
+        Ejecuta func() con reintentos (bloqueante)
+
+        rate_limited: True si func espera en el limitador de tasa antes de cada
+        intento (backend.rate_limited); si no, los 429 se esperan aquí
+        """
+        self._count('calls')
+        attempts = {'error': 0, 'rate_limit': 0}
+        while True:
+            try:
+                self.breaker.before_call()
+                result = func()
+            except Exception as e:
+                delay = self._handle_failure(e, attempts, rate_limited)
+                if delay > 0:
+                    time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def acall(self, func: Callable[[], Awaitable], rate_limited: bool = False):
+        """Ejecuta await func() con reintentos (sin bloquear el event loop); ver call"""
+        self._count('calls')
+        attempts = {'error': 0, 'rate_limit': 0}
+        while True:
+            try:
+                self.breaker.before_call()
+                result = await func()
+            except Exception as e:
+                delay = self._handle_failure(e, attempts, rate_limited)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            'circuit_state': self.breaker.state,
+            'circuit_opens': self.breaker.opens,
+            'short_circuited': self.breaker.short_circuited,
+            'consecutive_failures': self.breaker.consecutive_failures
+        })
+        return stats
@@ -0,0 +1,69 @@
+"""
+Índice invertido de términos para buscar nodos del grafo por texto
+
+Cada término de los labels y descriptions (tokenizados con text_utils) apunta
+a las posiciones de los nodos que lo contienen. Una búsqueda solo visita los
+nodos que comparten algún término con la query, en vez de recorrer todos.
+
+Coincidencia por prefijo: el vocabulario se guarda ordenado y los términos que
+empiezan con el de la query se obtienen con dos búsquedas binarias
+("trabaj" → trabajo, trabajador, trabajadora, ...).
+
+Score de un nodo = suma, por cada término de la query, del peso del campo en
+que aparece (label > description); una coincidencia solo por prefijo vale
+PREFIX_WEIGHT de la exacta.
+"""
+import bisect
+import heapq
+from typing import Dict, Iterable, List, Tuple
+
+LABEL_WEIGHT = 1.0
+DESCRIPTION_WEIGHT = 0.5
+PREFIX_WEIGHT = 0.5
+
+
+class NodeSearchIndex:
+    """Postings término → posiciones de nodos, por campo"""
+
+    def __init__(self, fields: Iterable[Tuple[str, str]]):
+        """fields: (label normalizado, description normalizada) de cada nodo, en orden"""
+        self._postings = ({}, {})  # (label, description): {término: [posiciones]}
+        size = 0
+        for position, texts in enumerate(fields):
+            for postings, text in zip(self._postings, texts):
+                for term in set(text.split()):
+                    postings.setdefault(term, []).append(position)
+            size = position + 1
+        self._weights = (LABEL_WEIGHT, DESCRIPTION_WEIGHT)
+        self._vocabulary = sorted(self._postings[0].keys() | self._postings[1].keys())
+        self.size = size
+
+    def prefix_terms(self, prefix: str) -> List[str]:
+        """Términos del vocabulario que empiezan con prefix (incluido el propio prefix)"""
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        end = bisect.bisect_left(self._vocabulary, prefix + "\U0010ffff", start)
+        return self._vocabulary[start:end]
+
+    def scores(self, terms: Iterable[str], prefix: bool = True) -> Dict[int, float]:
+        """{posición: score} de los nodos que contienen algún término"""
+        scores = {}
+        for term in terms:
+            expansions = self.prefix_terms(term) if prefix else [term]
+            for postings, weight in zip(self._postings, self._weights):
+                # Cada término de la query suma una vez por campo (exacta > prefijo)
+                term_scores = dict.fromkeys(postings.get(term, ()), weight)
+                for expansion in expansions:
+                    if expansion != term:
+                        for position in postings.get(expansion, ()):
+                            term_scores.setdefault(position, weight * PREFIX_WEIGHT)
+                for position, score in term_scores.items():
+                    scores[position] = scores.get(position, 0.0) + score
+        return scores
+
+    def search(self, terms: Iterable[str], top_k: int = 5, prefix: bool = True) -> List[Tuple[int, float]]:
+        """Los top_k (posición, score) de mayor score; empates en el orden de los nodos"""
+        scores = self.scores(terms, prefix)
+        return heapq.nsmallest(top_k, scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def __len__(self) -> int:
+        return self.size
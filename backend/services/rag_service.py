@@ -10,10 +10,20 @@ import json
 import re
 from pathlib import Path
 from typing import List, Dict, Tuple
-from services.groq_service import embed_text
-from database.database import SessionLocal
+from services.embeddings import embed_text, embed_term_counts
+from services.text_utils import term_counts, token_set
+from services.article_parser import parse_articles
+from database.database import SessionLocal, ensure_schema
 from database.models import Document
 import numpy as np
+from sqlalchemy import func
+
+# Patrones: Art. 21, Art 21, Artículo 21 (con sufijo bis/ter/quáter opcional)
+ARTICLE_NUMBER_PATTERNS = [
+    re.compile(r'Art\.\s*(\d+(?:\s*(?:bis|ter|quáter))?)', re.IGNORECASE),  # Art. 21 bis
+    re.compile(r'Artículo\s+(\d+(?:\s*(?:bis|ter|quáter))?)', re.IGNORECASE),
+    re.compile(r'Art\s+(\d+(?:\s*(?:bis|ter|quáter))?)', re.IGNORECASE)
+]
 
 class RAGService:
     """Servicio RAG con búsqueda híbrida"""
@@ -21,6 +31,10 @@ class RAGService:
     CHUNK_SIZE = 600  # Caracteres por chunk
     CHUNK_OVERLAP = 150  # Overlap entre chunks
     
+    # "articles": un parseo de artículos y chunks que nunca cruzan un artículo
+    # "size": chunks por tamaño y número de artículo inferido por regex
+    CHUNK_MODE = "articles"
+    
     @staticmethod
     def extract_text_from_pdf(pdf_path: str) -> str:
         """
@@ -86,13 +100,16 @@ class RAGService:
         return chunks
     
     @staticmethod
-    def bm25_score(query_terms: set, doc_text: str) -> float:
+    def bm25_score(query_terms: set, doc_text: str = "", doc_terms: set = None) -> float:
         """
         Calcula score BM25 simplificado
         Mide qué tan bien coinciden los términos de la query en el documento
+        
+        doc_terms: términos precalculados del documento (evita re-tokenizar doc_text)
         """
-        doc_terms = set(re.findall(r'\w+', doc_text.lower()))
-        matches = len(query_terms & doc_terms)
+        if doc_terms is None:
+            doc_terms = token_set(doc_text)
+        matches = sum(1 for term in query_terms if term in doc_terms)
         
         if not query_terms:
             return 0.0
@@ -100,27 +117,207 @@ class RAGService:
         # Score: cantidad de coincidencias normalizadas
         return matches / len(query_terms)
     
-    @staticmethod
     @staticmethod
     def extract_article_number(text: str) -> str:
         """
         Extrae número de artículo del texto (ej: "Art. 21" → "21")
         """
-        import re
-        # Buscar patrones: Art. 21, Art 21, Artículo 21
-        patterns = [
-            r'Art\.\s*(\d+(?:\s*(?:bis|ter|quáter))?)',  # Art. 21 bis
-            r'Artículo\s+(\d+(?:\s*(?:bis|ter|quáter))?)',
-            r'Art\s+(\d+(?:\s*(?:bis|ter|quáter))?)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in ARTICLE_NUMBER_PATTERNS:
+            match = pattern.search(text)
             if match:
                 return match.group(1).strip()
         
         return None
     
+    @staticmethod
+    def split_span(text: str, chunk_size: int = 600, overlap: int = 150) -> List[str]:
+        """
+        Divide un bloque (ej: un artículo) en partes de hasta chunk_size
+        cortando en saltos de línea o espacios, nunca a mitad de palabra
+        """
+        text = text.strip()
+        if len(text) <= chunk_size:
+            return [text] if text else []
+        
+        # Unidades: líneas; las líneas demasiado largas se dividen por palabras
+        units = []
+        for line in text.split('\n'):
+            line = line.strip()
+            if not line:
+                continue
+            if len(line) <= chunk_size:
+                units.append(line)
+                continue
+            current = ""
+            for word in line.split():
+                if current and len(current) + len(word) + 1 > chunk_size:
+                    units.append(current)
+                    current = word
+                else:
+                    current = f"{current} {word}" if current else word
+            if current:
+                units.append(current)
+        
+        parts = []
+        current = []
+        current_size = 0
+        
+        for unit in units:
+            if current and current_size + len(unit) + 1 > chunk_size:
+                parts.append('\n'.join(current))
+                
+                # Overlap: últimas unidades que quepan en `overlap` caracteres
+                carry = []
+                carry_size = 0
+                for prev in reversed(current):
+                    if carry_size + len(prev) + 1 > overlap:
+                        break
+                    carry.insert(0, prev)
+                    carry_size += len(prev) + 1
+                if carry_size + len(unit) + 1 > chunk_size:
+                    carry, carry_size = [], 0
+                current = carry
+                current_size = carry_size
+            
+            current.append(unit)
+            current_size += len(unit) + 1
+        
+        if current:
+            parts.append('\n'.join(current))
+        
+        return parts
+    
+    @staticmethod
+    def chunk_text_by_articles(text: str,
+                               chunk_size: int = 600,
+                               overlap: int = 150,
+                               articles: List[Dict] = None) -> List[Dict]:
+        """
+        Divide el texto respetando los límites de los artículos
+        
+        Reutiliza un único parseo de artículos (el mismo de ArticleGraphBuilder),
+        así cada chunk nace con su número de artículo y contexto jerárquico.
+        
+        Retorna: [{content, article_number, context}, ...]
+        """
+        if articles is None:
+            articles = parse_articles(text)
+        
+        chunks = []
+        
+        # Texto previo al primer artículo (portada, índice, etc.)
+        preamble_end = articles[0]['start'] if articles else len(text)
+        for part in RAGService.split_span(text[:preamble_end], chunk_size, overlap):
+            if len(part) > 100:  # Filtrar muy pequeños
+                chunks.append({'content': part, 'article_number': None, 'context': None})
+        
+        for article in articles:
+            span = text[article['start']:article['end']]
+            for part in RAGService.split_span(span, chunk_size, overlap):
+                chunks.append({
+                    'content': part,
+                    'article_number': article['id'],
+                    'context': article['context']
+                })
+        
+        return chunks
+    
+    @staticmethod
+    def make_chunks(text: str, mode: str = None) -> List[Dict]:
+        """
+        Chunking según el modo ("articles" o "size")
+        Si el texto no tiene artículos reconocibles, usa chunking por tamaño
+        
+        Retorna: [{content, article_number, context}, ...]
+        """
+        mode = mode or RAGService.CHUNK_MODE
+        
+        if mode == "articles":
+            articles = parse_articles(text)
+            if articles:
+                return RAGService.chunk_text_by_articles(
+                    text, RAGService.CHUNK_SIZE, RAGService.CHUNK_OVERLAP, articles=articles
+                )
+        
+        return [
+            {
+                'content': chunk,
+                'article_number': RAGService.extract_article_number(chunk),
+                'context': None
+            }
+            for chunk in RAGService.chunk_text_intelligent(text, RAGService.CHUNK_SIZE, RAGService.CHUNK_OVERLAP)
+        ]
+    
+    @staticmethod
+    def build_document_records(chunks: List[Dict],
+                               source_name: str,
+                               verbose: bool = False,
+                               start_index: int = 0,
+                               total: int = None) -> List[Dict]:
+        """
+        Convierte chunks (de make_chunks) en registros listos para insertar en la BD
+        (artículo + contexto + embedding). No toca la BD, por lo que puede correr en un worker.
+        
+        start_index/total: posición del lote dentro del PDF cuando se procesa por partes
+        """
+        records = []
+        total = total or len(chunks)
+        
+        for i, chunk in enumerate(chunks, start_index):
+            try:
+                counts = term_counts(chunk['content'])
+                emb = embed_term_counts(counts)
+                records.append({
+                    'title': f"{source_name} - Parte {i+1}/{total}",
+                    'content': chunk['content'],
+                    'source': source_name,
+                    'article_number': chunk['article_number'],
+                    'chunk_index': i,
+                    'context': json.dumps(chunk['context'], ensure_ascii=False) if chunk['context'] else None,
+                    'embedding': json.dumps(emb),
+                    'term_counts': json.dumps(counts, ensure_ascii=False)
+                })
+                if verbose and (i + 1) % 5 == 0:
+                    print(f"      {i+1}/{total} procesados...")
+            except Exception as chunk_err:
+                if verbose:
+                    print(f"      ⚠️  Error en chunk {i+1}: {str(chunk_err)}")
+                continue
+        
+        return records
+    
+    @staticmethod
+    def save_document_records(db, records: List[Dict]) -> int:
+        """
+        Inserta registros generados por build_document_records (sin commit)
+        """
+        ensure_schema(db.get_bind())
+        for record in records:
+            db.add(Document(**record))
+        return len(records)
+    
+    @staticmethod
+    def prepare_pdf(pdf_path: str, source_name: str = None) -> Dict:
+        """
+        Etapa de CPU del ingreso: extrae → chunking → embeddings, sin escribir en BD
+        
+        Se ejecuta en los procesos worker de process_directory; la escritura
+        queda en un único proceso para serializar los INSERT de SQLite.
+        """
+        source_name = source_name or Path(pdf_path).name
+        text = RAGService.extract_text_from_pdf(pdf_path)
+        chunks = RAGService.make_chunks(text)
+        records = RAGService.build_document_records(chunks, source_name)
+        
+        return {
+            'path': str(pdf_path),
+            'source': source_name,
+            'text_chars': len(text),
+            'chunks_count': len(chunks),
+            'records': records
+        }
+    
+    @staticmethod
     def process_pdf(pdf_path: str, source_name: str = None) -> Dict:
         """
         Procesa PDF completo: extrae → chunking → embeddings → BD
@@ -138,39 +335,19 @@ class RAGService:
             text = RAGService.extract_text_from_pdf(pdf_path)
             print(f"   • {len(text)} caracteres extraídos")
             
-            # Chunking inteligente
+            # Chunking por artículos (o por tamaño si no hay artículos)
             print(f"   • Dividiendo en chunks...")
-            chunks = RAGService.chunk_text_intelligent(text)
+            chunks = RAGService.make_chunks(text)
             print(f"   • {len(chunks)} chunks creados")
             
             # Guardar en BD con embeddings
             print(f"   • Generando embeddings y asociando artículos...")
-            db = SessionLocal()
-            saved = 0
-            
-            for i, chunk in enumerate(chunks):
-                try:
-                    # Extraer número de artículo del chunk
-                    article_num = RAGService.extract_article_number(chunk)
-                    
-                    emb = embed_text(chunk)
-                    doc = Document(
-                        title=f"{source_name} - Parte {i+1}/{len(chunks)}",
-                        content=chunk,
-                        source=source_name,
-                        article_number=article_num,  # ← AHORA se asigna
-                        chunk_index=i,
-                        embedding=json.dumps(emb)
-                    )
-                    db.add(doc)
-                    saved += 1
-                    if (i + 1) % 5 == 0:
-                        print(f"      {i+1}/{len(chunks)} procesados...")
-                except Exception as chunk_err:
-                    print(f"      ⚠️  Error en chunk {i+1}: {str(chunk_err)}")
-                    continue
+            records = RAGService.build_document_records(chunks, source_name, verbose=True)
             
+            db = SessionLocal()
+            saved = RAGService.save_document_records(db, records)
             db.commit()
+            RAGService.annotate_documents()
             
             return {
                 'success': True,
@@ -199,7 +376,165 @@ class RAGService:
                     pass
     
     @staticmethod
-    def search_hybrid(query: str, top_k: int = 5, use_graph: bool = True) -> List[Dict]:
+    def reindex_documents(only_missing: bool = True, batch_size: int = 500) -> int:
+        """
+        Recalcula términos y embedding de los documentos guardados con el
+        tokenizador actual (por defecto, solo los que no tienen term_counts)
+        
+        Retorna: cantidad de documentos actualizados
+        """
+        ensure_schema()
+        db = SessionLocal()
+        updated = 0
+        
+        try:
+            query = db.query(Document)
+            if only_missing:
+                query = query.filter(Document.term_counts.is_(None))
+            
+            for doc in query.yield_per(batch_size):
+                counts = term_counts(doc.content)
+                doc.term_counts = json.dumps(counts, ensure_ascii=False)
+                doc.embedding = json.dumps(embed_term_counts(counts))
+                updated += 1
+            
+            db.commit()
+            return updated
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    
+    @staticmethod
+    def find_pdfs(dir_path: str, recursive: bool = False) -> List[Path]:
+        """Lista los PDFs de un directorio (ordenados por nombre)"""
+        pattern = "**/*" if recursive else "*"
+        return sorted(
+            p for p in Path(dir_path).glob(pattern)
+            if p.is_file() and p.suffix.lower() == '.pdf'
+        )
+    
+    @staticmethod
+    def process_directory(dir_path: str,
+                          workers: int = None,
+                          recursive: bool = False,
+                          progress_callback=None) -> Dict:
+        """
+        Ingresa todos los PDFs de un directorio en paralelo
+        
+        - Extracción, chunking y embeddings corren en un pool de procesos
+        - El proceso principal es el ÚNICO escritor: inserta y hace commit
+          de cada PDF a medida que sus workers terminan
+        - progress_callback(done, total, file_result) recibe el avance agregado
+        """
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        
+        if not os.path.isdir(dir_path):
+            return {
+                'success': False,
+                'files_total': 0,
+                'files_ok': 0,
+                'files_failed': 0,
+                'chunks_count': 0,
+                'documents_saved': 0,
+                'errors': [],
+                'message': f"❌ Directorio no encontrado: {dir_path}"
+            }
+        
+        pdfs = RAGService.find_pdfs(dir_path, recursive=recursive)
+        summary = {
+            'success': True,
+            'files_total': len(pdfs),
+            'files_ok': 0,
+            'files_failed': 0,
+            'chunks_count': 0,
+            'documents_saved': 0,
+            'errors': []
+        }
+        
+        if not pdfs:
+            summary['message'] = f"⚠️  No hay PDFs en {dir_path}"
+            return summary
+        
+        workers = max(1, min(workers or os.cpu_count() or 1, len(pdfs)))
+        db = SessionLocal()
+        
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(RAGService.prepare_pdf, str(pdf)): pdf
+                    for pdf in pdfs
+                }
+                
+                for done, future in enumerate(as_completed(futures), 1):
+                    pdf = futures[future]
+                    file_result = {'path': str(pdf), 'source': pdf.name}
+                    
+                    try:
+                        prepared = future.result()
+                        saved = RAGService.save_document_records(db, prepared['records'])
+                        db.commit()
+                        
+                        summary['files_ok'] += 1
+                        summary['chunks_count'] += prepared['chunks_count']
+                        summary['documents_saved'] += saved
+                        file_result.update(success=True,
+                                           chunks_count=prepared['chunks_count'],
+                                           documents_saved=saved)
+                    except Exception as e:
+                        db.rollback()
+                        summary['files_failed'] += 1
+                        summary['errors'].append(f"{pdf.name}: {str(e)}")
+                        file_result.update(success=False, error=str(e))
+                    
+                    if progress_callback:
+                        progress_callback(done, len(pdfs), file_result)
+        finally:
+            db.close()
+        
+        if summary['documents_saved']:
+            RAGService.annotate_documents()
+        summary['success'] = summary['files_ok'] > 0
+        summary['message'] = (f"✅ {summary['documents_saved']} documentos guardados "
+                              f"({summary['files_ok']}/{summary['files_total']} PDFs)")
+        return summary
+    
+    @staticmethod
+    def annotate_documents() -> int:
+        """
+        Anota los chunks pendientes con las entidades del grafo cargado (si hay uno)
+        
+        Retorna: cantidad de chunks anotados
+        """
+        try:
+            from services.entity_annotations import entity_annotations
+            return entity_annotations.annotate_pending()
+        except Exception as e:
+            print(f"⚠️  No se pudieron anotar entidades: {e}")
+            return 0
+    
+    @staticmethod
+    def corpus_fingerprint() -> str:
+        """
+        Huella barata del corpus indexado: cambia al agregar, borrar o
+        reindexar documentos (invalida cachés derivados del corpus)
+        """
+        ensure_schema()
+        db = SessionLocal()
+        try:
+            count, max_id, total_chars, indexed = db.query(
+                func.count(Document.id),
+                func.max(Document.id),
+                func.sum(func.length(Document.content)),
+                func.count(Document.term_counts)
+            ).one()
+        finally:
+            db.close()
+        return f"{count}:{max_id or 0}:{total_chars or 0}:{indexed}"
+    
+    @staticmethod
+    def search_hybrid(query: str, top_k: int = 5, use_graph: bool = True, graph=None) -> List[Dict]:
         """
         Búsqueda HÍBRIDA: 70% embeddings semánticos + 30% BM25 (palabras clave)
         Opcionalmente usa RERANKING CON GRAFO para mejorar resultados
@@ -208,8 +543,12 @@ class RAGService:
         - Embeddings: captura SIGNIFICADO (relevancia semántica)
         - BM25: captura PALABRAS EXACTAS (precisión léxica)
         - Grafo: mejora CONTEXTO y RELACIONES entre conceptos (opcional)
+        
+        graph: vista fija del grafo de la consulta (graph_service.pinned()); si no
+        se pasa, se fija una al rerankear
         """
         try:
+            ensure_schema()
             db = SessionLocal()
             documents = db.query(Document).all()
             db.close()
@@ -218,7 +557,7 @@ class RAGService:
                 return []
             
             # Preparar query
-            query_terms = set(re.findall(r'\w+', query.lower()))
+            query_terms = token_set(query)
             query_emb = embed_text(query)
             query_array = np.array(query_emb)
             
@@ -233,8 +572,12 @@ class RAGService:
                     doc_emb = np.array(json.loads(doc.embedding))
                     emb_score = np.dot(query_array, doc_emb)
                     
-                    # 2. Score BM25 (30%)
-                    bm25_score = RAGService.bm25_score(query_terms, doc.content)
+                    # 2. Score BM25 (30%) con los términos guardados al ingresar
+                    if doc.term_counts:
+                        doc_terms = json.loads(doc.term_counts).keys()
+                        bm25_score = RAGService.bm25_score(query_terms, doc_terms=doc_terms)
+                    else:
+                        bm25_score = RAGService.bm25_score(query_terms, doc.content)
                     
                     # 3. Score combinado
                     combined = (0.7 * emb_score) + (0.3 * bm25_score)
@@ -254,6 +597,7 @@ class RAGService:
             results = []
             for item in scores[:top_k]:
                 results.append({
+                    'id': item['doc'].id,
                     'text': item['doc'].content,
                     'article': item['doc'].article_number,
                     'source': item['doc'].source,
@@ -265,9 +609,14 @@ class RAGService:
             # RERANKING CON GRAFO (si está disponible)
             if use_graph:
                 try:
-                    from services.graph_service import graph_service
-                    if graph_service.is_loaded:
-                        results = graph_service.rerank_documents_with_graph(query, results, boost_factor=0.2)
+                    if graph is None:
+                        from services.graph_service import graph_service
+                        graph = graph_service.pinned()
+                    if graph.is_loaded:
+                        # Entidades precalculadas de cada chunk (sin recorrer su texto), misma versión del grafo
+                        from services.entity_annotations import entity_annotations
+                        entity_annotations.attach(results, graph)
+                        results = graph.rerank_documents_with_graph(query, results, boost_factor=0.2)
                 except:
                     pass
             
@@ -0,0 +1,112 @@
+"""
+Limitador de tasa para la API del LLM (token bucket)
+- Requests por minuto (RPM) y tokens por minuto (TPM), cada uno con su bucket
+- Respeta el retry-after de las respuestas 429: pausa todas las llamadas
+- Sirve tanto para código async (acquire) como bloqueante (acquire_blocking)
+"""
+import asyncio
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Bucket que se rellena de forma continua hasta su capacidad"""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+            self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Segundos hasta que haya `amount` disponible (0 si ya hay)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def consume(self, amount: float):
+        """Descuenta `amount` (puede quedar negativo si el consumo real superó la reserva)"""
+        self.tokens -= amount
+
+    def refund(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """Limita requests y tokens por minuto hacia el LLM"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self.throttled_seconds = 0.0
+        self.rate_limited = 0
+
+    def _reserve(self, tokens: int) -> float:
+        """Reserva 1 request + `tokens` si hay cupo; si no, retorna cuánto esperar"""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(
+                self._blocked_until - now,
+                self.requests.wait_time(1, now),
+                self.tokens.wait_time(tokens, now)
+            )
+            if wait <= 0:
+                self.requests.consume(1)
+                self.tokens.consume(min(tokens, self.tokens.capacity))
+                return 0.0
+            self.throttled_seconds += wait
+            return wait
+
+    async def acquire(self, tokens: int):
+        """Espera (sin bloquear el event loop) hasta tener cupo"""
+        while True:
+            wait = self._reserve(tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def acquire_blocking(self, tokens: int):
+        """Igual que acquire, para llamadas sincrónicas"""
+        while True:
+            wait = self._reserve(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def record_usage(self, reserved_tokens: int, used_tokens: Optional[int]):
+        """Ajusta el bucket de tokens con el consumo real informado por la API"""
+        if used_tokens is None:
+            return
+        with self._lock:
+            difference = reserved_tokens - used_tokens
+            if difference > 0:
+                self.tokens.refund(difference)
+            else:
+                self.tokens.consume(-difference)
+
+    def pause(self, seconds: float):
+        """Bloquea todas las llamadas durante `seconds` (ej: retry-after de un 429)"""
+        with self._lock:
+            self.rate_limited += 1
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            # El servidor dice que no hay cupo: vaciar el bucket de requests
+            self.requests.tokens = min(self.requests.tokens, 0.0)
+
+    def get_stats(self) -> dict:
+        return {
+            'requests_per_minute': self.requests.capacity,
+            'tokens_per_minute': self.tokens.capacity,
+            'rate_limited': self.rate_limited,
+            'throttled_seconds': round(self.throttled_seconds, 2)
+        }
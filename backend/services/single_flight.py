@@ -0,0 +1,112 @@
+"""
+Single-flight: une requests idénticas que están en vuelo al mismo tiempo
+
+Si varias sesiones hacen la misma pregunta a la vez, solo la primera (líder)
+llama al LLM; las demás esperan su resultado (o su error). Así una ráfaga de
+duplicados cuesta exactamente una llamada. El caché de respuestas cubre las
+repeticiones posteriores; esto cubre la ventana mientras la primera está en vuelo.
+
+- SingleFlight: para hilos (futures de concurrent.futures)
+- AsyncSingleFlight: para asyncio (una tarea compartida por clave y event loop)
+"""
+import asyncio
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Hashable, Tuple
+
+
+class SingleFlight:
+    """Coalescencia de llamadas bloqueantes con la misma clave"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def acquire(self, key: Hashable) -> Tuple[Future, bool]:
+        """
+        (future de la clave, True si el llamador es el líder)
+
+        El líder debe llamar a release() al terminar, con éxito o error.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._in_flight[key] = future
+            self.leaders += 1
+            return future, True
+
+    def release(self, key: Hashable, future: Future, result: Any = None, error: BaseException = None):
+        """Entrega el resultado (o el error) a quienes esperan la clave"""
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """Ejecuta func() una sola vez por clave en vuelo y comparte el resultado"""
+        future, leader = self.acquire(key)
+        if not leader:
+            return future.result()
+
+        try:
+            result = func()
+        except BaseException as e:
+            self.release(key, future, error=e)
+            raise
+        self.release(key, future, result)
+        return result
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._in_flight)
+            }
+
+
+class AsyncSingleFlight:
+    """
+    Coalescencia de corutinas con la misma clave
+
+    La llamada corre en una tarea propia: si se cancela el llamador líder,
+    los demás siguen esperando el mismo resultado.
+    """
+
+    def __init__(self):
+        # Las tareas pertenecen a un event loop: un diccionario por loop
+        self._in_flight = weakref.WeakKeyDictionary()
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Ejecuta await func() una sola vez por clave en vuelo y comparte el resultado"""
+        loop = asyncio.get_running_loop()
+        tasks = self._in_flight.setdefault(loop, {})
+
+        task = tasks.get(key)
+        if task is None:
+            task = loop.create_task(func())
+            tasks[key] = task
+            task.add_done_callback(lambda done: tasks.pop(key, None) if tasks.get(key) is done else None)
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> dict:
+        return {
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'in_flight': sum(len(tasks) for tasks in list(self._in_flight.values()))
+        }
@@ -0,0 +1,92 @@
+"""
+Normalización y tokenización de texto en español
+- Minúsculas + plegado de acentos (á→a, ü→u; la ñ se conserva)
+- Elimina puntuación y símbolos
+- Tokens alfanuméricos con un único regex compilado
+
+Es el tokenizador compartido por embeddings, BM25, búsqueda en el grafo
+y el agente, para que todos vean exactamente los mismos términos.
+"""
+import re
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, FrozenSet, List
+
+
+def _build_accent_table() -> Dict[int, str]:
+    """Tabla de traducción para Latin-1 y Latin Extended-A (excepto ñ/Ñ)"""
+    table = {}
+    for code in range(0x00C0, 0x0180):
+        char = chr(code)
+        if char in "ñÑ":
+            continue
+        base = ''.join(c for c in unicodedata.normalize('NFD', char)
+                       if not unicodedata.combining(c))
+        if base != char and base.isalpha():
+            table[code] = base
+    return table
+
+
+_ACCENT_TABLE = _build_accent_table()
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+
+# Textos cortos (queries, labels) se tokenizan muchas veces: se cachean
+_CACHE_MAX_LEN = 512
+
+
+def fold_accents(text: str) -> str:
+    """Quita tildes y diéresis conservando la ñ"""
+    return text.translate(_ACCENT_TABLE)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokeniza texto: minúsculas, sin acentos, sin puntuación
+
+    Ej: "¿Cuántas horas-extra?" → ["cuantas", "horas", "extra"]
+    """
+    if not text:
+        return []
+    if len(text) <= _CACHE_MAX_LEN:
+        return list(_tokenize_cached(text))
+    return TOKEN_PATTERN.findall(fold_accents(text.lower()))
+
+
+@lru_cache(maxsize=8192)
+def _tokenize_cached(text: str) -> tuple:
+    return tuple(TOKEN_PATTERN.findall(fold_accents(text.lower())))
+
+
+def normalize_text(text: str) -> str:
+    """
+    Forma normalizada del texto para comparaciones por substring
+    (tokens separados por un espacio)
+    """
+    return ' '.join(tokenize(text))
+
+
+def token_set(text: str) -> FrozenSet[str]:
+    """Conjunto de términos del texto (ej: términos de una query)"""
+    return frozenset(tokenize(text))
+
+
+def term_counts(text: str) -> Dict[str, int]:
+    """Frecuencia de cada término del texto"""
+    return dict(Counter(tokenize(text)))
+
+
+# Palabras y signos sueltos, como los separa un tokenizador BPE antes de partir palabras
+_LLM_PIECE_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+
+def approx_token_count(text: str) -> int:
+    """
+    Estimación local de tokens del LLM (tokenizadores BPE tipo LLaMA)
+
+    Cada signo de puntuación es un token y cada palabra ~1 token por cada
+    4 caracteres: "trabajador," → 3 + 1. No requiere el tokenizador real.
+    """
+    if not text:
+        return 0
+    return sum((len(piece) + 3) // 4 for piece in _LLM_PIECE_PATTERN.findall(text))
@@ -9,7 +9,9 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from database.database import SessionLocal
 from database.models import Document
-from services.groq_service import embed_text, chat_with_doc
+from services.embeddings import embed_text
+from services.groq_service import chat_with_doc
+from services.llm_errors import LLMError
 from services.rag_service import RAGService
 import numpy as np
 import json
@@ -54,12 +56,12 @@ for i, result in enumerate(results, 1):
 # TEST 5: Groq chat
 print("\nTEST 5: Groq LLM")
 context = "Artículo 65: El trabajador tendrá derecho a un día de descanso cada siete días, preferentemente domingo."
-response = chat_with_doc("¿Por cuántos días tengo derecho a descanso?", context)
-if response and "Error" not in response:
+try:
+    response = chat_with_doc("¿Por cuántos días tengo derecho a descanso?", context)
     print(f"  ✅ Query: '¿Por cuántos días...'")
     print(f"  Response: {response[:80]}...")
-else:
-    print(f"  ❌ Error: {response}")
+except LLMError as e:
+    print(f"  ❌ Error: {e}")
 
 # TEST 6: Pipeline completo
 print("\nTEST 6: Pipeline completo (query → retrieval → response)")
@@ -75,8 +77,11 @@ if retrieval_results:
     
     # Respuesta
     context_for_response = f"[{best_article}] {best_text}"
-    final_response = chat_with_doc(full_query, context_for_response)
-    print(f"  ✅ Response: {final_response[:100]}...")
+    try:
+        final_response = chat_with_doc(full_query, context_for_response)
+        print(f"  ✅ Response: {final_response[:100]}...")
+    except LLMError as e:
+        print(f"  ❌ Error: {e}")
 else:
     print(f"  ❌ No se encontraron documentos")
 
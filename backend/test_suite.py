@@ -6,7 +6,9 @@ Cubre: embeddings, chat, edge cases y rendimiento
 import sys
 import time
 import numpy as np
-from services.groq_service import embed_text, chat_with_doc
+from services.embeddings import embed_text
+from services.groq_service import chat_with_doc
+from services.llm_errors import LLMError
 
 def print_header(title):
     """Imprime encabezado de sección"""
@@ -109,7 +111,11 @@ def test_chat_basic():
         print(f"   Context: '{test['context'][:60]}...'")
         
         start = time.time()
-        response = chat_with_doc(test['query'], test['context'])
+        try:
+            response = chat_with_doc(test['query'], test['context'])
+        except LLMError as e:
+            print(f"   ✗ ERROR - {type(e).__name__}: {str(e)[:80]}")
+            continue
         elapsed = time.time() - start
         
         if response:
@@ -155,10 +161,12 @@ def test_chat_edge_cases():
             response = chat_with_doc(test['query'], test['context'])
             elapsed = time.time() - start
             
-            if response and "Error" not in response:
+            if response:
                 print(f"  - ✓ Válido ({elapsed:.2f}s)")
             else:
-                print(f"  - ⚠ Respuesta con error o vacía")
+                print(f"  - ⚠ Respuesta vacía")
+        except LLMError as e:
+            print(f"  - ⚠ Error del LLM ({type(e).__name__}): {str(e)[:60]}")
         except Exception as e:
             print(f"  - ✗ Excepción: {str(e)[:60]}")
 
@@ -185,7 +193,11 @@ def test_performance():
     context = "Artículo 65: Derecho a descanso"
     
     start = time.time()
-    response = chat_with_doc(query, context)
+    try:
+        response = chat_with_doc(query, context)
+    except LLMError as e:
+        print(f"  - ✗ Error del LLM ({type(e).__name__}): {str(e)[:60]}")
+        return
     elapsed = time.time() - start
     
     print(f"  - Chat en {elapsed:.3f}s")
@@ -228,11 +240,362 @@ def test_integration():
     print(f"4. Documento más relevante (sim: {similarities[0][1]:.4f}): '{best_doc[:50]}...'")
     
     # 5. Chat con contexto
-    response = chat_with_doc(user_query, best_doc)
-    print(f"5. Respuesta LLM: '{response[:80]}...'")
+    try:
+        response = chat_with_doc(user_query, best_doc)
+        print(f"5. Respuesta LLM: '{response[:80]}...'")
+    except LLMError as e:
+        print(f"5. ✗ Error del LLM ({type(e).__name__}): {str(e)[:60]}")
     
     print("\n✓ Pipeline de RAG funcionando correctamente")
 
+def test_single_flight():
+    """Test 8: Single-flight (requests idénticas en vuelo)"""
+    print_header("TEST 8: Single-Flight")
+    import asyncio
+    import threading
+    from services.single_flight import AsyncSingleFlight, SingleFlight
+
+    # Hilos: 8 llamadas con la misma clave mientras la primera está en vuelo
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_call():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "respuesta"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("q", slow_call)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("q", slow_call))) for _ in range(7)]
+    for thread in followers:
+        thread.start()
+    while flight.get_stats()['coalesced'] < 7:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    print(f"\n  - Llamadas reales: {len(calls)} / {len(results)} resultados")
+    assert len(calls) == 1
+    assert results == ["respuesta"] * 8
+    assert flight.get_stats() == {'leaders': 1, 'coalesced': 7, 'in_flight': 0}
+
+    # El error del líder llega a todos y la clave queda libre para reintentar
+    def failing_call():
+        raise ValueError("falló")
+
+    try:
+        flight.do("q", failing_call)
+        assert False, "debió propagar el error"
+    except ValueError:
+        pass
+    assert flight.do("q", lambda: "otra vez") == "otra vez"
+    print("  ✓ Errores propagados, clave liberada")
+
+    # asyncio: misma idea con corutinas
+    async_flight = AsyncSingleFlight()
+    async_calls = []
+
+    async def async_call():
+        async_calls.append(1)
+        await asyncio.sleep(0.01)
+        return "async"
+
+    async def burst():
+        return await asyncio.gather(*(async_flight.do("q", async_call) for _ in range(5)))
+
+    assert asyncio.run(burst()) == ["async"] * 5
+    assert len(async_calls) == 1
+    print("  ✓ 5 corutinas → 1 llamada")
+
+def test_answer_cache():
+    """Test 9: Caché semántico de respuestas"""
+    print_header("TEST 9: Caché Semántico de Respuestas")
+    import tempfile
+    from pathlib import Path
+    from services.answer_cache import AnswerCache
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = AnswerCache(Path(tmp) / "answers.db", threshold=0.95, max_entries=2)
+        question = "¿Cuántas horas extra puedo hacer?"
+        context = "[Art. 31] Las horas extraordinarias no podrán exceder de dos por día."
+        vector = embed_text(question)
+        cache.store(question, vector, context, "Hasta dos por día.", "v1")
+
+        # Misma pregunta (salvo signos) y mismo contexto → hit
+        hit = cache.lookup(embed_text("cuántas horas extra puedo hacer"), context, "v1")
+        print(f"\n  - Mismo contexto: {'hit' if hit else 'miss'}")
+        assert hit and hit['answer'] == "Hasta dos por día."
+
+        # Otro chunk del mismo artículo → otro contexto, sin hit
+        assert cache.lookup(vector, context + " Solo en faenas que no perjudiquen la salud.", "v1") is None
+
+        # Negación: bolsa de palabras casi igual, pero bajo el umbral
+        negated = embed_text("¿Cuántas vacaciones no tengo?")
+        cache.store("¿Cuántas vacaciones tengo?", embed_text("¿Cuántas vacaciones tengo?"), context, "15 días.", "v1")
+        assert cache.lookup(negated, context, "v1") is None
+        print("  ✓ Otro contexto y pregunta negada → miss")
+
+        # Evicción LRU y cambio de huella
+        cache.store("¿Y el domingo?", embed_text("¿Y el domingo?"), context, "Descanso.", "v1")
+        assert cache.get_stats()['entries'] == 2
+        assert cache.lookup(vector, context, "v2") is None
+        stats = cache.get_stats()
+        assert stats['entries'] == 0 and stats['invalidations'] == 1
+        print(f"  ✓ Evicción y huella: {stats}")
+        cache._conn.close()
+
+def test_aho_corasick():
+    """Test 10: Aho-Corasick vs búsqueda ingenua"""
+    print_header("TEST 10: Aho-Corasick")
+    import random
+    from services import aho_corasick
+    from services.aho_corasick import AhoCorasick
+
+    def naive(patterns, text):
+        return {i for i, pattern in enumerate(patterns) if pattern in text}
+
+    # Patrones solapados (uno sufijo/prefijo de otro), duplicados y vacíos
+    classic = ["he", "she", "his", "hers", "h", "", "ushers", "she", "rs"]
+    texts = ["ushers", "", "hishers", "xyz", "shhe"]
+
+    random.seed(7)
+    alphabet = "abc ñá"
+    many = [''.join(random.choice(alphabet) for _ in range(random.randint(0, 6))) for _ in range(400)]
+    long_texts = [''.join(random.choice(alphabet) for _ in range(random.randint(0, 300))) for _ in range(50)]
+
+    checked = 0
+    original = aho_corasick.DIRECT_SEARCH_MAX_PATTERNS
+    try:
+        # 0 fuerza el autómata aunque haya pocos patrones; el default usa búsqueda directa
+        for limit in (0, original):
+            aho_corasick.DIRECT_SEARCH_MAX_PATTERNS = limit
+            for patterns, cases in ((classic, texts), (many, long_texts), (many[:100], long_texts)):
+                automaton = AhoCorasick(patterns)
+                for text in cases:
+                    assert automaton.find_all(text) == naive(patterns, text), (limit, len(patterns), text)
+                    checked += 1
+    finally:
+        aho_corasick.DIRECT_SEARCH_MAX_PATTERNS = original
+
+    assert len(many) > original and "" in many
+    assert AhoCorasick(classic).find_patterns("ushers") == ["he", "she", "hers", "h", "", "ushers", "she", "rs"]
+    print(f"\n  ✓ {checked} textos: mismo resultado que `pattern in text` "
+          f"(autómata y búsqueda directa, {len(many)} patrones con vacíos)")
+
+def test_graph_snapshot():
+    """Test 11: Snapshot .npz del grafo"""
+    print_header("TEST 11: Snapshot del Grafo")
+    import json
+    import tempfile
+    from pathlib import Path
+    from services.graph_service import GraphService
+    from services.graph_snapshot import GraphSnapshot, convert_json_to_snapshot
+
+    document = {
+        'metadata': {'source': 'ley.pdf'},
+        'nodes': [
+            {'id': 'n0', 'label': 'Trabajador', 'type': 'actor'},
+            {'id': 'n1', 'label': 'Descanso', 'type': 'derecho', 'chunk_index': 3},
+            {'id': 'n2', 'label': 'Empleador', 'type': 'actor'},
+        ],
+        'edges': [
+            {'source': 'n0', 'target': 'n1', 'relation': 'tiene', 'weight': 0.9},
+            {'source': 'n2', 'target': 'n1', 'relation': 'otorga', 'weight': 0.4},
+            {'source': 'n1', 'target': 'n1', 'relation': 'related_to'},
+        ]
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = Path(tmp) / "mi_grafo.json"
+        json_path.write_text(json.dumps(document), encoding='utf-8')
+        snapshot_path = convert_json_to_snapshot(json_path)
+
+        meta = GraphSnapshot.read_meta(str(snapshot_path))
+        print(f"\n  - Metadatos: source={meta['source']!r}, {meta['nodes']} nodos, {meta['edges']} edges")
+        assert meta['source'] == "mi_grafo.json"
+
+        from_json, from_snapshot = GraphService(), GraphService()
+        assert from_json.load_graph(str(json_path)) and from_snapshot.load_graph(str(snapshot_path))
+        assert list(from_snapshot.edges) == list(from_json.edges)
+        assert from_snapshot.content_hash == from_json.content_hash
+        for node_id in from_json.nodes:
+            assert set(from_snapshot.adjacency[node_id]) == set(from_json.adjacency.get(node_id, ()))
+            assert list(from_snapshot.incident_edges[node_id]) == list(from_json.incident_edges.get(node_id, ()))
+        print("  ✓ Snapshot equivalente al JSON")
+
+def test_rate_limit_retry_wait():
+    """Test 12: Los 429 esperan retry-after entre intentos"""
+    print_header("TEST 12: Espera de 429 (retry-after)")
+    from services import groq_service
+    from services.llm_backends import Completion, LLMBackend
+    from services.llm_errors import LLMRateLimitError
+    from services.llm_resilience import CircuitBreaker, RetryPolicy
+    from services.rate_limiter import RateLimiter
+
+    class ThrottledBackend(LLMBackend):
+        """Responde 429 (retry_after) las primeras veces; sin cuota compartida"""
+        name = "throttled"
+        rate_limited = False
+
+        def __init__(self, failures: int, retry_after: float):
+            self.failures = failures
+            self.retry_after = retry_after
+            self.attempts = []
+
+        def complete(self, model, messages, temperature, max_tokens):
+            self.attempts.append(time.monotonic())
+            if len(self.attempts) <= self.failures:
+                raise LLMRateLimitError("429", retry_after=self.retry_after)
+            return Completion("ok")
+
+        async def acomplete(self, model, messages, temperature, max_tokens):
+            return self.complete(model, messages, temperature, max_tokens)
+
+        def open_stream(self, model, messages, temperature, max_tokens):
+            return iter([self.complete(model, messages, temperature, max_tokens).text])
+
+    def gaps(attempts):
+        return [round(b - a, 2) for a, b in zip(attempts, attempts[1:])]
+
+    # Backend sin cuota compartida (openai/stub): espera la llamada, no el limitador de Groq
+    backend = ThrottledBackend(failures=2, retry_after=0.2)
+    previous = groq_service.get_backend()
+    paused_before = groq_service.rate_limiter.rate_limited
+    groq_service.set_backend(backend)
+    try:
+        assert groq_service.chat_simple("¿hay cupo?", use_cache=False) == "ok"
+    finally:
+        groq_service.set_backend(previous)
+    print(f"\n  - Sin cuota compartida: {len(backend.attempts)} intentos, separación {gaps(backend.attempts)}s")
+    assert len(backend.attempts) == 3
+    assert all(gap >= 0.19 for gap in gaps(backend.attempts))
+    assert groq_service.rate_limiter.rate_limited == paused_before
+
+    # Backend con cuota (Groq): se pausa el limitador y el reintento espera en él
+    limiter = RateLimiter(600, 100000)
+    policy = RetryPolicy(CircuitBreaker(), rate_limiter=limiter)
+    backend = ThrottledBackend(failures=1, retry_after=0.2)
+
+    def request():
+        limiter.acquire_blocking(10)
+        return backend.complete(None, [], 0.0, 10)
+
+    assert policy.call(request, rate_limited=True).text == "ok"
+    print(f"  - Con cuota compartida: separación {gaps(backend.attempts)}s, pausas del limitador: {limiter.rate_limited}")
+    assert gaps(backend.attempts)[0] >= 0.19 and limiter.rate_limited == 1
+    print("  ✓ Ningún reintento sale antes de retry-after")
+
+def write_small_graph(path, labels, description=""):
+    """Grafo JSON mínimo: el primer nodo conectado con todos los demás"""
+    import json
+    nodes = [{'id': f'n{i}', 'label': label, 'type': 'concepto', 'description': description}
+             for i, label in enumerate(labels)]
+    edges = [{'source': 'n0', 'target': f'n{i}', 'relation': 'regula', 'weight': 0.8}
+             for i in range(1, len(labels))]
+    path.write_text(json.dumps({'nodes': nodes, 'edges': edges}, ensure_ascii=False), encoding='utf-8')
+
+
+def test_graph_registry():
+    """Test 13: Varios grafos a la vez (GraphRegistry)"""
+    print_header("TEST 13: Registro de Grafos")
+    import tempfile
+    from pathlib import Path
+    from services.graph_registry import GraphRegistry
+    from services.graph_service import GraphService
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_small_graph(Path(tmp) / "leyes.json", ["Jornada", "Horas extraordinarias", "Descanso"])
+        write_small_graph(Path(tmp) / "actores.json", ["Empleador", "Trabajador"])
+
+        view = GraphService()
+        registry = GraphRegistry(view)
+        assert registry.load(Path(tmp) / "leyes.json")['success']
+        assert registry.load(Path(tmp) / "actores.json")['success']
+
+        # Ids con namespace del nombre del archivo; adyacencia y edges dentro de cada grafo
+        assert sorted(view.nodes) == ['actores:n0', 'actores:n1', 'leyes:n0', 'leyes:n1', 'leyes:n2']
+        assert view.adjacency['leyes:n0'] == {'leyes:n1', 'leyes:n2'}
+        assert {edge['source'] for edge in view.edges} == {'leyes:n0', 'actores:n0'}
+        assert view.entity_ids_in_text("El empleador fija la jornada") == ['leyes:n0', 'actores:n0']
+        print(f"\n  - Vista combinada: {len(view.nodes)} nodos, {len(view.edges)} edges")
+
+        # Deshabilitar recompone la vista sin releer; habilitar vuelve al mismo estado
+        combined_hash = view.content_hash
+        assert registry.disable("actores")['success']
+        assert sorted(view.nodes) == ['leyes:n0', 'leyes:n1', 'leyes:n2']
+        assert view.entity_ids_in_text("El empleador fija la jornada") == ['leyes:n0']
+        assert [g['enabled'] for g in registry.list_graphs()] == [True, False]
+        assert registry.enable("actores")['success']
+        assert view.content_hash == combined_hash and len(view.nodes) == 5
+        print("  ✓ Deshabilitar/habilitar recompone la vista")
+
+        assert registry.unload("leyes")['success'] and sorted(view.nodes) == ['actores:n0', 'actores:n1']
+        assert not registry.set_enabled("leyes", True)['success']
+        registry.clear()
+        assert not view.is_loaded and len(registry) == 0
+        print("  ✓ Descargar y limpiar")
+
+
+def test_graph_reload():
+    """Test 14: Recarga en caliente con una consulta en curso (pinned)"""
+    print_header("TEST 14: Recarga de Grafos")
+    import os
+    import tempfile
+    from pathlib import Path
+    from services.graph_registry import GraphRegistry
+    from services.graph_service import GraphService
+
+    with tempfile.TemporaryDirectory() as tmp:
+        leyes = Path(tmp) / "leyes.json"
+        write_small_graph(leyes, ["Jornada", "Descanso"])
+        write_small_graph(Path(tmp) / "actores.json", ["Empleador", "Trabajador"])
+
+        view = GraphService()
+        registry = GraphRegistry(view)
+        # Sin base de datos: las anotaciones de chunks no son parte de esta prueba
+        registry._annotate_graph = lambda graph: 0
+        registry._annotate_documents = lambda: 0
+        registry.load(leyes)
+        registry.load(Path(tmp) / "actores.json")
+
+        # Habilitar/deshabilitar deja los índices armados: la primera consulta no los construye
+        assert registry.disable("actores")['success']
+        assert view._node_search_index is not None
+        assert registry.enable("actores")['success']
+        assert view._node_search_index is not None and len(view.nodes) == 4
+        print("\n  ✓ Índices armados al recomponer la vista")
+
+        # Una consulta en curso fija su versión antes de la recarga
+        pinned = view.pinned()
+        old_hash = pinned.content_hash
+        write_small_graph(leyes, ["Jornada", "Descanso", "Feriado"])
+        stat = leyes.stat()
+        os.utime(leyes, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        assert registry.check_for_changes() == ["leyes"]
+
+        assert 'leyes:n2' in view.nodes and view.content_hash != old_hash
+        assert 'leyes:n2' not in pinned.nodes and pinned.content_hash == old_hash
+        assert pinned.entity_ids_in_text("feriado en la jornada") == ['leyes:n0']
+        assert view.entity_ids_in_text("feriado en la jornada") == ['leyes:n0', 'leyes:n2']
+        print("  ✓ La vista nueva ve el cambio; la consulta fijada sigue con la anterior")
+
+        events = registry.pop_events()
+        assert [(e['name'], e['reload'], e['success']) for e in events] == [("leyes", True, True)]
+
+        # Recarga de un grafo descargado mientras tanto: se informa como evento, sin tocar la vista
+        registry.unload("leyes")
+        result = registry._background_load(str(leyes), "leyes", True, reload=True)
+        assert not result['success'] and result['reload']
+        assert registry.pop_events() == [result] and sorted(view.nodes) == ['actores:n0', 'actores:n1']
+        print("  ✓ Eventos de recarga (también si el grafo ya no está cargado)")
+
+
 def main():
     """Ejecutar todas las pruebas"""
     print("\n" + "█"*70)
@@ -254,6 +617,15 @@ def main():
         test_performance()
         test_integration()
         
+        # Test 8+: Componentes sin red
+        test_single_flight()
+        test_answer_cache()
+        test_aho_corasick()
+        test_graph_snapshot()
+        test_rate_limit_retry_wait()
+        test_graph_registry()
+        test_graph_reload()
+        
         # Resumen
         print_header("RESUMEN FINAL")
         print("\n✅ TODAS LAS PRUEBAS COMPLETADAS EXITOSAMENTE")